@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""Benchmark asyncio event loop latency while coroutines log heavily.
+
+A ticker coroutine asks to wake up every --tick ms and records how late it actually woke up,
+while --producers coroutines log records as fast as they can, yielding to the loop between
+records. Output goes to a stream whose writes take --write-delay ms, like a slow terminal or a
+full pipe. Reports the ticker's lateness (p50/p99/max, ms) and records handled per second for
+each handler, as JSON.
+
+    python benchmarks/bench_aio.py [--duration 2] [--write-delay 0.2] [--output results.json]
+
+With a StreamHandler every write stalls the loop, so lateness grows with the write delay.
+AsyncColorHandler only queues a snapshot on the loop, so lateness should stay about flat.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import logging
+import platform
+import sys
+import time
+
+import color_debug
+from color_debug.aio import AsyncColorHandler
+from color_debug.color_debug import ColorFormatter
+
+try:
+    perf_counter = time.perf_counter
+except AttributeError:
+    perf_counter = time.time
+
+
+class SlowStream(io.StringIO):
+    '''a stream that takes delay seconds per write, and only keeps a count of what was written'''
+
+    def __init__(self, delay):
+        io.StringIO.__init__(self)
+        self.delay = delay
+        self.chars = 0
+
+    def write(self, text):
+        time.sleep(self.delay)
+        self.chars += len(text)
+        return len(text)
+
+
+def stream_handler(stream):
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(ColorFormatter())
+    return handler
+
+
+def async_color_handler(stream):
+    return AsyncColorHandler(stream=stream, formatter=ColorFormatter(), use_color=True)
+
+
+SCENARIOS = [
+    # name, handler factory
+    ('stream_handler', stream_handler),
+    ('async_color_handler', async_color_handler),
+]
+
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * percent / 100.0))]
+
+
+async def _ticker(tick, until, lateness):
+    loop = asyncio.get_event_loop()
+    while loop.time() < until:
+        expected = loop.time() + tick
+        await asyncio.sleep(tick)
+        lateness.append(max(0.0, loop.time() - expected))
+
+
+async def _producer(logger, until, counts):
+    loop = asyncio.get_event_loop()
+    idx = 0
+    while loop.time() < until:
+        logger.info('request %s took %0.3f ms', 'req-%d' % idx, idx / 7.0)
+        idx += 1
+        # let the loop run other tasks between records, like a real service would
+        await asyncio.sleep(0)
+    counts.append(idx)
+
+
+async def _run(handler, producers, duration, tick):
+    logger = logging.getLogger('color_debug.bench_aio')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    logger.addHandler(handler)
+
+    lateness = []
+    counts = []
+    until = asyncio.get_event_loop().time() + duration
+    start = perf_counter()
+    try:
+        await asyncio.gather(_ticker(tick, until, lateness),
+                             *[_producer(logger, until, counts) for _ in range(producers)])
+    finally:
+        logger.removeHandler(handler)
+    logged_secs = perf_counter() - start
+
+    if isinstance(handler, AsyncColorHandler):
+        await handler.aclose()
+    else:
+        handler.close()
+    return lateness, sum(counts), logged_secs, perf_counter() - start
+
+
+def run_scenario(name, handler_factory, options):
+    stream = SlowStream(options.write_delay / 1000.0)
+    handler = handler_factory(stream)
+    lateness, logged, logged_secs, total_secs = asyncio.run(_run(handler, options.producers, options.duration,
+                                                                 options.tick / 1000.0))
+    lateness = sorted(late * 1000.0 for late in lateness)
+    result = {'scenario': name, 'handler': handler.__class__.__name__,
+              'ticks': len(lateness),
+              'lateness_ms': {'p50': _percentile(lateness, 50), 'p99': _percentile(lateness, 99),
+                              'max': lateness[-1] if lateness else 0.0},
+              'records_logged': logged,
+              'records_logged_per_sec': logged / logged_secs,
+              'output_chars': stream.chars,
+              # including writing out the backlog, for AsyncColorHandler
+              'total_secs': total_secs}
+    if isinstance(handler, AsyncColorHandler):
+        result['records_written'] = handler.listener.handled
+        result['records_dropped'] = handler.dropped
+    return result
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=2.0, help='seconds to log for (default: %(default)s)')
+    parser.add_argument('--producers', type=int, default=4,
+                        help='number of logging coroutines (default: %(default)s)')
+    parser.add_argument('--tick', type=float, default=1.0, help='ticker interval in ms (default: %(default)s)')
+    parser.add_argument('--write-delay', type=float, default=0.2,
+                        help='ms each write to the stream takes (default: %(default)s)')
+    parser.add_argument('--scenario', action='append', help='only run the named scenario(s)')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    options = parser.parse_args(args)
+
+    scenarios = [s for s in SCENARIOS if not options.scenario or s[0] in options.scenario]
+    results = {'color_debug_version': color_debug.__version__,
+               'python': platform.python_version(),
+               'implementation': platform.python_implementation(),
+               'platform': platform.platform(),
+               'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+               'options': {'duration': options.duration, 'producers': options.producers, 'tick_ms': options.tick,
+                           'write_delay_ms': options.write_delay},
+               'results': [run_scenario(name, factory, options) for name, factory in scenarios]}
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
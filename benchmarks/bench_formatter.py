@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+"""Benchmark the ColorFormatter hot path against plain logging.Formatter.
+
+For each scenario reports records/sec, per record latency percentiles and the memory
+retained per record (formatted strings plus anything left on the records), as JSON.
+
+    python benchmarks/bench_formatter.py [--records N] [--output results.json]
+    python benchmarks/bench_formatter.py --compare old_results.json [--max-slowdown 10]
+
+With --compare, scenarios that got slower (records/sec) by more than --max-slowdown
+percent are listed and the exit code is 1.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+
+import color_debug
+from color_debug.color_debug import ColorFormatter, DEFAULT_FORMAT
+
+try:
+    perf_counter = time.perf_counter
+except AttributeError:
+    perf_counter = time.time
+
+SMALL_FORMAT = '%(levelname)s %(name)s %(message)s'
+
+LOGGER_NAMES = ['color_debug', 'color_debug.bench', 'color_debug.bench.model',
+                'color_debug.bench.util', 'other.package', 'other.package.sub']
+LEVELS = [logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR]
+THREAD_COUNT = 4
+
+
+def _exc_info():
+    try:
+        raise ValueError('benchmark exception')
+    except ValueError:
+        return sys.exc_info()
+
+
+def make_records(count, exc_info=False):
+    '''A list of varied records, like a mix of loggers, levels and threads would produce'''
+    records = []
+    ei = _exc_info() if exc_info else None
+    for i in range(count):
+        name = LOGGER_NAMES[i % len(LOGGER_NAMES)]
+        logger = logging.getLogger(name)
+        record = logger.makeRecord(name, LEVELS[i % len(LEVELS)], __file__, 100 + i % 7,
+                                   'request %s took %0.3f ms', ('req-%d' % i, i / 7.0), ei,
+                                   func='handler_%d' % (i % 3))
+        record.threadName = 'T%d' % (i % 3)
+        record.thread = 1000 + i % 3
+        records.append(record)
+    return records
+
+
+SCENARIOS = [
+    # name, formatter factory, record options
+    ('stdlib_default', lambda: logging.Formatter(DEFAULT_FORMAT), {}),
+    ('color_default', lambda: ColorFormatter(), {}),
+    ('stdlib_small', lambda: logging.Formatter(SMALL_FORMAT), {}),
+    ('color_small', lambda: ColorFormatter(fmt=SMALL_FORMAT), {}),
+    ('color_groups_name', lambda: ColorFormatter(default_color_by_attr='name',
+                                                 color_groups=[('name', ['funcName', 'filename', 'lineno'])]), {}),
+    ('color_groups_thread', lambda: ColorFormatter(color_groups=[('threadName', ['thread', 'message', 'exc_text']),
+                                                                 ('process', ['processName'])]), {}),
+    ('color_groups_level', lambda: ColorFormatter(color_groups=[('levelname', ['levelno', 'message'])]), {}),
+    ('color_auto_color', lambda: ColorFormatter(auto_color=True), {}),
+    ('color_no_mutate', lambda: ColorFormatter(mutate_record=False), {}),
+    ('stdlib_exc', lambda: logging.Formatter(DEFAULT_FORMAT), {'exc_info': True}),
+    ('color_exc', lambda: ColorFormatter(), {'exc_info': True}),
+    ('stdlib_threads', lambda: logging.Formatter(DEFAULT_FORMAT), {'threads': THREAD_COUNT}),
+    ('color_threads', lambda: ColorFormatter(), {'threads': THREAD_COUNT}),
+]
+
+
+def _format_all(formatter, records, reset_exc_text):
+    fmt = formatter.format
+    if reset_exc_text:
+        for record in records:
+            # logging.Formatter caches the rendered traceback on the record
+            record.exc_text = None
+            fmt(record)
+    else:
+        for record in records:
+            fmt(record)
+
+
+def measure_throughput(formatter, records, threads, reset_exc_text):
+    if threads <= 1:
+        start = perf_counter()
+        _format_all(formatter, records, reset_exc_text)
+        return len(records) / (perf_counter() - start)
+
+    # every thread formats its own copy of the records with the shared formatter
+    per_thread = [[logging.makeLogRecord(dict(r.__dict__)) for r in records] for _ in range(threads)]
+    workers = [threading.Thread(target=_format_all, args=(formatter, thread_records, reset_exc_text))
+               for thread_records in per_thread]
+    start = perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(records) * threads / (perf_counter() - start)
+
+
+def measure_latency(formatter, records, reset_exc_text):
+    fmt = formatter.format
+    timings = []
+    for record in records:
+        if reset_exc_text:
+            record.exc_text = None
+        start = perf_counter()
+        fmt(record)
+        timings.append(perf_counter() - start)
+    timings.sort()
+
+    def percentile(pct):
+        return timings[min(len(timings) - 1, int(len(timings) * pct / 100.0))] * 1e6
+
+    return {'p50_us': percentile(50), 'p90_us': percentile(90), 'p99_us': percentile(99),
+            'max_us': timings[-1] * 1e6}
+
+
+def measure_memory(formatter, records, reset_exc_text):
+    results = []
+    gc.collect()
+    tracemalloc.start()
+    before_size, _ = tracemalloc.get_traced_memory()
+    before = tracemalloc.take_snapshot()
+    for record in records:
+        if reset_exc_text:
+            record.exc_text = None
+        results.append(formatter.format(record))
+    after = tracemalloc.take_snapshot()
+    after_size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    blocks = sum(stat.count_diff for stat in stats if stat.count_diff > 0)
+    return {'retained_bytes_per_record': float(after_size - before_size) / len(records),
+            'retained_blocks_per_record': float(blocks) / len(records),
+            'peak_bytes': peak - before_size}
+
+
+def run_scenario(name, formatter_factory, options, count, repeat):
+    threads = options.get('threads', 1)
+    exc_info = options.get('exc_info', False)
+    formatter = formatter_factory()
+
+    # warm up any caches
+    _format_all(formatter, make_records(min(count, 100), exc_info=exc_info), exc_info)
+
+    records = make_records(count, exc_info=exc_info)
+    throughput = max(measure_throughput(formatter, records, threads, exc_info) for _ in range(repeat))
+
+    result = {'scenario': name,
+              'formatter': formatter.__class__.__name__,
+              'threads': threads,
+              'records': count,
+              'records_per_sec': throughput}
+    result.update(measure_latency(formatter, make_records(count, exc_info=exc_info), exc_info))
+    result.update(measure_memory(formatter, make_records(count, exc_info=exc_info), exc_info))
+    return result
+
+
+def compare(results, baseline_results, max_slowdown):
+    baseline = dict((r['scenario'], r) for r in baseline_results['results'])
+    regressions = []
+    for result in results['results']:
+        old = baseline.get(result['scenario'])
+        if not old:
+            continue
+        change = (result['records_per_sec'] - old['records_per_sec']) / old['records_per_sec'] * 100
+        sys.stderr.write('%-22s %12.0f -> %12.0f records/sec (%+.1f%%)\n' % (
+            result['scenario'], old['records_per_sec'], result['records_per_sec'], change))
+        if change < -max_slowdown:
+            regressions.append(result['scenario'])
+    return regressions
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=20000, help='records per scenario (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='throughput runs per scenario, best is kept')
+    parser.add_argument('--scenario', action='append', help='only run the named scenario(s)')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    parser.add_argument('--compare', help='JSON results from a previous run to compare against')
+    parser.add_argument('--max-slowdown', type=float, default=10.0,
+                        help='percent slower that --compare treats as a regression (default: %(default)s)')
+    options = parser.parse_args(args)
+
+    scenarios = [s for s in SCENARIOS if not options.scenario or s[0] in options.scenario]
+    results = {'color_debug_version': color_debug.__version__,
+               'python': platform.python_version(),
+               'implementation': platform.python_implementation(),
+               'platform': platform.platform(),
+               'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+               'results': [run_scenario(name, factory, scenario_options, options.records, options.repeat)
+                           for name, factory, scenario_options in scenarios]}
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if options.compare:
+        with open(options.compare) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), options.max_slowdown)
+        if regressions:
+            sys.stderr.write('regressions: %s\n' % ', '.join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
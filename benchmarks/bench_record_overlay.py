@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Compare ColorFormatter(mutate_record=True) with mutate_record=False.
+
+Formats records that are kept alive afterwards (like a MemoryHandler or test capture
+would) and reports allocations made while formatting and the memory still held by
+the retained records once formatting is done.
+
+    python benchmarks/bench_record_overlay.py [--records N]
+"""
+
+import argparse
+import gc
+import json
+import logging
+import sys
+import tracemalloc
+
+from color_debug import color_debug
+
+
+def make_records(count):
+    logger = logging.getLogger('color_debug.bench.overlay')
+    return [logger.makeRecord(logger.name, logging.DEBUG, __file__, 42,
+                              'record %d of %s', (i, count), None, func='make_records')
+            for i in range(count)]
+
+
+def measure(mutate_record, count):
+    formatter = color_debug.ColorFormatter(mutate_record=mutate_record, auto_color=True)
+    records = make_records(count)
+    # warm up caches outside of the measurement
+    formatter.format(make_records(1)[0])
+
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    for record in records:
+        formatter.format(record)
+    snapshot = tracemalloc.take_snapshot()
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    allocations = sum(stat.count for stat in snapshot.statistics('filename'))
+    return {'mutate_record': mutate_record,
+            'records': count,
+            'retained_bytes': after - before,
+            'retained_bytes_per_record': float(after - before) / count,
+            'peak_bytes': peak - before,
+            'live_allocations_per_record': float(allocations) / count,
+            'record_dict_size': len(records[0].__dict__)}
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=10000)
+    options = parser.parse_args(args)
+
+    results = [measure(mutate_record, options.records) for mutate_record in (True, False)]
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
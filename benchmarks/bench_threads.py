@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"""Benchmark ColorFormatter throughput as the number of formatting threads grows.
+
+Every thread formats its own records with one shared formatter, the way a handler shared by
+a thread pool would. Reports records/sec for each thread count and the scaling relative to
+one thread, as JSON.
+
+    python benchmarks/bench_threads.py [--threads 1,2,4,8] [--records N] [--output results.json]
+
+ColorFormatter takes no locks while formatting, so on a free-threaded CPython build
+(python3.13t and later) throughput should grow with the thread count up to the number of
+cores. With the GIL, it stays about flat; 'gil_enabled' in the output says which one ran.
+"""
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import threading
+import time
+
+import color_debug
+from color_debug.color_debug import ColorFormatter, DEFAULT_FORMAT
+
+try:
+    perf_counter = time.perf_counter
+except AttributeError:
+    perf_counter = time.time
+
+LOGGER_NAMES = ['color_debug', 'color_debug.bench', 'color_debug.bench.model',
+                'color_debug.bench.util', 'other.package', 'other.package.sub']
+LEVELS = [logging.DEBUG, logging.INFO, logging.WARNING, logging.ERROR]
+
+SCENARIOS = [
+    # name, formatter factory
+    ('stdlib_default', lambda: logging.Formatter(DEFAULT_FORMAT)),
+    ('color_default', lambda: ColorFormatter()),
+    ('color_groups_name', lambda: ColorFormatter(default_color_by_attr='name',
+                                                 color_groups=[('name', ['funcName', 'filename', 'lineno'])])),
+    ('color_no_mutate', lambda: ColorFormatter(mutate_record=False)),
+]
+
+
+def make_records(count, thread_idx):
+    records = []
+    for i in range(count):
+        name = LOGGER_NAMES[i % len(LOGGER_NAMES)]
+        record = logging.getLogger(name).makeRecord(name, LEVELS[i % len(LEVELS)], __file__, 100 + i % 7,
+                                                    'request %s took %0.3f ms', ('req-%d' % i, i / 7.0), None,
+                                                    func='handler_%d' % (i % 3))
+        record.threadName = 'Worker-%d' % thread_idx
+        record.thread = 1000 + thread_idx
+        records.append(record)
+    return records
+
+
+def _format_all(formatter, records, barrier):
+    fmt = formatter.format
+    barrier.wait()
+    for record in records:
+        fmt(record)
+
+
+def measure(formatter, count, threads):
+    per_thread = [make_records(count, idx) for idx in range(threads)]
+    # the extra party is this thread, so the clock starts once every worker is ready
+    barrier = threading.Barrier(threads + 1)
+    workers = [threading.Thread(target=_format_all, args=(formatter, records, barrier))
+               for records in per_thread]
+    for worker in workers:
+        worker.start()
+    barrier.wait()
+    start = perf_counter()
+    for worker in workers:
+        worker.join()
+    return count * threads / (perf_counter() - start)
+
+
+def run_scenario(name, formatter_factory, thread_counts, count, repeat):
+    formatter = formatter_factory()
+    # warm up any caches
+    measure(formatter, min(count, 100), 1)
+
+    results = []
+    for threads in thread_counts:
+        throughput = max(measure(formatter, count, threads) for _ in range(repeat))
+        results.append({'threads': threads, 'records_per_sec': throughput})
+
+    base = results[0]['records_per_sec'] / results[0]['threads']
+    for result in results:
+        # 1.0 is perfect linear scaling
+        result['scaling'] = result['records_per_sec'] / (base * result['threads'])
+    return {'scenario': name, 'formatter': formatter.__class__.__name__, 'records_per_thread': count,
+            'results': results}
+
+
+def gil_enabled():
+    is_gil_enabled = getattr(sys, '_is_gil_enabled', None)
+    return True if is_gil_enabled is None else is_gil_enabled()
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', default='1,2,4,8',
+                        help='comma separated thread counts (default: %(default)s)')
+    parser.add_argument('--records', type=int, default=20000,
+                        help='records per thread (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per thread count, best is kept')
+    parser.add_argument('--scenario', action='append', help='only run the named scenario(s)')
+    parser.add_argument('--output', help='write JSON results to this file instead of stdout')
+    options = parser.parse_args(args)
+
+    thread_counts = [int(threads) for threads in options.threads.split(',')]
+    scenarios = [s for s in SCENARIOS if not options.scenario or s[0] in options.scenario]
+    results = {'color_debug_version': color_debug.__version__,
+               'python': platform.python_version(),
+               'implementation': platform.python_implementation(),
+               'platform': platform.platform(),
+               'gil_enabled': gil_enabled(),
+               'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+               'results': [run_scenario(name, factory, thread_counts, options.records, options.repeat)
+                           for name, factory in scenarios]}
+
+    if options.output:
+        with open(options.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    else:
+        json.dump(results, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -8,5 +8,10 @@ __version__ = '0.1.0'
 
 from .color_debug import ColorFormatter
 from .color_debug import add_default_record_attrs
+from .filters import SamplingFilter, SamplingRule
+from .handlers import (BufferedColorStreamHandler, ColorQueueHandler, ColorQueueListener, ColorStreamHandler,
+                       DuplicateCollapsingHandler)
 
-__all__ = ['ColorFormatter', 'add_default_record_attrs']
+__all__ = ['ColorFormatter', 'add_default_record_attrs',
+           'BufferedColorStreamHandler', 'ColorQueueHandler', 'ColorQueueListener', 'ColorStreamHandler',
+           'DuplicateCollapsingHandler', 'SamplingFilter', 'SamplingRule']
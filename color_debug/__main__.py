@@ -0,0 +1,111 @@
+'''Colorize plain text log files, ie:
+
+    python -m color_debug app.log
+    python -m color_debug --follow app.log
+    python -m color_debug --jobs 0 huge.log > huge.colored.log
+    some_command 2>&1 | python -m color_debug --format '%(levelname)s %(name)s %(message)s'
+'''
+
+import argparse
+import errno
+import os
+import sys
+
+from .color_debug import DEFAULT_FORMAT
+from .colorize import DEFAULT_BLOCK_SIZE, DEFAULT_CHUNK_SIZE, LogLineColorizer, colorize_file_parallel, colorize_stream
+from .palettes import PALETTES
+
+
+def _color_group(value):
+    '''parse 'name=funcName,lineno' into ('name', ['funcName', 'lineno'])'''
+    try:
+        group, members = value.split('=', 1)
+    except ValueError:
+        raise argparse.ArgumentTypeError('color groups look like attr=member,member: %r' % value)
+    return (group, [member for member in members.split(',') if member])
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='python -m color_debug',
+                                     description='Colorize plain text log files the way ColorFormatter would.')
+    parser.add_argument('files', nargs='*', metavar='FILE',
+                        help="log files to colorize, stdin if none or '-'")
+    parser.add_argument('-f', '--follow', action='store_true',
+                        help='keep reading as the (last) file grows, like tail -f')
+    parser.add_argument('--format', dest='fmt', default=DEFAULT_FORMAT,
+                        help='the logging format string the lines were written with (default: DEFAULT_FORMAT)')
+    parser.add_argument('--color-by', dest='default_color_by_attr',
+                        help='record attr that picks the default color (default: process)')
+    parser.add_argument('--color-group', dest='color_groups', action='append', type=_color_group, default=[],
+                        metavar='ATTR=MEMBER,...', help='color MEMBER attrs the same as ATTR, can be repeated')
+    parser.add_argument('--auto-color', action='store_true', help='give every attr a color based on its value')
+    parser.add_argument('--hierarchical-names', action='store_true',
+                        help="give related logger names related colors, ie 'foo.model' and 'foo.util'")
+    parser.add_argument('--palette', default='auto', choices=['auto'] + sorted(PALETTES),
+                        help='terminal colors to use (default: %(default)s)')
+    parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE,
+                        help='bytes to read at a time (default: %(default)s)')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help='colorize files in chunks with this many processes, 0 for one per cpu. '
+                        'Not used for stdin or with --follow (default: %(default)s)')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='bytes per chunk with --jobs (default: %(default)s)')
+    return parser
+
+
+def _binary(stream):
+    return getattr(stream, 'buffer', stream)
+
+
+def _discard_stdout():
+    '''point stdout's file descriptor at devnull, so flushing it at exit doesn't hit the closed pipe again'''
+    try:
+        fileno = sys.stdout.fileno()
+    except (AttributeError, IOError, ValueError):
+        # not a real file (ie, replaced in tests), nothing will flush to the pipe
+        return
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, fileno)
+    finally:
+        os.close(devnull)
+
+
+def main(args=None):
+    options = get_parser().parse_args(args)
+    colorizer = LogLineColorizer(fmt=options.fmt,
+                                 default_color_by_attr=options.default_color_by_attr,
+                                 color_groups=options.color_groups,
+                                 auto_color=options.auto_color,
+                                 palette=options.palette,
+                                 hierarchical_names=options.hierarchical_names)
+    outfile = _binary(sys.stdout)
+    files = options.files or ['-']
+
+    try:
+        for idx, filename in enumerate(files):
+            follow = options.follow and idx == len(files) - 1
+            if filename == '-':
+                colorize_stream(_binary(sys.stdin), outfile, colorizer,
+                                block_size=options.block_size, follow=follow)
+                continue
+            if options.jobs != 1 and not follow:
+                colorize_file_parallel(filename, outfile, colorizer, jobs=options.jobs or None,
+                                       chunk_size=options.chunk_size)
+                continue
+            with open(filename, 'rb') as infile:
+                colorize_stream(infile, outfile, colorizer, block_size=options.block_size, follow=follow)
+    except KeyboardInterrupt:
+        return 130
+    except (IOError, OSError) as exc:
+        # BrokenPipeError is py3 only
+        if exc.errno != errno.EPIPE:
+            raise
+        # ie, piped to head
+        _discard_stdout()
+        return 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
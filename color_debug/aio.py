@@ -0,0 +1,99 @@
+'''Colored logging output that never blocks an asyncio event loop.
+
+A logging.StreamHandler with a ColorFormatter formats and writes each record on whatever
+thread logged it. In an asyncio service that is the event loop thread, so a slow terminal or
+a full pipe stalls every coroutine until the write finishes.
+
+AsyncColorHandler only takes a snapshot of the record (see handlers.snapshot_record()) and
+puts it on a bounded queue without waiting. A ColorQueueListener thread does the formatting
+and writing. If output falls behind and the queue fills up, the oldest pending records are
+dropped (counted in dropped_oldest) instead of blocking the loop.
+
+Before the loop shuts down, await aclose() so everything queued gets written:
+
+    from color_debug.aio import AsyncColorHandler
+
+    async def main():
+        handler = AsyncColorHandler(stream=sys.stderr)
+        logging.getLogger().addHandler(handler)
+        try:
+            ...
+        finally:
+            logging.getLogger().removeHandler(handler)
+            await handler.aclose()
+
+    asyncio.run(main())
+
+If aclose() is never awaited, close() (called by logging.shutdown() at exit) still writes
+out everything queued, it just blocks while doing it.
+
+This module is py3.5+ only, so it isn't imported by the color_debug package.
+'''
+
+import asyncio
+import logging
+import queue
+
+from .handlers import DEFAULT_QUEUE_SIZE, OVERFLOW_DROP_OLDEST, ColorQueueHandler, ColorQueueListener
+
+# how often drain() checks if the listener has caught up
+DEFAULT_DRAIN_INTERVAL = 0.01
+
+
+class AsyncColorHandler(ColorQueueHandler):
+    '''Format and write records on a background thread, so logging never blocks the event loop.
+
+    See the module docs. stream, formatter and use_color are passed to the ColorQueueListener
+    (a ColorFormatter by default, set one with setFormatter() like any handler). At most
+    maxsize records are pending at once; overflow is as for ColorQueueHandler, but
+    'drop_oldest' by default since 'block' would block the loop. extra_fields are as for
+    ColorQueueHandler.
+
+    Records can be logged from any thread, not just the loop's.'''
+
+    def __init__(self, stream=None, formatter=None, use_color=None, maxsize=DEFAULT_QUEUE_SIZE,
+                 overflow=OVERFLOW_DROP_OLDEST, level=logging.NOTSET, extra_fields=()):
+        ColorQueueHandler.__init__(self, queue.Queue(maxsize=maxsize), overflow=overflow, level=level,
+                                   extra_fields=extra_fields)
+        self.listener = ColorQueueListener(self.queue, stream=stream, formatter=formatter, use_color=use_color)
+        if formatter is not None:
+            logging.Handler.setFormatter(self, formatter)
+        self.listener.start()
+        self._closed = False
+
+    def setFormatter(self, fmt):
+        logging.Handler.setFormatter(self, fmt)
+        if fmt is not None:
+            self.listener.formatter = fmt
+
+    @property
+    def pending(self):
+        '''number of records queued but not written yet'''
+        return self.queue.unfinished_tasks
+
+    def emit(self, record):
+        if self._closed:
+            return
+        ColorQueueHandler.emit(self, record)
+
+    async def drain(self, interval=DEFAULT_DRAIN_INTERVAL):
+        '''wait, without blocking the loop, until every record queued so far is written and flushed'''
+        while self.queue.unfinished_tasks:
+            await asyncio.sleep(interval)
+
+    async def aclose(self):
+        '''drain() and then close(), for use before the event loop shuts down'''
+        await self.drain()
+        self.close()
+
+    def close(self):
+        '''Write out everything queued and stop the listener thread
+
+        Blocks until the queue is written, see aclose() for a version that doesn't.'''
+        self.acquire()
+        try:
+            self._closed = True
+        finally:
+            self.release()
+        self.listener.stop()
+        ColorQueueHandler.close(self)
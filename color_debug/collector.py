@@ -0,0 +1,259 @@
+'''Collect log records from worker processes and color them in one place.
+
+Worker processes log through a ColorSenderHandler, which sends a compact encoding of each
+record (see encode_record()) over a multiprocessing connection. A ColorCollector in the
+parent process decodes them and passes them to a single handler, by default a ColorStreamHandler
+with a ColorFormatter. So color mapping and terminal writes happen once, in one process,
+and each process/thread still gets its own color.
+
+For ex, over a unix socket:
+
+    # parent
+    collector = ColorCollector('/tmp/app-logs.sock')
+    collector.start()
+
+    # in each worker
+    logging.getLogger().addHandler(ColorSenderHandler('/tmp/app-logs.sock'))
+
+or over a multiprocessing.Pipe():
+
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    collector = ColorCollector()
+    collector.add_connection(parent_conn)
+    # worker: ColorSenderHandler(connection=child_conn)
+'''
+
+import json
+import logging
+import sys
+import threading
+import time
+
+from multiprocessing.connection import Client, Listener
+
+from .handlers import ColorStreamHandler, record_from_dict
+
+# The record attributes sent for every record, in wire order. The message is sent already
+# rendered as 'msg' (args are not sent) and exc_info is sent as the rendered exc_text.
+WIRE_FIELDS = ('name', 'levelno', 'levelname', 'pathname', 'filename', 'module', 'lineno', 'funcName',
+               'created', 'msecs', 'relativeCreated', 'thread', 'threadName', 'processName', 'process',
+               'msg', 'exc_text', 'stack_info')
+
+_exc_formatter = logging.Formatter()
+
+
+def encode_record(record, extra_fields=()):
+    '''Encode record as a JSON list of the WIRE_FIELDS values, plus a dict of any extra_fields
+
+    Much smaller (and cheaper to make) than pickling the whole LogRecord.'''
+    values = [getattr(record, field, None) for field in WIRE_FIELDS]
+    values[WIRE_FIELDS.index('msg')] = record.getMessage()
+    if record.exc_info and not record.exc_text:
+        values[WIRE_FIELDS.index('exc_text')] = _exc_formatter.formatException(record.exc_info)
+
+    if extra_fields:
+        values.append(dict((field, getattr(record, field, None)) for field in extra_fields))
+    return json.dumps(values, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def decode_record(data):
+    '''Return a LogRecord for data from encode_record()
+
+    Raises ValueError if data isn't an encoded record.'''
+    values = json.loads(data.decode('utf-8'))
+    if not isinstance(values, list) or len(values) < len(WIRE_FIELDS):
+        raise ValueError('not an encoded record: %r' % (data[:100],))
+    record_dict = dict(zip(WIRE_FIELDS, values))
+    if len(values) > len(WIRE_FIELDS):
+        if not isinstance(values[-1], dict):
+            raise ValueError('extra fields of an encoded record must be a dict, not %r' % (values[-1],))
+        record_dict.update(values[-1])
+    record_dict['args'] = None
+    record_dict['exc_info'] = None
+    return record_from_dict(record_dict)
+
+
+class ColorSenderHandler(logging.Handler):
+    '''Send records to a ColorCollector
+
+    Either connects to the collector's address (with authkey if the collector uses one) on the
+    first record, or uses an existing multiprocessing connection. extra_fields are the names of
+    any non standard record attributes the collector's format string uses.'''
+
+    def __init__(self, address=None, connection=None, authkey=None, family=None,
+                 extra_fields=(), level=logging.NOTSET):
+        if address is None and connection is None:
+            raise ValueError('ColorSenderHandler needs an address or a connection')
+
+        logging.Handler.__init__(self, level=level)
+        self.address = address
+        self.authkey = authkey
+        self.family = family
+        self.extra_fields = tuple(extra_fields)
+        self.connection = connection
+
+    def _connect(self):
+        return Client(self.address, family=self.family, authkey=self.authkey)
+
+    def emit(self, record):
+        try:
+            data = encode_record(record, self.extra_fields)
+            if self.connection is None:
+                self.connection = self._connect()
+            self.connection.send_bytes(data)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            # reconnect on the next record
+            if self.address is not None:
+                self._close_connection()
+            self.handleError(record)
+
+    def _close_connection(self):
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except (IOError, OSError):
+                pass
+            self.connection = None
+
+    def close(self):
+        self.acquire()
+        try:
+            self._close_connection()
+            logging.Handler.close(self)
+        finally:
+            self.release()
+
+
+def _get_default_handler():
+    return ColorStreamHandler(sys.stderr)
+
+
+class ColorCollector(object):
+    '''Receive records from ColorSenderHandlers and pass them to one handler
+
+    The handler (a ColorStreamHandler(sys.stderr) with a ColorFormatter by default) serializes
+    the formatting and writes with its own lock, so records from every connection end up in
+    one colored stream.'''
+
+    def __init__(self, address=None, handler=None, authkey=None, family=None):
+        self.address = address
+        self.authkey = authkey
+        self.family = family
+        self.handler = handler or _get_default_handler()
+
+        self.received = 0
+        self.errors = 0
+
+        self._listener = None
+        self._accept_thread = None
+        self._connections = []
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stopping = False
+
+    def start(self):
+        '''Listen on address for ColorSenderHandler connections'''
+        self._stopping = False
+        self._listener = Listener(self.address, family=self.family, authkey=self.authkey)
+        # if address was None, Listener picked one
+        self.address = self._listener.address
+        self._accept_thread = self._start_thread(self._accept, 'ColorCollector-accept')
+
+    def add_connection(self, connection):
+        '''Read records from an existing connection, ie one end of a multiprocessing.Pipe()'''
+        with self._lock:
+            self._connections.append(connection)
+            # started while holding the lock, so the reader can't finish (and remove itself) before it is added
+            self._threads.append(self._start_thread(self._read, 'ColorCollector-reader', connection))
+
+    def _start_thread(self, target, name, *args):
+        thread = threading.Thread(target=target, name=name, args=args)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _remove_connection(self, connection):
+        '''close a connection whose sender hung up, and forget it and its reader thread'''
+        with self._lock:
+            try:
+                self._connections.remove(connection)
+            except ValueError:
+                # stop() already took it, and closes it itself
+                connection = None
+            try:
+                self._threads.remove(threading.current_thread())
+            except ValueError:
+                pass
+        if connection is not None:
+            try:
+                connection.close()
+            except (IOError, OSError):
+                pass
+
+    def _accept(self):
+        while not self._stopping:
+            try:
+                connection = self._listener.accept()
+            except (IOError, OSError, EOFError):
+                if self._stopping:
+                    break
+                self.errors += 1
+                continue
+            # connections made before stop() are still read, stop()'s own wake up
+            # connection is closed right away so its reader just sees EOF.
+            self.add_connection(connection)
+
+    def _read(self, connection):
+        try:
+            while True:
+                try:
+                    data = connection.recv_bytes()
+                except (IOError, OSError, EOFError):
+                    break
+                try:
+                    record = decode_record(data)
+                except (ValueError, TypeError):
+                    # not from a ColorSenderHandler, drop it but keep reading
+                    self.errors += 1
+                    continue
+                self.received += 1
+                self.handler.handle(record)
+        finally:
+            self._remove_connection(connection)
+
+    def join(self, timeout=None):
+        '''Wait (up to timeout seconds in total) for every connection to be closed by its sender'''
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join(None if deadline is None else max(0, deadline - time.time()))
+
+    def stop(self, timeout=1.0):
+        '''Stop listening, close all connections and flush the handler
+
+        Records already sent by closed senders are still handled, connections still open
+        after timeout seconds are closed.'''
+        self._stopping = True
+        if self._listener is not None:
+            # wake up the accept() call
+            try:
+                Client(self.address, family=self.family, authkey=self.authkey).close()
+            except (IOError, OSError, EOFError):
+                pass
+            self._accept_thread.join(timeout)
+            self._listener.close()
+            self._listener = None
+
+        self.join(timeout)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except (IOError, OSError):
+                pass
+        self.join(timeout)
+        self.handler.flush()
@@ -1,5 +1,15 @@
+import collections
 import logging
-import re
+import os
+import string
+import threading
+import time
+
+from .counters import PerThreadCounters, ThreadCounted
+from .hierarchy import NameHierarchyColors
+from .formats import MAX_CACHED_FORMATS, FormatField, literal_text, parse_format_string, placeholder
+from .instrumentation import FormatterStats, instrument_formatter
+from .palettes import get_palette
 
 # TODO: add a Filter or LoggingAdapter that adds a record attribute for parent pid
 #       (and maybe thread group/process group/cgroup ?)
@@ -28,75 +38,120 @@ DEFAULT_FORMAT = ("""%(asctime)-15s"""
 #                  """%(_cdl_reset)s""")
 
 
-def find_format_attrs(format_string):
-    attrs_re_string = r"(?P<full_attr>%\((?P<attr_name>" + r'.*' + r"?)\).*?[dsf])"
-
-    attrs_re = re.compile(attrs_re_string)
-    format_attrs = attrs_re.findall(format_string)
+def find_format_attrs(format_string, style='%'):
+    '''return a list of (specifier, attr_name) for the attr specifiers in format_string
 
-    return format_attrs
+    ie, '%(process)-5d %(message)s' -> [('%(process)-5d', 'process'), ('%(message)s', 'message')]'''
+    return [(field.text, field.attr_name) for field in parse_format_string(format_string, style).fields]
 
 
-def context_color_format_string(format_string, format_attrs):
+def context_color_format_string(format_string, format_attrs=None, style='%'):
     '''For extending a format string for logging.Formatter to include attributes with color info.
 
-    ie, '%(process)d %(threadName)s - %(msg)'
+    ie, '%(process)d %(threadName)s'
 
     becomes
 
-    '%(_cdl_process)s%(process)d%(_cdl_reset)s %(_cdl_threadName)%(threadName)s%(_cdl_reset)s - %(msg)'
+    '%(_cdl_default)s%(_cdl_process)s%(process)d%(_cdl_unset)s %(_cdl_threadName)s%(threadName)s%(_cdl_unset)s%(_cdl_reset)s'
 
-    Note that adding those log record attributes is left to... <FIXME>.
-    '''
-    format_attrs = find_format_attrs(format_string)
-    # TODO: pass in a list of record/logFormatter attributes to be wrapped for colorization
-
-    color_attrs_string = '|'.join([x[1] for x in format_attrs])
-
-    # This looks for log format strings like '%(threadName)s' or '$(process)d, and replaces
-    # the format specifier with a version wrapped with log record color attributes.
-    #
-    # For ex, '%(threadName)s'  -> %(_cdl_threadName)s%(threadName)s%(cdl_reset)
-    #
-    # When ColorFormatter.format() is called on a LogRecord, this is equilivent to
-    # calling 'log_format_string % log_record.__dict__', and uses the normal (but 'old school')
-    # string formatting (ie, %s style). 'threadName' is populated automatically by a logging.Logger() class on .log(),
-    # but the custom fields like %(_cdl_threadName)s need to be added to the log record
-    # we pass to ColorFormatter.format()
-    #
-    # ColorFormatter.format() actually does this itself, but those attributes could be set else
-    # via a logger, a log adapter, a logging Filter attached to the logger, a filter attached
-    # to a logging.Handler, or by a logging handler itself. Since our attributes are purely for
-    # formatting, we just do it in the ColorFormatter.format()
-    # https://docs.python.org/2/library/logging.html#logrecord-attributes
-    #
-    # THe captured groups 'full_attr' is the entire record attribute from the string, including
-    # string formatting/precsion, and padding info. ie '%(process)-10d' is a process pid right justified with
-    # a max length of 10 chars.
-    #
-    # The capture 'attr_name' is just the name of the attr, 'process' or 'message' or 'levelname' for ex. This
-    # is extract so it can be used in the name of the color debug logger attribute that will set the color info
-    # For '%(process)-10d', that would make 'process' the attr_name, and the color attribute '%(_cdl_process)'
-    # color_attrs_string is a sub regex of the attr names to be given color using the re alternate '|' notation.
-    re_string = r"(?P<full_attr>%\((?P<attr_name>" + color_attrs_string + r"?)\).*?[dsf])"
-
-    color_format_re = re.compile(re_string)
-
-    replacement = r"%(_cdl_\g<attr_name>)s\g<full_attr>%(_cdl_unset)s"
-
-    # likely needs thread locking
-    # exc_info_post = '%(exc_text_sep)s%(exc_text)s%(exc_text_sep)s'
-    # format_string = '%s%s' % (format_string, exc_info_post)
-
-    # for match in format_attrs.groups():
-    #    print('match: %s' % match)
-
-    format_string2 = color_format_re.sub(replacement, format_string)
+    Only the attrs in format_attrs (as returned by find_format_attrs()) are wrapped, None for all
+    of them. Any padding or precision stays on the attr itself, so '%(process)-10d' is still 10
+    chars wide without the color codes. The color attrs are added in the same style as the
+    format string, so '{process:<10}' becomes '{_cdl_process}{process:<10}{_cdl_unset}'.
 
+    The '_cdl_*' attrs need to be on the record (or in the mapping) when formatting,
+    ColorFormatter.format() adds them.
+    '''
+    parsed = parse_format_string(format_string, style)
+    if format_attrs is None:
+        color_attr_names = set(field.attr_name for field in parsed.fields)
+    else:
+        color_attr_names = set(attr_name for _, attr_name in format_attrs)
+
+    unset = placeholder('_cdl_unset', style)
+    parts = [placeholder('_cdl_default', style)]
+    for token in parsed.tokens:
+        if isinstance(token, FormatField) and token.attr_name in color_attr_names:
+            parts.append('%s%s%s' % (placeholder('_cdl_%s' % token.attr_name, style), token.text, unset))
+        elif isinstance(token, FormatField):
+            parts.append(token.text)
+        else:
+            parts.append(token)
     # set the default color at the begining of the format string and add a reset to the end
-    format_string = r"%(_cdl_default)s" + format_string2 + r"%(_cdl_reset)s"
+    parts.append(placeholder('_cdl_reset', style))
+    return ''.join(parts)
+
+
+def _fallback_render(format_string, style):
+    if style == '{':
+        def render(d):
+            return format_string.format_map(d)
+    elif style == '$':
+        template = string.Template(format_string)
+
+        def render(d):
+            return template.substitute(d)
+    else:
+        def render(d):
+            return format_string % d
+    return render
+
+
+# (format string, style) -> render callable, shared by every formatter using the same format
+_compiled_formats = {}
 
-    return format_string
+
+def compile_format_string(format_string, style='%'):
+    '''Compile a logging format string into a render(mapping) callable.
+
+    render(d) returns the same thing as 'format_string % d', but the format string is only parsed
+    once. The attr references are replaced with positional specifiers (keeping any padding and
+    precision) and the generated function looks up exactly the attrs it needs, ie:
+
+        '%(levelname)-8s %(message)s' -> lambda d: '%-8s %s' % (d['levelname'], d['message'])
+
+    style is the same as logging.Formatter's. '{' formats compile the same way with
+    str.format(), ie '{levelname:<8} {message}' -> '{0:<8} {1}'.format(...), and '$' formats
+    compile to a % template, since string.Template just does '%s' of each value.
+
+    Format strings this can not make sense of fall back to 'format_string % d' (or the '{' and
+    '$' equivalents). Compiled formats are cached process wide, like parse_format_string().
+    '''
+    key = (format_string, style)
+    try:
+        return _compiled_formats[key]
+    except KeyError:
+        pass
+
+    parsed = parse_format_string(format_string, style)
+    if not parsed.valid:
+        # not something we know, let the % operator (or str.format etc) deal with (or complain about) it
+        render = _fallback_render(format_string, style)
+    else:
+        template_parts = []
+        field_idx = 0
+        for token in parsed.tokens:
+            if not isinstance(token, FormatField):
+                # '$' literals end up in a % template
+                template_parts.append(token if style != '$' else literal_text(token, style).replace('%', '%%'))
+            elif style == '{':
+                template_parts.append('{%d%s}' % (field_idx, token.spec))
+                field_idx += 1
+            else:
+                template_parts.append('%' + token.spec)
+        args = ''.join('d[%r], ' % field.attr_name for field in parsed.fields)
+        if style == '{':
+            src = 'def render(d):\n    return _template.format(%s)\n' % args
+        else:
+            src = 'def render(d):\n    return _template %% (%s)\n' % args
+        namespace = {'_template': ''.join(template_parts)}
+        exec(src, namespace)
+        render = namespace['render']
+
+    if len(_compiled_formats) >= MAX_CACHED_FORMATS:
+        _compiled_formats.clear()
+    _compiled_formats[key] = render
+    return render
 
 
 def add_default_record_attrs(record, attr_list):
@@ -108,6 +163,205 @@ def add_default_record_attrs(record, attr_list):
 
 RGB_COLOR_OFFSET = 16
 DEFAULT_COLOR_BY_ATTR = 'process'
+DEFAULT_NAME_COLOR_CACHE_SIZE = 1024
+DEFAULT_PROCESS_COLOR_CACHE_SIZE = 256
+DEFAULT_EXC_TEXT_CACHE_SIZE = 256
+DEFAULT_FRAME_CACHE_SIZE = 1024
+
+
+def _hit_rate(hits, misses):
+    lookups = hits + misses
+    return float(hits) / lookups if lookups else 0.0
+
+
+class LRUCache(object):
+    '''A bounded mapping that evicts the least recently used entry once maxsize is reached.
+
+    Keeps hits/misses/evictions counters. A maxsize of 0 disables caching (every get is a miss).
+
+    Not thread safe, there is no lock. Use one per thread, see ThreadLocalLRUCache.'''
+
+    def __init__(self, maxsize=DEFAULT_NAME_COLOR_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        # re-insert to mark as most recently used
+        self._data[key] = value
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': _hit_rate(self.hits, self.misses),
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'maxsize': self.maxsize}
+
+
+class _ThreadCache(LRUCache, ThreadCounted):
+    '''one thread's LRUCache in a ThreadLocalLRUCache, its counters are kept when the thread exits'''
+
+
+_CACHE_COUNTERS = ('hits', 'misses', 'evictions')
+
+
+class ThreadLocalLRUCache(object):
+    '''An LRUCache per thread, so threads never share (or lock) cache state.
+
+    get()/set() only touch the calling thread's cache. Each thread fills its own cache, so a
+    value may be computed once per thread instead of once per process; the cached values are
+    pure functions of the key, so every thread gets the same answer either way. A lock is only
+    taken the first time a thread uses the cache, to register it for stats().
+
+    hits/misses/evictions and stats() are summed over all threads, len() and 'size' over the
+    caches of live threads.'''
+
+    def __init__(self, maxsize=DEFAULT_NAME_COLOR_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._caches = self._new_caches()
+
+    def _new_caches(self):
+        maxsize = self.maxsize
+        return PerThreadCounters(lambda: _ThreadCache(maxsize), _CACHE_COUNTERS)
+
+    def get(self, key, default=None):
+        caches = self._caches
+        try:
+            cache = caches.local.counters
+        except AttributeError:
+            cache = caches.get()
+        return cache.get(key, default)
+
+    def set(self, key, value):
+        caches = self._caches
+        try:
+            cache = caches.local.counters
+        except AttributeError:
+            cache = caches.get()
+        cache.set(key, value)
+
+    def __contains__(self, key):
+        cache = getattr(self._caches.local, 'counters', None)
+        return cache is not None and key in cache
+
+    def clear(self):
+        '''empty the caches of all threads and reset the counters'''
+        # other threads may be using their caches right now, so swap in new ones instead of
+        # mutating them. Each thread starts a new cache on its next get()/set().
+        self._caches = self._new_caches()
+
+    def __len__(self):
+        return sum(len(cache) for cache in self._caches.live())
+
+    @property
+    def hits(self):
+        return self._caches.totals()['hits']
+
+    @property
+    def misses(self):
+        return self._caches.totals()['misses']
+
+    @property
+    def evictions(self):
+        return self._caches.totals()['evictions']
+
+    def stats(self):
+        caches = self._caches
+        live = caches.live()
+        totals = caches.totals()
+        return {'hits': totals['hits'],
+                'misses': totals['misses'],
+                'hit_rate': _hit_rate(totals['hits'], totals['misses']),
+                'evictions': totals['evictions'],
+                'size': sum(len(cache) for cache in live),
+                'maxsize': self.maxsize,
+                'threads': len(live)}
+
+
+def _traceback_key(tb):
+    frames = []
+    while tb is not None:
+        code = tb.tb_frame.f_code
+        # tb_lasti too, newer pythons point at the column range of the failing expression
+        frames.append((code.co_filename, tb.tb_lineno, code.co_name, tb.tb_lasti))
+        tb = tb.tb_next
+    return tuple(frames)
+
+
+def exception_cache_key(exc_info):
+    '''return a hashable key for the traceback text formatException(exc_info) would render, or None
+
+    The key is the exception type, message and (filename, lineno, name) of every frame, for the
+    exception and every exception in its __cause__/__context__ chain (and the members of
+    exception groups), so two exceptions with the same key render the same text. It walks the
+    frames but never touches linecache or the source, which is what makes rendering expensive.
+
+    None means the exception can't be keyed (its str() failed, for ex) and has to be rendered.'''
+    exc_type, exc_value, tb = exc_info
+    key = []
+    seen = set()
+    pending = [(exc_type, exc_value, tb)]
+    while pending:
+        exc_type, exc_value, tb = pending.pop()
+        if exc_value is None:
+            key.append((exc_type, None, _traceback_key(tb)))
+            continue
+        if id(exc_value) in seen:
+            # a cycle in the chain, formatting stops there too
+            key.append('<seen>')
+            continue
+        seen.add(id(exc_value))
+
+        try:
+            message = str(exc_value)
+        except Exception:
+            return None
+        exc_key = (exc_type, message, _traceback_key(tb),
+                   # SyntaxError shows the offending line and a caret, str() doesn't include them
+                   getattr(exc_value, 'text', None), getattr(exc_value, 'offset', None),
+                   tuple(getattr(exc_value, '__notes__', None) or ()),
+                   getattr(exc_value, '__suppress_context__', False))
+        key.append(exc_key)
+
+        for sub_exc in getattr(exc_value, 'exceptions', None) or ():
+            if isinstance(sub_exc, BaseException):
+                pending.append((type(sub_exc), sub_exc, sub_exc.__traceback__))
+        chained = getattr(exc_value, '__cause__', None)
+        if chained is None and not getattr(exc_value, '__suppress_context__', False):
+            chained = getattr(exc_value, '__context__', None)
+        key.append(chained is not None)
+        if chained is not None:
+            pending.append((type(chained), chained, chained.__traceback__))
+    return tuple(key)
+
 
 # Example uses of color_groups
 # color_groups = [
@@ -138,6 +392,37 @@ DEFAULT_COLOR_BY_ATTR = 'process'
 # ]
 
 
+# The per-formatter 'compiled' view of group_by/custom_attrs/high_cardinality/format attrs.
+# Built once in BaseColorMapper.__init__, so get_colors_for_record() only has to do the
+# lookups that are actually needed for a record.
+#
+#  initial_colors: tuple of (cdl_name, color_idx) pairs every color dict starts with
+#  use_level_color: compute '_cdl_levelname' via get_level_color()
+#  use_thread_color: compute process/thread colors via get_process_colors()
+#  name_color_groups: tuple of (attr, cdl_name) group keys colored by get_name_color(record.attr)
+#  member_groups: tuple of (group_cdl_name, (member_cdl_name, ...)), applied in order
+#  auto_color_attrs: tuple of (attr, cdl_name) colored by get_name_color() when auto_color is set
+#  registry_color_attrs: tuple of (attr, cdl_name) colored by get_registry_color() instead
+#  hierarchy_color_attrs: tuple of (attr, cdl_name) colored by name_hierarchy.get_color() instead
+#  default_attr_string: the cdl_name whose color replaces DEFAULT_COLOR_IDX
+ColorPlan = collections.namedtuple('ColorPlan',
+                                   ['initial_colors', 'use_level_color', 'use_thread_color',
+                                    'name_color_groups', 'member_groups', 'auto_color_attrs', 'registry_color_attrs',
+                                    'hierarchy_color_attrs', 'default_attr_string'])
+
+
+def _unique(items):
+    '''return a tuple of items with duplicates removed, keeping the first occurence order'''
+    seen = set()
+    res = []
+    for item in items:
+        if item in seen:
+            continue
+        seen.add(item)
+        res.append(item)
+    return tuple(res)
+
+
 class BaseColorMapper(object):
     # default_color_groups is:
     #  ('attr', list_of_attrs_to_use 'attr''s color
@@ -153,9 +438,21 @@ class BaseColorMapper(object):
     custom_attrs = ['levelname', 'levelno', 'process', 'processName', 'thread', 'threadName']
     high_cardinality = set(['asctime', 'created', 'msecs', 'relativeCreated', 'args', 'message'])
 
+    DEFAULT_COLOR_IDX = 0
+    RESET_SEQ_IDX = 0
+
+    # attrs that get their color from a color_registry if there is one (processName and threadName
+    # are handled by get_process_colors())
+    registry_attrs = set(['name'])
+
+    # dotted attrs that get related colors for related names with hierarchical_names
+    hierarchy_attrs = set(['name'])
+
     def __init__(self, fmt=None, default_color_by_attr=None,
                  color_groups=None, format_attrs=None,
-                 auto_color=False):
+                 auto_color=False, name_color_cache_size=DEFAULT_NAME_COLOR_CACHE_SIZE,
+                 process_color_cache_size=DEFAULT_PROCESS_COLOR_CACHE_SIZE,
+                 process_color_fast_path=True, palette=None, color_registry=None, hierarchical_names=False):
         self._fmt = fmt
         self.color_groups = color_groups or []
 
@@ -178,9 +475,110 @@ class BaseColorMapper(object):
         self._format_attrs = format_attrs
 
         self.auto_color = auto_color
+
+        # A mapper is shared by every thread logging through its formatter, so after __init__
+        # its only mutable state is per thread: the caches below and self._local. Everything
+        # else (the plan, the palette) is never modified, so format() never takes a lock.
+
+        # get_name_color() results keyed by (name, perturb)
+        self.name_color_cache = ThreadLocalLRUCache(maxsize=name_color_cache_size)
+
+        # get_process_colors() results keyed by (processName, process, threadName, thread)
+        self.process_color_cache = ThreadLocalLRUCache(maxsize=process_color_cache_size)
+        # consecutive records from a thread usually have the same process info, so remember
+        # the thread's last (key, colors) and skip the cache entirely if it matches.
+        self.process_color_fast_path = process_color_fast_path
+        self._local = threading.local()
+
+        # turns color idxs into escape sequences, see color_debug.palettes
+        self.palette = get_palette(palette)
+
+        # optional color_debug.registry.SharedColorRegistry, for colors that are handed out
+        # first come first served and agreed on by every process using the same registry.
+        self.color_registry = color_registry
+        self.registry_color_cache = ThreadLocalLRUCache(maxsize=name_color_cache_size)
+
+        # If True, logger names are colored by their dotted hierarchy ('foo.model' and 'foo.util'
+        # get related colors), see color_debug.hierarchy
+        self.name_hierarchy = NameHierarchyColors(max_names=name_color_cache_size) if hierarchical_names else None
         # import pprint
         # pprint.pprint(('color_groups', color_groups))
 
+        self._plan = self._build_color_plan()
+
+    def _build_color_plan(self):
+        '''Compile group_by, custom_attrs, high_cardinality and the format attrs into a ColorPlan'''
+        _default_color_index = self.DEFAULT_COLOR_IDX
+
+        # 'cdl' is 'context debug logger'. Mostly just an unlikely record name to avod name collisions.
+        initial_colors = [('_cdl_default', _default_color_index),
+                          ('_cdl_unset', _default_color_index),
+                          ('_cdl_reset', self.RESET_SEQ_IDX)]
+
+        # populate the color dict with values for any _cdl_* attrs we will use
+        # could be self._format_attrs (actually used in format string) + any referenced as color_group keys
+        group_by_attrs = _unique([y[0] for y in self.group_by])
+        format_attrs = [z[1] for z in self._format_attrs or []] + ['exc_text']
+
+        attrs_needed = _unique(list(group_by_attrs) + format_attrs)
+        for attr_needed in attrs_needed:
+            initial_colors.append(('_cdl_%s' % attr_needed, _default_color_index))
+
+        # make sure there is always something to look up the default color by
+        if self.default_attr_string not in dict(initial_colors):
+            initial_colors.append((self.default_attr_string, _default_color_index))
+
+        use_level_color = 'levelname' in group_by_attrs or 'levelno' in group_by_attrs
+
+        use_thread_color = self.auto_color
+        for attr in ['process', 'processName', 'thread', 'threadName']:
+            if attr in group_by_attrs:
+                use_thread_color = True
+
+        # find the color for any group keys before setting colors for group members
+        # TODO: extend group keys to let them be tuples
+        #       to allow (name, funcName) to get a color for module.function() instead of two sep
+        # NOTE: 'name' is handled here as well, it is not a custom attr.
+        name_color_groups = tuple((group, '_cdl_%s' % group) for group in group_by_attrs
+                                  if group not in self.custom_attrs)
+
+        member_groups = []
+        in_a_group = set()
+        for group, members in self.group_by:
+            member_groups.append(('_cdl_%s' % group, tuple('_cdl_%s' % member for member in members)))
+            in_a_group.update(members)
+
+        # for everything else, use the name/string to get a color if auto_colors is True
+        auto_color_attrs = ()
+        if self.auto_color:
+            auto_color_attrs = tuple((attr, '_cdl_%s' % attr) for attr in attrs_needed
+                                     if attr not in self.custom_attrs and attr not in in_a_group
+                                     and attr not in self.high_cardinality)
+
+        registry_color_attrs = ()
+        if self.color_registry is not None:
+            registry_color_attrs = tuple(attr_and_cdl_name for attr_and_cdl_name in name_color_groups + auto_color_attrs
+                                         if attr_and_cdl_name[0] in self.registry_attrs)
+            name_color_groups = tuple(x for x in name_color_groups if x not in registry_color_attrs)
+            auto_color_attrs = tuple(x for x in auto_color_attrs if x not in registry_color_attrs)
+
+        hierarchy_color_attrs = ()
+        if self.name_hierarchy is not None:
+            hierarchy_color_attrs = tuple(attr_and_cdl_name for attr_and_cdl_name in name_color_groups + auto_color_attrs
+                                          if attr_and_cdl_name[0] in self.hierarchy_attrs)
+            name_color_groups = tuple(x for x in name_color_groups if x not in hierarchy_color_attrs)
+            auto_color_attrs = tuple(x for x in auto_color_attrs if x not in hierarchy_color_attrs)
+
+        return ColorPlan(initial_colors=tuple(initial_colors),
+                         use_level_color=use_level_color,
+                         use_thread_color=use_thread_color,
+                         name_color_groups=name_color_groups,
+                         member_groups=tuple(member_groups),
+                         auto_color_attrs=auto_color_attrs,
+                         registry_color_attrs=_unique(registry_color_attrs),
+                         hierarchy_color_attrs=_unique(hierarchy_color_attrs),
+                         default_attr_string=self.default_attr_string)
+
     def get_thread_color(self, thread_id):
         '''return color idx for thread_id'''
         return 0
@@ -193,6 +591,36 @@ class BaseColorMapper(object):
         '''return color idx for logging levelname and levelno'''
         return 0
 
+    def get_stats(self):
+        '''return the stats() of the mapper's caches, see LRUCache.stats()'''
+        return {'caches': {'name_color': self.name_color_cache.stats(),
+                           'process_color': self.process_color_cache.stats(),
+                           'registry_color': self.registry_color_cache.stats()}}
+
+    def get_registry_color(self, kind, name):
+        '''return the color idx self.color_registry assigned to name, assigning one if needed'''
+        key = (kind, name)
+        try:
+            color_idx = self.registry_color_cache.get(key)
+        except TypeError:
+            return self._assign_registry_color(kind, name)
+
+        # registry assignments never change, so they can be cached as is
+        if color_idx is None:
+            color_idx = self._assign_registry_color(kind, name)
+            self.registry_color_cache.set(key, color_idx)
+        return color_idx
+
+    def _assign_registry_color(self, kind, name):
+        from .registry import RegistryFull
+        try:
+            return self.color_registry.get_color(kind, '%s' % (name,))
+        except RegistryFull:
+            # every slot is taken (new worker pids use up processName slots for good), a hashed
+            # color is better than failing to format the record. A full registry stays full, so
+            # this is as stable as a registry color.
+            return self.get_name_color(name)
+
     def get_process_colors(self, record):
         '''return a tuple of pname_color, pid_color, tname_color, tid_color idx for process record'''
         return 0, 0, 0, 0
@@ -263,10 +691,25 @@ class TermColorMapper(BaseColorMapper):
     # TODO: make so a given first ProcessName will always start the same color (so multiple runs are consistent)
     # TODO: make 'msg' use the most specific combo of pid/processName/tid/threadName
     # TODO: generalize so it will for logger name as well
-    # MAYBE: color hiearchy for logger names? so 'foo.model' and 'foo.util' are related...
-    #        maybe split on '.' and set initial color based on hash of sub logger name?
+    # NOTE: hierarchical_names=True colors logger names by hierarchy, so 'foo.model' and 'foo.util'
+    #       are related. See color_debug.hierarchy
     # SEEALSO: chromalog module does something similar, may be easiest to extend
     # TODO: this could be own class/methods like ContextColor(log_record) that returns color info
+    # stepping through the thread colors 37 at a time (37 and NUMBER_OF_THREAD_COLORS have no common factor)
+    # visits all of them, but consecutive colors come from far apart in the rgb cube, so the first few
+    # names handed out by a color registry are easy to tell apart.
+    REGISTRY_COLOR_STRIDE = 37
+
+    @classmethod
+    def create_color_registry(cls, path, slots=None):
+        '''Open (or create) a color_debug.registry.SharedColorRegistry at path handing out thread colors
+
+        Pass it to the color_registry arg of TermColorMapper/ColorFormatter in every process.'''
+        from .registry import DEFAULT_SLOTS, SharedColorRegistry
+        colors = [cls.START_OF_THREAD_COLORS + (idx * cls.REGISTRY_COLOR_STRIDE) % cls.NUMBER_OF_THREAD_COLORS
+                  for idx in range(cls.NUMBER_OF_THREAD_COLORS)]
+        return SharedColorRegistry(path, colors, slots=slots or DEFAULT_SLOTS)
+
     def get_thread_color(self, threadid):
         # 220 is useable 256 color term color (forget where that comes from? some min delta-e division of 8x8x8 rgb colorspace?)
         thread_mod = threadid % self.NUMBER_OF_THREAD_COLORS
@@ -274,8 +717,22 @@ class TermColorMapper(BaseColorMapper):
         # return self.THREAD_COLORS[thread_mod]
         return thread_mod + self.RGB_COLOR_OFFSET
 
-    # TODO: This could special case 'MainThread'/'MainProcess' to pick a good predictable color
     def get_name_color(self, name, perturb=None):
+        '''return color idx for 'name', memoized in self.name_color_cache'''
+        key = (name, perturb)
+        try:
+            color_idx = self.name_color_cache.get(key)
+        except TypeError:
+            # unhashable attr value, just compute it
+            return self._get_name_color(name, perturb=perturb)
+
+        if color_idx is None:
+            color_idx = self._get_name_color(name, perturb=perturb)
+            self.name_color_cache.set(key, color_idx)
+        return color_idx
+
+    # TODO: This could special case 'MainThread'/'MainProcess' to pick a good predictable color
+    def _get_name_color(self, name, perturb=None):
         # if name == '':
         #    return self._default_color_index
         perturb = perturb or 'xccvsdfb'
@@ -294,6 +751,30 @@ class TermColorMapper(BaseColorMapper):
         return level_color
 
     def get_process_colors(self, record):
+        '''return a tuple of pname_color, pid_color, tname_color, tid_color idx for process record
+
+        Results are cached by (processName, process, threadName, thread), see _get_process_colors()'''
+        key = (record.processName, record.process, record.threadName, record.thread)
+
+        if self.process_color_fast_path:
+            last_key, last_colors = getattr(self._local, 'last_process_colors', (None, None))
+            if key == last_key:
+                return last_colors
+
+        try:
+            process_colors = self.process_color_cache.get(key)
+        except TypeError:
+            return self._get_process_colors(*key)
+
+        if process_colors is None:
+            process_colors = self._get_process_colors(*key)
+            self.process_color_cache.set(key, process_colors)
+
+        if self.process_color_fast_path:
+            self._local.last_process_colors = (key, process_colors)
+        return process_colors
+
+    def _get_process_colors(self, pname, pid, tname, tid):
         '''Given process/thread info, return reasonable colors for them.
 
         Roughly:
@@ -309,15 +790,16 @@ class TermColorMapper(BaseColorMapper):
             NOTE: This doesn't track any state so there is no ordering or prefence to the colors given out.
 
         '''
-        pname, pid, tname, tid = record.processName, record.process, record.threadName, record.thread
         # 'pname' is almost always 'MainProcess' which ends up a ugly yellow. perturb is here to change the color
         # that 'MainProcess' ends up to a nicer light green
         perturb = 'pseudoenthusiastically'
         # perturb = 'a'
         # combine pid+pname otherwise, all MainProcess will get the same pname
         pid_label = '%s%s' % (pname, pid)
-        pname_color = self.get_name_color(pid_label, perturb=perturb)
-        # pname_color = self.get_name_color(pid_label, perturb=perturb)
+        if self.color_registry is not None:
+            pname_color = self.get_registry_color('processName', pid_label)
+        else:
+            pname_color = self.get_name_color(pid_label, perturb=perturb)
         if pname == 'MainProcess':
             pid_color = pname_color
         else:
@@ -328,7 +810,10 @@ class TermColorMapper(BaseColorMapper):
             tname_color = pid_color
             tid_color = tname_color
         else:
-            tname_color = self.get_name_color(tname)
+            if self.color_registry is not None:
+                tname_color = self.get_registry_color('threadName', tname)
+            else:
+                tname_color = self.get_name_color(tname)
             tid_color = self.get_thread_color(tid)
 
         return pname_color, pid_color, tname_color, tid_color
@@ -341,56 +826,16 @@ class TermColorMapper(BaseColorMapper):
     # def add_color_attrs_to_record(self, record):
     def get_colors_for_record(self, record):
         '''For a log record, compute color for each field and return a color dict'''
+        plan = self._plan
 
-        _default_color_index = self.DEFAULT_COLOR_IDX
-        # 'cdl' is 'context debug logger'. Mostly just an unlikely record name to avod name collisions.
-        # record._cdl_reset = self.RESET_SEQ
-        # record._cdl_default = self.default_color
-        # record._cdl_unset = self.default_color
-        # self._pre_format(record)
-
-        colors = {'_cdl_default': _default_color_index,
-                  '_cdl_unset': _default_color_index,
-                  '_cdl_reset': self.RESET_SEQ_IDX}
-
-        # custom_mapppers = levelno, levelno
-        # thread, threadname, process, processname
-
-        # populate the record with values for any _cdl_* attrs we will use
-        # could be self._format_attrs (actually used in format string) + any referenced as color_group keys
-        group_by_attrs = [y[0] for y in self.group_by]
-
-        format_attrs = [z[1] for z in self._format_attrs] + ['exc_text']
-
-        # attrs_needing_default = self.default_record_attrs + self.custom_record_attrs
-        attrs_needed = group_by_attrs + format_attrs
-        for attr_needed in attrs_needed:
-            cdl_name = '_cdl_%s' % attr_needed
-            # setattr(record, cdl_name, self.default_color)
-            colors[cdl_name] = _default_color_index
+        colors = dict(plan.initial_colors)
 
-        use_level_color = 'levelname' in group_by_attrs or 'levelno' in group_by_attrs
         # NOTE: the impl here is based on info from justthe LogRecord and should be okay across threads
         #       If this wants to use more global data, beware...
-        if use_level_color:
-            level_color = self.get_level_color(record.levelname, record.levelno)
-            # record._cdl_levelname = level_color
-            colors['_cdl_levelname'] = level_color
-
-        # set a different color for each logger name. And by default, make filename, funcName, and lineno match.
-        use_name_color = 'name' in group_by_attrs
-        if use_name_color:
-            # module_and_method_color = self.get_name_color('%s.%s' % (record.name, record.funcName))
-            module_and_method_color = self.get_name_color(record.name)
-            colors['_cdl_name'] = module_and_method_color
-            # group mapping should take care of the rest of these once _cdl_name is set
-
-        use_thread_color = False
-        for attr in ['process', 'processName', 'thread', 'threadName']:
-            if attr in group_by_attrs:
-                use_thread_color = True
+        if plan.use_level_color:
+            colors['_cdl_levelname'] = self.get_level_color(record.levelname, record.levelno)
 
-        if use_thread_color or self.auto_color:
+        if plan.use_thread_color:
             pname_color, pid_color, tname_color, tid_color = self.get_process_colors(record)
 
             colors['_cdl_process'] = pid_color
@@ -399,63 +844,34 @@ class TermColorMapper(BaseColorMapper):
             colors['_cdl_threadName'] = tname_color
             colors['_cdl_exc_text'] = tid_color
 
-        # add a custom faux record attribute for the combo of name and funcName (module)?
-        # name_and_method = '%s.%s' % (record.name, record.funcName)
-        # name_and_method_color = self.get_name_color(name_and_method)
-        # colors['_cdl_name_funcName'] = name_and_method_color
+        # set a different color for each logger name (or any other non custom group key).
+        for attr, cdl_name in plan.name_color_groups:
+            colors[cdl_name] = self.get_name_color(getattr(record, attr), 'sdsdf')
 
-        # fields we don't need to calculate indiv, since they will be a different group
-        in_a_group = set()
+        for attr, cdl_name in plan.registry_color_attrs:
+            colors[cdl_name] = self.get_registry_color(attr, getattr(record, attr))
 
-        # populate the set of groups members before figuring out any group colors
-        # for group, members in self.group_by:
-        #    for member in members:
-        #        in_a_group.add(member)
+        for attr, cdl_name in plan.hierarchy_color_attrs:
+            colors[cdl_name] = self.name_hierarchy.get_color(getattr(record, attr))
 
-        # find the color for any group keys before setting colors for group members
-        # TODO: extend group keys to let them be tuples
-        #       to allow (name, funcName) to get a color for module.function() instead of two sep
-        #       sim to module_and_method_color above
-        for group in group_by_attrs:
-            group_color = colors.get('_cdl_%s' % group, _default_color_index)
-            if group in self.custom_attrs or group in in_a_group:
-                continue
-            color_idx = self.get_name_color(getattr(record, group), 'sdsdf')
-            # print(('group', group))
-            # if group == 'threadName':
-            #    print((record.threadName, color_idx))
-            colors['_cdl_%s' % group] = color_idx
+        for group_cdl_name, member_cdl_names in plan.member_groups:
+            group_color = colors[group_cdl_name]
+            for member_cdl_name in member_cdl_names:
+                colors[member_cdl_name] = group_color
 
-        for group, members in self.group_by:
-            group_color = colors.get('_cdl_%s' % group, _default_color_index)
-
-            # print(('group2', group))
-            for member in members:
-                colors['_cdl_%s' % member] = group_color
-                in_a_group.add(member)
-
-        # calc_colors = set()
-        # for everything else, use the name/string to get a color if auto_colors is True
-        for needed_attr in attrs_needed:
-            if needed_attr in self.custom_attrs or needed_attr in in_a_group \
-                    or needed_attr in self.high_cardinality or not self.auto_color:
-                continue
-            color_idx = self.get_name_color(getattr(record, needed_attr))
-            colors['_cdl_%s' % needed_attr] = color_idx
-            # calc_colors.add(needed_attr)
+        for attr, cdl_name in plan.auto_color_attrs:
+            colors[cdl_name] = self.get_name_color(getattr(record, attr))
 
         # set the default color based on computed values, lookup the color
         # mapped to the attr default_color_by_attr  (ie, if 'process', lookup
         # record._cdl_process and set self.default_color to that value
-        _color_by_attr_index = colors[self.default_attr_string]
+        _color_by_attr_index = colors[plan.default_attr_string]
+        _default_color_index = self.DEFAULT_COLOR_IDX
+        escapes = self.palette.escapes
 
-        name_to_color_map = {}
-        for cdl_name, cdl_idx in colors.items():
-            # FIXME: revisit setting default idx to a color based on string
-            if cdl_idx == self.DEFAULT_COLOR_IDX:
-                cdl_idx = _color_by_attr_index
-            name_to_color_map[cdl_name] = self.ALL_COLORS[cdl_idx]
-        return name_to_color_map
+        # FIXME: revisit setting default idx to a color based on string
+        return dict((cdl_name, escapes[_color_by_attr_index if cdl_idx == _default_color_index else cdl_idx])
+                    for cdl_name, cdl_idx in colors.items())
 
 
 def _apply_colors_to_record(record, colors):
@@ -471,25 +887,84 @@ def _apply_colors_to_record(record, colors):
         setattr(record, cdl_name, color_value)
 
 
+class RecordOverlay(object):
+    '''A read only view of a LogRecord's __dict__ with extra formatting attrs layered on top.
+
+    Supports both mapping access (for 'fmt % overlay') and attribute access (for the color
+    mappers), so a record can be formatted without setting any attributes on it.'''
+    __slots__ = ('_record_dict', '_overlay')
+
+    def __init__(self, record_dict, overlay):
+        self._record_dict = record_dict
+        self._overlay = overlay
+
+    def __getitem__(self, key):
+        try:
+            return self._overlay[key]
+        except KeyError:
+            return self._record_dict[key]
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __contains__(self, key):
+        return key in self._overlay or key in self._record_dict
+
+
 class ColorFormatter(logging.Formatter):
-    # A little weird...
     @property
     def color_fmt(self):
-        if not self._color_fmt:
-            self._color_fmt = context_color_format_string(self._base_fmt, self._format_attrs)
+        '''fmt with the color attrs added, see context_color_format_string()'''
         return self._color_fmt
 
     def __init__(self, fmt=None, default_color_by_attr=None,
-                 color_groups=None, auto_color=False, datefmt=None):
-        fmt = fmt or DEFAULT_FORMAT
-        logging.Formatter.__init__(self, fmt, datefmt=datefmt)
+                 color_groups=None, auto_color=False, datefmt=None,
+                 name_color_cache_size=DEFAULT_NAME_COLOR_CACHE_SIZE,
+                 process_color_cache_size=DEFAULT_PROCESS_COLOR_CACHE_SIZE,
+                 mutate_record=True, use_color=True, palette=None, color_registry=None,
+                 exc_text_cache_size=DEFAULT_EXC_TEXT_CACHE_SIZE, color_frames=False,
+                 frame_cache_size=DEFAULT_FRAME_CACHE_SIZE, instrument=False,
+                 hierarchical_names=False, style='%'):
+        if fmt is None:
+            # DEFAULT_FORMAT is % style
+            fmt, style = DEFAULT_FORMAT, '%'
+        if style == '%':
+            logging.Formatter.__init__(self, fmt, datefmt=datefmt)
+        else:
+            # style is py3.2+
+            logging.Formatter.__init__(self, fmt, datefmt=datefmt, style=style)
         self._base_fmt = fmt
-        self._color_fmt = None
+        # '%', '{' or '$', like logging.Formatter. fmt, color_fmt and the _cdl_* attrs in it are all this style.
+        self.style = style
 
-        self._format_attrs = find_format_attrs(self._base_fmt)
+        self._format_attrs = find_format_attrs(self._base_fmt, style)
+
+        # built once here and never modified, so format() can run on any number of threads
+        # at once without locking. The other per record state (formatTime()'s cache and the
+        # color mapper's caches) is either replaced atomically or per thread.
+        self._color_fmt = context_color_format_string(self._base_fmt, self._format_attrs, style)
+        # color_fmt compiled into a render(mapping) callable, see compile_format_string()
+        self._render = compile_format_string(self._color_fmt, style)
 
         self.color_groups = color_groups or []
 
+        # (second, datefmt, converter, rendered time string) for the last formatTime() call
+        self._time_cache = (None, None, None, None)
+
+        # formatException() results keyed by exception_cache_key()
+        self.exc_text_cache = ThreadLocalLRUCache(maxsize=exc_text_cache_size)
+
+        # If False, format() interpolates against a RecordOverlay and leaves the LogRecord
+        # untouched instead of setting asctime/message/_cdl_* etc attributes on it.
+        self.mutate_record = mutate_record
+
+        # If False, format() is just logging.Formatter.format() with the original fmt
+        # and TermColorMapper is never used. See stream_supports_color().
+        self.use_color = use_color
+
         # TODO: be able to set the default color by attr name. Ie, make a record default to the thread or processName
         # self.default_color_by_attr = default_color_by_attr or 'process'
         # the name of the record attribute to check for a default color
@@ -499,35 +974,163 @@ class ColorFormatter(logging.Formatter):
                                             default_color_by_attr=default_color_by_attr,
                                             color_groups=self.color_groups,
                                             format_attrs=self._format_attrs,
-                                            auto_color=auto_color)
+                                            auto_color=auto_color,
+                                            name_color_cache_size=name_color_cache_size,
+                                            process_color_cache_size=process_color_cache_size,
+                                            palette=palette,
+                                            color_registry=color_registry,
+                                            hierarchical_names=hierarchical_names)
+
+        # If True, tracebacks and stack_info are colored frame by frame instead of as one block,
+        # see color_debug.tracebacks. exc_info is rendered straight to colored text, so
+        # record.exc_text is not set.
+        self.traceback_colorizer = None
+        if color_frames:
+            from .tracebacks import TracebackColorizer
+            self.traceback_colorizer = TracebackColorizer(self.color_mapper, frame_cache_size=frame_cache_size)
+
+        # sets the _cdl_* attrs on the record, an attribute so instrument_formatter() can time it
+        self._apply_colors = _apply_colors_to_record
+
+        # If True (or a FormatterStats), time each step of format(), see color_debug.instrumentation
+        # and get_stats(). Otherwise format() runs without any instrumentation code at all.
+        self.stats = None
+        if instrument:
+            self.stats = instrument if isinstance(instrument, FormatterStats) else FormatterStats()
+            instrument_formatter(self, self.stats)
+
+    def get_stats(self):
+        '''return a dict of the formatter's cache stats, plus its timings if instrumented
+
+        See FormatterStats.snapshot() for the timings.'''
+        caches = self.color_mapper.get_stats()['caches']
+        if self.color_mapper.name_hierarchy is not None:
+            caches['name_hierarchy'] = self.color_mapper.name_hierarchy.stats()
+        caches['exc_text'] = self.exc_text_cache.stats()
+        if self.traceback_colorizer is not None:
+            caches['frame'] = self.traceback_colorizer.frame_cache.stats()
+
+        stats = {'caches': caches, 'instrumented': self.stats is not None}
+        if self.stats is not None:
+            stats.update(self.stats.snapshot())
+        return stats
 
     def __repr__(self):
-        buf = 'ColorFormatter(fmt="%s", datefmt="%s", auto_color=%s)' % (self._base_fmt,
-                                                                         self.datefmt,
-                                                                         self.color_mapper.auto_color)
+        buf = 'ColorFormatter(fmt="%s", datefmt="%s", auto_color=%s, style=%r)' % (self._base_fmt,
+                                                                                   self.datefmt,
+                                                                                   self.color_mapper.auto_color,
+                                                                                   self.style)
         return buf
 
-    def _pre_format(self, record):
+    # like logging.Formatter.formatTime, but only does the converter/strftime work once per second.
+    def formatTime(self, record, datefmt=None):
+        '''Return the creation time of record as a string, see logging.Formatter.formatTime()
+
+        The strftime() result depends only on the whole second record.created falls in, so it is
+        cached and reused for every record created in the same second; only msecs are spliced in.
+        The cache is keyed on the epoch second (not the local time) and the converter, so DST
+        changes and converter overrides get a new entry.'''
+        created = record.created
+        second = int(created // 1)
+        converter = self.converter
+
+        # a single tuple, so this is read (and replaced below) atomically across threads
+        cached_second, cached_datefmt, cached_converter, time_string = self._time_cache
+        if second != cached_second or datefmt != cached_datefmt or converter != cached_converter:
+            ct = converter(created)
+            time_string = time.strftime(datefmt or getattr(self, 'default_time_format', '%Y-%m-%d %H:%M:%S'), ct)
+            self._time_cache = (second, datefmt, converter, time_string)
+
+        if datefmt:
+            return time_string
+
+        default_msec_format = getattr(self, 'default_msec_format', '%s,%03d')
+        if default_msec_format:
+            return default_msec_format % (time_string, record.msecs)
+        return time_string
+
+    def formatException(self, ei):
+        '''Return the traceback text for exc_info ei, see logging.Formatter.formatException()
+
+        Code that logs the same exception from the same place over and over (a retry loop for
+        ex) would render the same traceback every time, so the text is cached by
+        exception_cache_key(). See exc_text_cache.stats() for hit rates.'''
+        if self.exc_text_cache.maxsize <= 0:
+            return logging.Formatter.formatException(self, ei)
+
+        key = exception_cache_key(ei)
+        try:
+            exc_text = self.exc_text_cache.get(key) if key is not None else None
+        except TypeError:
+            # an unhashable exception message or type
+            key = None
+            exc_text = None
+
+        if exc_text is None:
+            exc_text = logging.Formatter.formatException(self, ei)
+            if key is not None:
+                self.exc_text_cache.set(key, exc_text)
+        return exc_text
+
+    def _pre_format_attrs(self, record):
         '''render time and exception info to be a string
 
-        Modifies record by side effect.'''
-        # import pprint
-        # pprint.pprint(record.__dict__)
+        Returns a dict of the rendered record attributes.'''
+        attrs = {'exc_text_sep': '\n'}
         if self.usesTime():
-            record.asctime = self.formatTime(record, self.datefmt)
+            attrs['asctime'] = self.formatTime(record, self.datefmt)
+
+        if record.exc_info and not record.exc_text and self.traceback_colorizer is None:
+            attrs['exc_text'] = self.formatException(record.exc_info)
+        return attrs
+
+    def _pre_format(self, record):
+        '''render time and exception info to be a string
 
-        record.exc_text_sep = '\n'
-        # record.exc_text = ''
-        if record.exc_info and not record.exc_text:
-            record.exc_text = self.formatException(record.exc_info)
-            record.exc_text_sep = '\n'
+        Modifies record by side effect.'''
+        record.__dict__.update(self._pre_format_attrs(record))
 
     def _format_exception(self, record, colors, exc_text):
-        exc_text_post = '%(exc_text_sep)s%(_cdl_exc_text)s%(exc_text)s%(_cdl_reset)s%(exc_text_sep)s' % record.__dict__
+        exc_text_post = '%s%s%s%s%s' % (record.exc_text_sep, colors['_cdl_exc_text'], exc_text,
+                                        colors['_cdl_reset'], record.exc_text_sep)
 
         return exc_text_post
 
+    def _format_traceback(self, record, colors):
+        '''return the colored exc_text and stack_info to append to the formatted record, or '''''
+        exc_color = colors['_cdl_exc_text']
+        colorizer = self.traceback_colorizer
+        exc_text = record.exc_text
+        if colorizer is not None:
+            if exc_text:
+                exc_text = colorizer.colorize_text(exc_text, exc_color)
+            elif record.exc_info:
+                exc_text = colorizer.format_exception(record.exc_info, exc_color)
+
+        parts = []
+        if exc_text:
+            parts.append(self._format_exception(record, colors, exc_text))
+
+        stack_info = record.stack_info
+        if stack_info:
+            if colorizer is not None:
+                stack_info = colorizer.colorize_text(stack_info, exc_color)
+            if not parts:
+                parts.append(record.exc_text_sep)
+            parts.append('%s%s%s' % (exc_color, stack_info, colors['_cdl_reset']))
+        return ''.join(parts)
+
+    def format_plain(self, record):
+        '''format record with the original fmt and no colors at all'''
+        return logging.Formatter.format(self, record)
+
     def format(self, record):
+        if not self.use_color:
+            return self.format_plain(record)
+
+        if not self.mutate_record:
+            return self._format_overlay(record)
+
         self._pre_format(record)
         # for py3.2+ compat
         record = add_default_record_attrs(record, ['stack_info'])
@@ -535,11 +1138,11 @@ class ColorFormatter(logging.Formatter):
             setattr(record, 'stack_depth', '')
         colors = self.color_mapper.get_colors_for_record(record)
         # pprint.pprint(colors)
-        _apply_colors_to_record(record, colors)
+        self._apply_colors(record, colors)
 
         s = self._format(record)
-        if getattr(record, 'exc_text', None):
-            s = s + self._format_exception(record, colors, record.exc_text)
+        if record.exc_text or record.exc_info or record.stack_info:
+            s = s + self._format_traceback(record, colors)
         return s
 
     # format is based on from stdlib python logging.LogFormatter.format()
@@ -548,15 +1151,53 @@ class ColorFormatter(logging.Formatter):
     def _format(self, record):
 
         record.message = record.getMessage()
-        s = self.color_fmt % record.__dict__
+        s = self._render(record.__dict__)
         return s
 
+    def _format_overlay(self, record):
+        '''format() without modifying record, see RecordOverlay'''
+        overlay = self._pre_format_attrs(record)
+        # for py3.2+ compat
+        if not hasattr(record, 'stack_info'):
+            overlay['stack_info'] = None
+        if not hasattr(record, 'stack_depth'):
+            overlay['stack_depth'] = ''
+
+        record_view = RecordOverlay(record.__dict__, overlay)
+        colors = self.color_mapper.get_colors_for_record(record_view)
+        overlay.update(colors)
+
+        overlay['message'] = record.getMessage()
+        s = self._render(record_view)
+
+        if record_view.exc_text or record_view.exc_info or record_view.stack_info:
+            s = s + self._format_traceback(record_view, colors)
+        return s
+
+
+def stream_supports_color(stream, environ=None):
+    '''Should output to stream be colored?
+
+    False if NO_COLOR is set (to anything but ''), TERM is 'dumb', or stream is not a tty.'''
+    environ = os.environ if environ is None else environ
+    if environ.get('NO_COLOR'):
+        return False
+    if environ.get('TERM') == 'dumb':
+        return False
+    isatty = getattr(stream, 'isatty', None)
+    try:
+        return bool(isatty and isatty())
+    except ValueError:
+        # closed stream
+        return False
+
 
 def _get_handler():
     # %(asctime)s tid:%(thread)d
     # fmt = u'\033[33m**: tname:%(threadName)s @%(filename)s:%(lineno)d - %(message)s\033[0m'
     # fmt = u': tname:%(threadName)s @%(filename)s:%(lineno)d - %(message)s'
-    handler = logging.StreamHandler()
+    from .handlers import ColorStreamHandler
+    handler = ColorStreamHandler()
     handler.setFormatter(ColorFormatter())
     # handler.setFormatter(logging.Formatter(fmt))
     handler.setLevel(logging.DEBUG)
@@ -0,0 +1,322 @@
+'''Colorize existing plain text log files.
+
+Log lines written with a %-style format (DEFAULT_FORMAT by default) are parsed back into
+record attributes with a regex built from the format string, the attributes are run through
+TermColorMapper, and the line is written back out with the same color escapes ColorFormatter
+would have used. Lines that don't match the format (tracebacks, multi line messages) are
+colored like the exc_text of the record before them.
+
+Input is read in large blocks (not line by line), so memory use is constant no matter how
+big the file is. See color_debug.__main__ for the command line interface.
+'''
+
+import collections
+import logging
+import multiprocessing
+import os
+import re
+import time
+import zlib
+
+from .color_debug import DEFAULT_FORMAT, TermColorMapper, find_format_attrs
+from .formats import FormatField, literal_text, parse_format_string
+from .handlers import record_from_dict
+
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+DEFAULT_FOLLOW_INTERVAL = 0.25
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# attrs that never have spaces in them, a tighter pattern keeps the regex from backtracking so much
+_NO_SPACE_ATTRS = set(['name', 'funcName', 'filename', 'module', 'pathname', 'levelname', 'processName'])
+
+_LEVEL_NAMES = ['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL', 'TRACE', 'SUBDEBUG', 'SUBWARNING']
+
+
+def _value_pattern(field):
+    conversion = field.conversion
+    if conversion in 'diu':
+        return r'-?\d+'
+    if conversion in 'oxX':
+        return r'-?[0-9a-fA-F]+'
+    if conversion in 'eEfFgG':
+        return r'[-+]?(?:[\d.]+(?:[eE][-+]?\d+)?|inf|nan)'
+    if field.precision is not None:
+        # a precision truncates strings, '%(levelname)-0.1s' is exactly one char for ex
+        return r'.{0,%d}' % field.precision
+    if field.attr_name in _NO_SPACE_ATTRS:
+        return r'\S*'
+    return r'.*?'
+
+
+def format_string_to_regex(format_string):
+    '''Build a regex that matches lines logged with format_string
+
+    Returns (compiled regex, list of (attr name, spec) tuples). Group 'g<N>' matches the N'th attr
+    in the format string, including any padding.'''
+    parts = []
+    attrs = []
+    for token in parse_format_string(format_string).tokens:
+        if not isinstance(token, FormatField):
+            parts.append(re.escape(literal_text(token)))
+            continue
+
+        value = _value_pattern(token)
+        if token.width and '-' in token.flags:
+            value = '%s *' % value
+        elif token.width:
+            value = ' *%s' % value
+        parts.append('(?P<g%d>%s)' % (len(attrs), value))
+        attrs.append((token.attr_name, token.spec))
+
+    return re.compile('^%s$' % ''.join(parts)), attrs
+
+
+def _levelname(value):
+    '''return the full levelname for a truncated one, ie 'D' is DEBUG'''
+    if value in _LEVEL_NAMES or not value:
+        return value
+    for levelname in _LEVEL_NAMES:
+        if levelname.startswith(value):
+            return levelname
+    return value
+
+
+def _stable_id(value):
+    return zlib.crc32(value.encode('utf-8')) & 0xffffffff
+
+
+class LogLineColorizer(object):
+    '''Add ColorFormatter style colors to plain log lines
+
+    The options are the same as ColorFormatter's. fmt is the format string the lines were logged with.'''
+
+    def __init__(self, fmt=None, default_color_by_attr=None, color_groups=None,
+                 auto_color=False, palette=None, hierarchical_names=False):
+        # so worker processes can build the same colorizer, see colorize_file_parallel()
+        self.options = {'fmt': fmt, 'default_color_by_attr': default_color_by_attr,
+                        'color_groups': color_groups, 'auto_color': auto_color, 'palette': palette,
+                        'hierarchical_names': hierarchical_names}
+        self.fmt = fmt or DEFAULT_FORMAT
+        self.line_re, self.attrs = format_string_to_regex(self.fmt)
+        self.color_mapper = TermColorMapper(fmt=self.fmt,
+                                            default_color_by_attr=default_color_by_attr,
+                                            color_groups=color_groups or [],
+                                            format_attrs=find_format_attrs(self.fmt),
+                                            auto_color=auto_color,
+                                            palette=palette,
+                                            hierarchical_names=hierarchical_names)
+        self._reset = self.color_mapper.palette.escapes[self.color_mapper.RESET_SEQ_IDX]
+        # the exc_text color of the last record, for coloring continuation lines
+        self._continuation_color = None
+
+    def reset(self):
+        '''forget the last record, ie before colorizing unrelated lines'''
+        self._continuation_color = None
+
+    def is_record_start(self, line):
+        '''is line (bytes) the first line of a record, as opposed to a continuation line'''
+        return self.line_re.match(_decode(line.rstrip(b'\r\n'))) is not None
+
+    def parse_line(self, line):
+        '''return (LogRecord with the attrs parsed from line, regex match), or (None, None) if line doesn't match'''
+        match = self.line_re.match(line)
+        if not match:
+            return None, None
+
+        record_dict = {'exc_text': None, 'exc_info': None, 'args': None, 'stack_info': None}
+        for idx, (attr_name, spec) in enumerate(self.attrs):
+            value = match.group('g%d' % idx).strip()
+            conversion = spec[-1]
+            try:
+                if conversion in 'diu':
+                    value = int(value)
+                elif conversion in 'eEfFgG':
+                    value = float(value)
+            except ValueError:
+                pass
+            record_dict[attr_name] = value
+
+        if 'message' in record_dict:
+            record_dict['msg'] = record_dict['message']
+        record_dict['levelname'] = _levelname(record_dict.get('levelname', ''))
+        record_dict.setdefault('levelno', logging.getLevelName(record_dict['levelname']))
+
+        # attrs the color mapper needs but the format may not have, derived from what it does have
+        record_dict.setdefault('name', '')
+        record_dict.setdefault('processName', 'MainProcess')
+        record_dict.setdefault('process', _stable_id(record_dict['processName']))
+        record_dict.setdefault('threadName', 'MainThread')
+        record_dict.setdefault('thread', _stable_id(str(record_dict['threadName'])))
+        return record_from_dict(record_dict), match
+
+    def colorize_line(self, line):
+        '''return line with color escapes added (line does not include the line ending)'''
+        record, match = self.parse_line(line)
+        if record is None:
+            if self._continuation_color is None:
+                return line
+            return '%s%s%s' % (self._continuation_color, line, self._reset)
+
+        try:
+            colors = self.color_mapper.get_colors_for_record(record)
+        except AttributeError:
+            # a color group for an attr the format doesn't have
+            return line
+        self._continuation_color = colors['_cdl_exc_text']
+
+        parts = [colors['_cdl_default']]
+        pos = 0
+        unset = colors['_cdl_unset']
+        for idx, (attr_name, spec) in enumerate(self.attrs):
+            start, end = match.span('g%d' % idx)
+            parts.append(line[pos:start])
+            parts.append(colors['_cdl_%s' % attr_name])
+            parts.append(line[start:end])
+            parts.append(unset)
+            pos = end
+        parts.append(line[pos:])
+        parts.append(colors['_cdl_reset'])
+        return ''.join(parts)
+
+    def colorize_lines(self, data):
+        '''colorize a str of complete lines, keeping the line endings'''
+        lines = data.split('\n')
+        # data ends with a '\n', so the last item is ''
+        last = lines.pop()
+        colorize_line = self.colorize_line
+        colored = []
+        for line in lines:
+            if line.endswith('\r'):
+                colored.append(colorize_line(line[:-1]) + '\r')
+            else:
+                colored.append(colorize_line(line))
+        colored.append(last and colorize_line(last))
+        return '\n'.join(colored)
+
+
+def _decode(data):
+    return data.decode('utf-8', 'surrogateescape')
+
+
+def _encode(text):
+    return text.encode('utf-8', 'surrogateescape')
+
+
+def iter_blocks(fileobj, block_size=DEFAULT_BLOCK_SIZE, follow=False, follow_interval=DEFAULT_FOLLOW_INTERVAL):
+    '''yield bytes chunks of fileobj that each end at a line boundary
+
+    Reads block_size bytes at a time, so memory use is about block_size plus the longest line.
+    With follow, keep waiting for more data at EOF (like 'tail -f'), starting over if the file
+    is truncated.'''
+    pending = b''
+    while True:
+        block = fileobj.read(block_size)
+        if not block:
+            if not follow:
+                break
+            try:
+                if os.fstat(fileobj.fileno()).st_size < fileobj.tell():
+                    # truncated (logrotate copytruncate for ex), start from the top
+                    fileobj.seek(0)
+                    pending = b''
+            except (AttributeError, IOError, OSError, ValueError):
+                pass
+            time.sleep(follow_interval)
+            continue
+
+        data = pending + block
+        line_end = data.rfind(b'\n')
+        if line_end == -1:
+            pending = data
+            continue
+        pending = data[line_end + 1:]
+        yield data[:line_end + 1]
+
+    if pending:
+        yield pending
+
+
+def colorize_stream(infile, outfile, colorizer, block_size=DEFAULT_BLOCK_SIZE, follow=False,
+                    follow_interval=DEFAULT_FOLLOW_INTERVAL):
+    '''read plain log lines from binary infile and write them colorized to binary outfile'''
+    for chunk in iter_blocks(infile, block_size=block_size, follow=follow, follow_interval=follow_interval):
+        outfile.write(_encode(colorizer.colorize_lines(_decode(chunk))))
+        if follow:
+            outfile.flush()
+    outfile.flush()
+
+
+def find_chunk_boundaries(fileobj, size, colorizer, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''return a list of offsets splitting fileobj into chunks of about chunk_size bytes
+
+    Every chunk but the first starts at the first line of a record, so continuation lines
+    (tracebacks, etc) are colorized in the same chunk as their record.'''
+    boundaries = [0]
+    pos = chunk_size
+    while pos < size:
+        fileobj.seek(pos)
+        # finish the line pos is in the middle of
+        start = pos + len(fileobj.readline())
+        while start < size:
+            line = fileobj.readline()
+            if colorizer.is_record_start(line):
+                break
+            start += len(line)
+        if start >= size:
+            break
+        boundaries.append(start)
+        pos = start + chunk_size
+    boundaries.append(size)
+    return boundaries
+
+
+# one colorizer per worker process, keyed by its options
+_worker_colorizers = {}
+
+
+def _colorize_chunk(task):
+    path, start, end, options = task
+    key = repr(sorted(options.items()))
+    colorizer = _worker_colorizers.get(key)
+    if colorizer is None:
+        colorizer = _worker_colorizers[key] = LogLineColorizer(**options)
+    colorizer.reset()
+
+    with open(path, 'rb') as infile:
+        infile.seek(start)
+        data = infile.read(end - start)
+    return _encode(colorizer.colorize_lines(_decode(data)))
+
+
+def colorize_file_parallel(path, outfile, colorizer, jobs=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    '''colorize the file at path into binary outfile using a pool of jobs worker processes
+
+    The file is split into chunks at record boundaries (see find_chunk_boundaries()), the chunks
+    are colorized in parallel and written out in order. Colors only depend on the content of each
+    record, so the output is byte for byte the same as colorize_stream(). At most 2 chunks per
+    worker are in flight at a time, so memory use stays bounded.'''
+    jobs = jobs or multiprocessing.cpu_count()
+    with open(path, 'rb') as infile:
+        size = os.fstat(infile.fileno()).st_size
+        boundaries = find_chunk_boundaries(infile, size, colorizer, chunk_size=chunk_size)
+
+    tasks = [(path, start, end, colorizer.options) for start, end in zip(boundaries, boundaries[1:])]
+    if jobs == 1 or len(tasks) <= 1:
+        for task in tasks:
+            outfile.write(_colorize_chunk(task))
+        outfile.flush()
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        pending = collections.deque()
+        for task in tasks:
+            pending.append(pool.apply_async(_colorize_chunk, (task,)))
+            if len(pending) >= jobs * 2:
+                outfile.write(pending.popleft().get())
+        while pending:
+            outfile.write(pending.popleft().get())
+        outfile.flush()
+    finally:
+        pool.terminate()
+        pool.join()
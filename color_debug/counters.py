@@ -0,0 +1,99 @@
+'''Counters kept per thread and summed over all threads on request.
+
+Counting on a hot path shouldn't take a lock. PerThreadCounters gives each thread its own
+counters object (made by a factory, a ThreadCounted subclass) that only that thread ever
+modifies, and registers it in a WeakSet so totals() can sum the counters of every thread.
+
+When a thread exits, threading.local drops its counters object and ThreadCounted.__del__
+adds its counters to one retired total. So short lived threads don't pile up objects in the
+WeakSet, and their counts aren't lost from totals().
+
+The counters are the attributes named in fields, each a number or a dict of numbers.
+ThreadLocalLRUCache (hits/misses/evictions) and FormatterStats (phase counts and times) use it.
+'''
+
+import threading
+import weakref
+
+
+def _sum(values):
+    '''sum numbers, or dicts of numbers key by key'''
+    if isinstance(values[0], dict):
+        return dict((key, sum(value[key] for value in values)) for key in values[0])
+    return sum(values)
+
+
+class ThreadCounted(object):
+    '''Base class for the per thread counters objects of a PerThreadCounters.
+
+    Added to the retired total when collected, ie when its thread has exited.'''
+
+    retired = False
+    _retired_total = None
+
+    def __del__(self):
+        if self._retired_total is not None:
+            self._retired_total.add(self)
+
+
+class _RetiredTotal(object):
+    '''the summed counters of threads that have exited'''
+
+    def __init__(self, fields, total):
+        # __del__ can run on any thread whenever the gc does, including on a thread that
+        # already holds the lock in totals()
+        self.lock = threading.RLock()
+        self.fields = fields
+        self.total = total
+
+    def add(self, counted):
+        with self.lock:
+            if counted.retired:
+                return
+            for field in self.fields:
+                setattr(self.total, field, _sum([getattr(self.total, field), getattr(counted, field)]))
+            # it may still be in the WeakSet for a moment, don't count it twice
+            counted.retired = True
+
+
+class PerThreadCounters(object):
+    '''A counters object per thread, made by factory() and summed over fields by totals().
+
+    get() returns the calling thread's object, only taking a lock the first time a thread
+    calls it. Hot paths can skip the method call with local.counters, falling back to get()
+    on AttributeError. To reset the counters, replace the whole PerThreadCounters.'''
+
+    def __init__(self, factory, fields):
+        self.factory = factory
+        self.fields = tuple(fields)
+        self.local = threading.local()
+        self._lock = threading.Lock()
+        self._counted = weakref.WeakSet()
+        self._retired = _RetiredTotal(self.fields, factory())
+
+    def get(self):
+        try:
+            return self.local.counters
+        except AttributeError:
+            pass
+        counted = self.factory()
+        counted._retired_total = self._retired
+        with self._lock:
+            self._counted.add(counted)
+        self.local.counters = counted
+        return counted
+
+    def _registered(self):
+        with self._lock:
+            return list(self._counted)
+
+    def live(self):
+        '''the counters objects of threads that haven't exited'''
+        return [counted for counted in self._registered() if not counted.retired]
+
+    def totals(self):
+        '''return a dict of each field summed over all threads, including exited ones'''
+        registered = self._registered()
+        with self._retired.lock:
+            counted = [counted for counted in registered if not counted.retired] + [self._retired.total]
+            return dict((field, _sum([getattr(obj, field) for obj in counted])) for field in self.fields)
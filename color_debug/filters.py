@@ -0,0 +1,219 @@
+'''Sample and rate limit records before they are formatted.
+
+A SamplingFilter on a logger (or on the handler in front of a ColorFormatter) drops excess
+records before any formatting or color work happens. Rules pick records by logger name prefix
+and level, and either keep a fraction of them (ratio), cap them with a token bucket (rate
+records per second, with bursts of up to burst records), or both.
+
+The rule for a (logger name, levelno) is resolved once and cached, so deciding is a dict lookup
+plus a little arithmetic; no clock calls (record.created is the time), no locks and no random
+numbers. Under heavy concurrent logging the counts can be off by a few records, since threads
+update the counters without a lock.
+
+Every summary_interval seconds, a summary record is logged to summary_logger for each rule
+that dropped records, so it is clear how much was left out. Summary records have a
+sampling_summary attr and are never dropped by the filter. The summaries are logged by the
+filter as records arrive, so the drops since the last one are summarized by flush() or
+close(), which is done for every open SamplingFilter at interpreter exit.
+
+For ex, keep 1% of DEBUG from 'noisy.subsystem', and at most 50 INFO or lower records per
+second (bursts of 200) from everything else:
+
+    sampling_filter = SamplingFilter([SamplingRule('noisy.subsystem', level=logging.DEBUG, ratio=0.01),
+                                      SamplingRule('', level=logging.INFO, rate=50, burst=200)])
+    handler.addFilter(sampling_filter)
+'''
+
+import atexit
+import logging
+import time
+import weakref
+
+DEFAULT_SUMMARY_INTERVAL = 10.0
+DEFAULT_SUMMARY_LOGGER = 'color_debug.sampling'
+DEFAULT_DECISION_CACHE_SIZE = 4096
+
+# a credit this close to 1 is 1, so adding up ratio=0.1 ten times keeps a record
+_FULL_CREDIT = 1 - 1e-9
+
+
+_sampling_filters = weakref.WeakSet()
+
+
+def _flush_sampling_filters():
+    for sampling_filter in list(_sampling_filters):
+        sampling_filter.flush()
+
+
+# registered after logging's own atexit hook, so it runs first, while handlers are still open
+atexit.register(_flush_sampling_filters)
+
+
+class SamplingRule(object):
+    '''Which records to sample, and how
+
+    Applies to records from the logger named prefix and its children ('' is every logger) with
+    a levelno of level or lower. ratio is the fraction of those records kept. rate (records per
+    second) and burst (records, rate or 1 if that is more by default) make a token bucket on top
+    of that, None for no cap.'''
+
+    def __init__(self, prefix='', level=logging.DEBUG, ratio=1.0, rate=None, burst=None):
+        if not 0 <= ratio <= 1:
+            raise ValueError('ratio must be between 0 and 1, not %r' % (ratio,))
+        if rate is not None and rate <= 0:
+            raise ValueError('rate must be > 0, not %r' % (rate,))
+        if burst is not None and burst < 1:
+            # the bucket could never hold the 1 token a record needs
+            raise ValueError('burst must be >= 1, not %r' % (burst,))
+        self.prefix = prefix
+        self.level = level
+        self.ratio = ratio
+        self.rate = rate
+        if burst is None and rate is not None:
+            burst = max(1, rate)
+        self.burst = burst
+
+    def matches(self, name, levelno):
+        return levelno <= self.level and (not self.prefix or name == self.prefix or
+                                          name.startswith(self.prefix + '.'))
+
+    def __repr__(self):
+        return 'SamplingRule(%r, level=%s, ratio=%r, rate=%r, burst=%r)' % (
+            self.prefix, logging.getLevelName(self.level), self.ratio, self.rate, self.burst)
+
+
+class _RuleState(object):
+    '''the counters and token bucket of one rule'''
+    __slots__ = ('rule', 'ratio', 'rate', 'burst', 'credit', 'tokens', 'last', 'seen', 'dropped',
+                 'total_seen', 'total_dropped')
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.ratio = rule.ratio
+        self.rate = rule.rate
+        self.burst = rule.burst
+        self.credit = 0.0
+        self.tokens = rule.burst
+        self.last = None
+        # since the last summary
+        self.seen = 0
+        self.dropped = 0
+        # before the last summary
+        self.total_seen = 0
+        self.total_dropped = 0
+
+    def reset_counts(self):
+        '''return (seen, dropped) since the last call, and add them to the totals'''
+        seen, dropped = self.seen, self.dropped
+        self.seen = self.dropped = 0
+        self.total_seen += seen
+        self.total_dropped += dropped
+        return seen, dropped
+
+    def allow(self, created):
+        self.seen += 1
+        if self.ratio < 1:
+            # keep exactly ratio of the records, evenly spread
+            self.credit += self.ratio
+            if self.credit < _FULL_CREDIT:
+                self.dropped += 1
+                return False
+            self.credit -= 1
+
+        if self.rate is not None:
+            last = self.last
+            self.last = created
+            if last is not None and created > last:
+                self.tokens = min(self.burst, self.tokens + (created - last) * self.rate)
+            if self.tokens < 1:
+                self.dropped += 1
+                return False
+            self.tokens -= 1
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    '''Drop records by SamplingRule, see the module docs.
+
+    The rule with the longest matching prefix wins, then the one with the lowest level.
+    Records no rule matches are always kept.'''
+
+    def __init__(self, rules, summary_interval=DEFAULT_SUMMARY_INTERVAL, summary_logger=None,
+                 summary_level=logging.INFO):
+        logging.Filter.__init__(self)
+        self.rules = sorted(rules, key=lambda rule: (-len(rule.prefix), rule.level))
+        self._states = [_RuleState(rule) for rule in self.rules]
+        # (name, levelno) -> _RuleState, or None if no rule applies
+        self._decisions = {}
+
+        self.summary_interval = summary_interval
+        self.summary_logger = summary_logger or logging.getLogger(DEFAULT_SUMMARY_LOGGER)
+        self.summary_level = summary_level
+        # the first record starts the first interval
+        self._next_summary = 0.0 if summary_interval else float('inf')
+        self._last_summary = None
+        self._summarizing = False
+        if summary_interval:
+            _sampling_filters.add(self)
+
+    def _resolve(self, name, levelno):
+        if name == self.summary_logger.name:
+            return None
+        for state in self._states:
+            if state.rule.matches(name, levelno):
+                return state
+        return None
+
+    def filter(self, record):
+        try:
+            state = self._decisions[(record.name, record.levelno)]
+        except KeyError:
+            if len(self._decisions) >= DEFAULT_DECISION_CACHE_SIZE:
+                self._decisions = {}
+            state = self._decisions[(record.name, record.levelno)] = self._resolve(record.name, record.levelno)
+
+        created = record.created
+        if created >= self._next_summary:
+            self._summarize(created)
+
+        return state is None or state.allow(created)
+
+    def _summarize(self, now):
+        if self._last_summary is None:
+            self._last_summary = now
+            self._next_summary = now + self.summary_interval
+            return
+        if self._summarizing:
+            return
+
+        self._summarizing = True
+        try:
+            elapsed = now - self._last_summary
+            self._last_summary = now
+            self._next_summary = now + self.summary_interval
+            for state in self._states:
+                seen, dropped = state.reset_counts()
+                if dropped:
+                    self.summary_logger.log(self.summary_level,
+                                            'sampled out %d of %d records from %r (%s and below) in the last %.1f seconds',
+                                            dropped, seen, state.rule.prefix or 'all loggers',
+                                            logging.getLevelName(state.rule.level), elapsed,
+                                            extra={'sampling_summary': True, 'sampled_out': dropped})
+        finally:
+            self._summarizing = False
+
+    def flush(self):
+        '''log the summary of the records dropped since the last one now, instead of on a later record'''
+        if self._last_summary is not None:
+            self._summarize(max(time.time(), self._last_summary))
+
+    def close(self):
+        '''flush(), and stop flushing at exit'''
+        self.flush()
+        _sampling_filters.discard(self)
+
+    def stats(self):
+        '''return a list of {'rule': repr(rule), 'seen': ..., 'dropped': ...} since the filter was made'''
+        return [{'rule': repr(state.rule), 'seen': state.total_seen + state.seen,
+                 'dropped': state.total_dropped + state.dropped}
+                for state in self._states]
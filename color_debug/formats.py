@@ -0,0 +1,267 @@
+'''Parsing logging format strings.
+
+parse_format_string() splits a format string into literal text and FormatField specifiers.
+The style is the same as logging.Formatter's style arg. For '%' (the default), it follows the
+rules of the % operator with a mapping:
+
+    - '%%' is a literal '%'
+    - '%(key)' can have nested parens in the key, ie '%((a))s' is the key '(a)'
+    - then optional flags ('#0- +'), width, '.precision' and length modifier ('hlL')
+    - and one of the conversions 'diouxXeEfFgGcrsa'
+
+For '{' it follows str.format(), ie '{levelname:<8}' or '{name!r}', and for '$' it follows
+string.Template, ie '$name' or '${name}'.
+
+Parsing is cached process wide by format string, so every formatter (and every handler
+dictConfig creates) using the same format shares one parse.
+'''
+
+import collections
+import re
+import string
+
+CONVERSIONS = 'diouxXeEfFgGcrsa'
+FLAGS = '#0- +'
+LENGTH_MODIFIERS = 'hlL'
+
+STYLES = ('%', '{', '$')
+
+MAX_CACHED_FORMATS = 256
+
+# the str.format() format spec mini language, '[[fill]align][sign][z][#][0][width][grouping][.precision][type]'
+_BRACE_SPEC_RE = re.compile(r'(?P<flags>(?:.?[<>=^])?[-+ ]?z?#?0?)(?P<width>\d*)[,_]?(?:\.(?P<precision>\d+))?'
+                            r'(?P<type>[bcdeEfFgGnosxX%]?)$', re.DOTALL)
+
+# One '%(attr_name)<spec>' specifier.
+#
+#  text: the whole specifier as it appears in the format string, ie '%(process)-5d'
+#  attr_name: 'process'
+#  spec: everything after the key, ie '-5d'
+#  flags: '-', width: 5, precision: None, conversion: 'd'
+#
+# For '{' style, '{process!s:<5}' has a spec of '!s:<5' and flags of '<'. The conversion is the
+# format spec's type if it has one, or the '!' conversion. '$' style fields are always a plain 's'.
+FormatField = collections.namedtuple('FormatField',
+                                     ['text', 'attr_name', 'spec', 'flags', 'width', 'precision', 'conversion'])
+
+# tokens: the literal strings and FormatFields in order. Literals are as they appear in the format
+#         string, so '%%' is still '%%' (see literal_text())
+# fields: just the FormatFields
+# valid: False if there was a '%' that isn't '%%' or a specifier (it is left in a literal as is),
+#        the % operator would raise an error or do something odd with the format. For '{' and '$'
+#        style, anything str.format() or string.Template would complain about, or a field that
+#        isn't a plain record attr (ie '{0}' or '{a:{width}}'), and then tokens is just the format string.
+# style: '%', '{' or '$'
+ParsedFormat = collections.namedtuple('ParsedFormat', ['format_string', 'tokens', 'fields', 'valid', 'style'])
+
+_parsed_formats = {}
+
+
+def _parse_field(format_string, start):
+    '''return (FormatField, end) for the specifier at format_string[start] ('%'), or (None, None)'''
+    length = len(format_string)
+    pos = start + 1
+    if pos >= length or format_string[pos] != '(':
+        return None, None
+
+    depth = 1
+    pos += 1
+    while pos < length and depth:
+        char = format_string[pos]
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        pos += 1
+    if depth:
+        return None, None
+    attr_name = format_string[start + 2:pos - 1]
+    spec_start = pos
+
+    flags_start = pos
+    while pos < length and format_string[pos] in FLAGS:
+        pos += 1
+    flags = format_string[flags_start:pos]
+
+    width_start = pos
+    while pos < length and format_string[pos].isdigit():
+        pos += 1
+    width = int(format_string[width_start:pos]) if pos > width_start else None
+
+    precision = None
+    if pos < length and format_string[pos] == '.':
+        pos += 1
+        precision_start = pos
+        while pos < length and format_string[pos].isdigit():
+            pos += 1
+        # '%(a).s' is a precision of 0
+        precision = int(format_string[precision_start:pos] or 0)
+
+    if pos < length and format_string[pos] in LENGTH_MODIFIERS:
+        pos += 1
+
+    if pos >= length or format_string[pos] not in CONVERSIONS:
+        return None, None
+    conversion = format_string[pos]
+    pos += 1
+
+    return FormatField(text=format_string[start:pos], attr_name=attr_name, spec=format_string[spec_start:pos],
+                       flags=flags, width=width, precision=precision, conversion=conversion), pos
+
+
+def _tokenize(format_string):
+    tokens = []
+    fields = []
+    literal = []
+    valid = True
+    pos = 0
+    length = len(format_string)
+    while pos < length:
+        percent = format_string.find('%', pos)
+        if percent == -1:
+            literal.append(format_string[pos:])
+            break
+        literal.append(format_string[pos:percent])
+
+        if format_string.startswith('%%', percent):
+            literal.append('%%')
+            pos = percent + 2
+            continue
+
+        field, end = _parse_field(format_string, percent)
+        if field is None:
+            valid = False
+            literal.append('%')
+            pos = percent + 1
+            continue
+
+        if any(literal):
+            tokens.append(''.join(literal))
+        literal = []
+        tokens.append(field)
+        fields.append(field)
+        pos = end
+
+    if any(literal):
+        tokens.append(''.join(literal))
+    return ParsedFormat(format_string=format_string, tokens=tuple(tokens), fields=tuple(fields), valid=valid,
+                        style='%')
+
+
+def _append_literal(tokens, literal):
+    if not literal:
+        return
+    if tokens and not isinstance(tokens[-1], FormatField):
+        tokens[-1] += literal
+    else:
+        tokens.append(literal)
+
+
+def _invalid(format_string, style):
+    return ParsedFormat(format_string=format_string, tokens=(format_string,) if format_string else (),
+                        fields=(), valid=False, style=style)
+
+
+def _tokenize_brace(format_string):
+    tokens = []
+    fields = []
+    try:
+        parts = list(string.Formatter().parse(format_string))
+    except ValueError:
+        # unmatched braces and such
+        return _invalid(format_string, '{')
+
+    for literal, field_name, format_spec, conversion in parts:
+        # back to how it looks in the format string
+        _append_literal(tokens, literal.replace('{', '{{').replace('}', '}}'))
+        if field_name is None:
+            continue
+
+        attr_name = re.match(r'[^.[]*', field_name).group(0)
+        spec_match = _BRACE_SPEC_RE.match(format_spec or '')
+        if not attr_name or attr_name.isdigit() or '{' in (format_spec or '') or spec_match is None:
+            # positional, or a nested field in the spec
+            return _invalid(format_string, '{')
+
+        spec = field_name[len(attr_name):]
+        if conversion:
+            spec += '!' + conversion
+        if format_spec:
+            spec += ':' + format_spec
+        precision = spec_match.group('precision')
+        field = FormatField(text='{%s%s}' % (attr_name, spec), attr_name=attr_name, spec=spec,
+                            flags=spec_match.group('flags'),
+                            width=int(spec_match.group('width')) if spec_match.group('width') else None,
+                            precision=int(precision) if precision is not None else None,
+                            conversion=spec_match.group('type') or conversion or 's')
+        tokens.append(field)
+        fields.append(field)
+
+    return ParsedFormat(format_string=format_string, tokens=tuple(tokens), fields=tuple(fields), valid=True,
+                        style='{')
+
+
+def _tokenize_dollar(format_string):
+    tokens = []
+    fields = []
+    pos = 0
+    for match in string.Template.pattern.finditer(format_string):
+        attr_name = match.group('named') or match.group('braced')
+        if attr_name is None and match.group('escaped') is None:
+            # a '$' that isn't '$$' or a name
+            return _invalid(format_string, '$')
+
+        literal = format_string[pos:match.start()]
+        if attr_name is None:
+            literal += match.group(0)
+        _append_literal(tokens, literal)
+        if attr_name is not None:
+            field = FormatField(text=match.group(0), attr_name=attr_name, spec='s', flags='', width=None,
+                                precision=None, conversion='s')
+            tokens.append(field)
+            fields.append(field)
+        pos = match.end()
+
+    _append_literal(tokens, format_string[pos:])
+    return ParsedFormat(format_string=format_string, tokens=tuple(tokens), fields=tuple(fields), valid=True,
+                        style='$')
+
+
+_TOKENIZERS = {'%': _tokenize, '{': _tokenize_brace, '$': _tokenize_dollar}
+
+
+def parse_format_string(format_string, style='%'):
+    '''return the ParsedFormat for format_string in style ('%', '{' or '$'), see the module docs'''
+    key = (format_string, style)
+    try:
+        return _parsed_formats[key]
+    except KeyError:
+        pass
+
+    try:
+        tokenize = _TOKENIZERS[style]
+    except KeyError:
+        raise ValueError('Style must be one of: %s' % ','.join(STYLES))
+    parsed = tokenize(format_string)
+    if len(_parsed_formats) >= MAX_CACHED_FORMATS:
+        _parsed_formats.clear()
+    _parsed_formats[key] = parsed
+    return parsed
+
+
+def literal_text(literal, style='%'):
+    '''return the text a literal token shows up as in formatted output'''
+    if style == '{':
+        return literal.replace('{{', '{').replace('}}', '}')
+    if style == '$':
+        return literal.replace('$$', '$')
+    return literal.replace('%%', '%')
+
+
+def placeholder(attr_name, style='%'):
+    '''return a plain '%(attr_name)s' reference to attr_name in style'''
+    if style == '{':
+        return '{%s}' % attr_name
+    if style == '$':
+        return '${%s}' % attr_name
+    return '%%(%s)s' % attr_name
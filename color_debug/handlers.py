@@ -0,0 +1,538 @@
+import atexit
+import collections
+import logging
+import sys
+import threading
+import time
+import weakref
+
+try:
+    import queue
+except ImportError:
+    # py2
+    import Queue as queue
+
+from .color_debug import ColorFormatter, stream_supports_color
+
+# What ColorQueueHandler does when the queue is full
+OVERFLOW_BLOCK = 'block'
+OVERFLOW_DROP_OLDEST = 'drop_oldest'
+OVERFLOW_DROP_NEW = 'drop_new'
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEW)
+
+DEFAULT_QUEUE_SIZE = 10000
+
+DEFAULT_BUFFER_SIZE = 64 * 1024
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_FLUSH_LEVEL = logging.ERROR
+
+DEFAULT_COLLAPSE_WINDOW = 5.0
+DEFAULT_COLLAPSE_MAX_KEYS = 1024
+
+
+def record_from_dict(record_dict):
+    '''Return a LogRecord using record_dict as its __dict__.
+
+    Skips LogRecord.__init__, it would just look up time/thread/process info that is about to be replaced.'''
+    record = logging.LogRecord.__new__(logging.LogRecord)
+    record.__dict__ = record_dict
+    return record
+
+
+# The record attributes copied by snapshot_record(). The message is copied already rendered
+# as 'msg' and exc_info as the rendered exc_text, like collector.WIRE_FIELDS.
+SNAPSHOT_FIELDS = ('name', 'levelno', 'levelname', 'pathname', 'filename', 'module', 'lineno', 'funcName',
+                   'created', 'msecs', 'relativeCreated', 'thread', 'threadName', 'processName', 'process',
+                   'msg', 'exc_text', 'stack_info')
+
+_exc_formatter = logging.Formatter()
+
+
+def snapshot_record(record, extra_fields=()):
+    '''Return a copy of record that is safe to format later on another thread.
+
+    Only the SNAPSHOT_FIELDS are copied, plus any extra_fields (attributes added with extra=
+    or by a filter). The message is rendered with the args now (they may be mutable or not
+    thread safe) and args are dropped. exc_info is rendered as exc_text now too, the traceback
+    and its frames are not kept alive until the record is formatted.'''
+    snapshot_dict = dict((field, getattr(record, field, None)) for field in SNAPSHOT_FIELDS)
+    snapshot_dict['msg'] = record.getMessage()
+    snapshot_dict['args'] = None
+    snapshot_dict['exc_info'] = None
+    if record.exc_info and not record.exc_text:
+        snapshot_dict['exc_text'] = _exc_formatter.formatException(record.exc_info)
+    for field in extra_fields:
+        snapshot_dict[field] = getattr(record, field, None)
+    return record_from_dict(snapshot_dict)
+
+
+class ColorQueueHandler(logging.Handler):
+    '''Put a snapshot of each record on a queue for a ColorQueueListener to format and write.
+
+    No formatting or color mapping happens on the logging thread. If the queue is bounded,
+    overflow decides what happens when it is full:
+
+        - 'block': wait for room (the default)
+        - 'drop_oldest': discard the oldest queued record to make room
+        - 'drop_new': discard the record being logged
+
+    Dropped records are counted in dropped_oldest/dropped_new. extra_fields are the names of
+    any record attributes beyond the standard ones to keep in the snapshot, see snapshot_record().
+
+    For ex:
+
+        log_queue = queue.Queue(maxsize=10000)
+        handler = ColorQueueHandler(log_queue, overflow='drop_oldest')
+        listener = ColorQueueListener(log_queue, stream=sys.stderr, formatter=ColorFormatter())
+        listener.start()
+        logging.getLogger().addHandler(handler)
+        ...
+        listener.stop()
+    '''
+
+    def __init__(self, log_queue, overflow=OVERFLOW_BLOCK, level=logging.NOTSET, extra_fields=()):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of %s, not %r' % (', '.join(OVERFLOW_POLICIES), overflow))
+
+        logging.Handler.__init__(self, level=level)
+        self.queue = log_queue
+        self.overflow = overflow
+        self.extra_fields = tuple(extra_fields)
+        self.dropped_oldest = 0
+        self.dropped_new = 0
+
+    @property
+    def dropped(self):
+        return self.dropped_oldest + self.dropped_new
+
+    def prepare(self, record):
+        return snapshot_record(record, self.extra_fields)
+
+    def enqueue(self, record):
+        if self.overflow == OVERFLOW_BLOCK:
+            self.queue.put(record)
+            return
+
+        if self.overflow == OVERFLOW_DROP_NEW:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped_new += 1
+            return
+
+        while True:
+            try:
+                self.queue.put_nowait(record)
+                return
+            except queue.Full:
+                pass
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                # the listener got to it first
+                continue
+            self.queue.task_done()
+            self.dropped_oldest += 1
+
+    def emit(self, record):
+        try:
+            self.enqueue(self.prepare(record))
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+def _format_for_stream(formatter, record, use_color):
+    if not use_color and isinstance(formatter, ColorFormatter):
+        return formatter.format_plain(record)
+    return formatter.format(record)
+
+
+class ColorStreamHandler(logging.StreamHandler):
+    '''A StreamHandler that only colors output if the stream can show it
+
+    Whether to color is decided once per stream (see stream_supports_color()) unless
+    use_color is given. If not, a ColorFormatter skips all color work and formats with
+    its original fmt. Uses a ColorFormatter unless another formatter is set.'''
+
+    def __init__(self, stream=None, use_color=None):
+        logging.StreamHandler.__init__(self, stream)
+        self.setFormatter(ColorFormatter())
+        self._use_color = use_color
+        self.use_color = stream_supports_color(self.stream) if use_color is None else use_color
+
+    def setStream(self, stream):
+        result = logging.StreamHandler.setStream(self, stream)
+        if self._use_color is None:
+            self.use_color = stream_supports_color(self.stream)
+        return result
+
+    def format(self, record):
+        return _format_for_stream(self.formatter or logging._defaultFormatter, record, self.use_color)
+
+
+class ColorQueueListener(object):
+    '''Format and write records from a ColorQueueHandler's queue on a background thread.
+
+    Records are formatted with formatter (a ColorFormatter by default) and written to stream.
+    The stream is flushed whenever the queue has been drained. Like ColorStreamHandler, output
+    is only colored if stream_supports_color(stream) unless use_color is given.'''
+
+    _sentinel = None
+    terminator = '\n'
+
+    def __init__(self, log_queue, stream=None, formatter=None, use_color=None):
+        self.queue = log_queue
+        self.stream = stream or sys.stderr
+        self.formatter = formatter or ColorFormatter()
+        self.use_color = stream_supports_color(self.stream) if use_color is None else use_color
+        self.handled = 0
+        self.errors = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._monitor, name='ColorQueueListener')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        '''Write out everything already queued and stop the background thread'''
+        if not self._thread:
+            return
+        self.queue.put(self._sentinel)
+        self._thread.join()
+        self._thread = None
+
+    def handle(self, record):
+        try:
+            self.stream.write(_format_for_stream(self.formatter, record, self.use_color) + self.terminator)
+            self.handled += 1
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.errors += 1
+            if logging.raiseExceptions:
+                import traceback
+                traceback.print_exc(file=sys.stderr)
+
+    def flush(self):
+        if hasattr(self.stream, 'flush'):
+            self.stream.flush()
+
+    def _monitor(self):
+        log_queue = self.queue
+        while True:
+            record = log_queue.get()
+            try:
+                if record is self._sentinel:
+                    self.flush()
+                    break
+                self.handle(record)
+                if log_queue.empty():
+                    self.flush()
+            finally:
+                log_queue.task_done()
+
+
+# every live BufferedColorStreamHandler, flushed by one atexit hook
+_buffered_handlers = weakref.WeakSet()
+
+
+def _flush_buffered_handlers():
+    for handler in list(_buffered_handlers):
+        handler.flush()
+
+
+atexit.register(_flush_buffered_handlers)
+
+
+def _run_flusher(handler_ref, pending, stopped):
+    '''The flusher thread of a BufferedColorStreamHandler.
+
+    Waits for a record to be buffered, then until the buffer is due to be written. Only holds
+    a weak reference to the handler between waits, so the handler can still be collected.'''
+    while True:
+        pending.wait()
+        if stopped.is_set():
+            return
+        handler = handler_ref()
+        if handler is None:
+            return
+        delay = handler._flush_if_due()
+        del handler
+        if delay:
+            stopped.wait(delay)
+
+
+class BufferedColorStreamHandler(ColorStreamHandler):
+    '''A StreamHandler that collects formatted records and writes them to the stream in one call.
+
+    The buffer is written and the stream flushed when any of these happen:
+
+        - buffer_size characters are buffered
+        - flush_interval seconds have passed since the first record was buffered
+        - a record of flush_level or higher is handled (ie, show an ERROR right away)
+        - flush() or close() is called, including by logging.shutdown() or at interpreter exit
+
+    flush_interval=None disables the timed flush. See ColorStreamHandler for use_color.
+    '''
+
+    def __init__(self, stream=None, buffer_size=DEFAULT_BUFFER_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, flush_level=DEFAULT_FLUSH_LEVEL,
+                 use_color=None):
+        ColorStreamHandler.__init__(self, stream, use_color=use_color)
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_level = flush_level
+
+        self._buffer = []
+        self._buffered = 0
+        # when the buffer is due to be written, and the first record buffered since the last write
+        self._flush_due = None
+        self._flush_record = None
+        # set while there is buffered output for the flusher thread to wait on, started with the first record
+        self._pending = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = None
+        # number of times the buffer was written to the stream
+        self.writes = 0
+
+        _buffered_handlers.add(self)
+
+    def emit(self, record):
+        try:
+            msg = self.format(record) + self.terminator
+            if not self._buffer and self.flush_interval:
+                self._flush_due = time.time() + self.flush_interval
+                self._flush_record = record
+            self._buffer.append(msg)
+            self._buffered += len(msg)
+
+            if self._buffered >= self.buffer_size or record.levelno >= self.flush_level:
+                self._write_buffer()
+            elif self.flush_interval and not self._pending.is_set():
+                if self._flusher is None:
+                    self._start_flusher()
+                self._pending.set()
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _start_flusher(self):
+        # the weakref callback wakes the flusher so it exits if the handler is collected without being closed
+        pending, stopped = self._pending, self._stopped
+
+        def collected(handler_ref):
+            stopped.set()
+            pending.set()
+
+        self._flusher = threading.Thread(target=_run_flusher, name='BufferedColorStreamHandler flusher',
+                                         args=(weakref.ref(self, collected), pending, stopped))
+        self._flusher.daemon = True
+        self._flusher.start()
+
+    def _write_buffer(self):
+        '''write out and flush the buffer, the handler lock must be held'''
+        self._pending.clear()
+        self._flush_due = None
+        self._flush_record = None
+
+        if not self._buffer:
+            return
+
+        data = ''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self.stream.write(data)
+        self.writes += 1
+        if hasattr(self.stream, 'flush'):
+            self.stream.flush()
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.stream:
+                self._write_buffer()
+        finally:
+            self.release()
+
+    def _flush_if_due(self):
+        '''Write the buffer if flush_interval is up, for the flusher thread.
+
+        Returns the seconds left until it is due, or None if it was written.'''
+        self.acquire()
+        try:
+            if self._flush_due is None:
+                return None
+            delay = self._flush_due - time.time()
+            if delay > 0:
+                return delay
+            record = self._flush_record
+            try:
+                if self.stream:
+                    self._write_buffer()
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception:
+                self.handleError(record)
+            return None
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            self.flush()
+            logging.StreamHandler.close(self)
+            _buffered_handlers.discard(self)
+            self._stopped.set()
+            self._pending.set()
+        finally:
+            self.release()
+
+
+class _Repeats(object):
+    __slots__ = ('start', 'count', 'last_record')
+
+    def __init__(self, start):
+        self.start = start
+        self.count = 0
+        self.last_record = None
+
+
+class DuplicateCollapsingHandler(logging.Handler):
+    '''Pass records on to target, collapsing repeats of a record into one summary record.
+
+    A record is a repeat if a record with the same logger name, level, funcName, lineno and msg
+    (the template, before args are applied) was passed on less than window seconds earlier.
+    Repeats are counted and dropped without being formatted or written. Once the window is up,
+    target gets one summary record: a copy of the last repeat with its message replaced by
+    'message repeated N times in the last S seconds: <message>', so it is colored like the
+    records it stands for. Its collapsed_count attr is N.
+
+    Recognizing a repeat is a tuple build and a dict lookup. At most max_keys call sites are
+    tracked; the least recently started one is summarized early to make room. Summaries are
+    sent by a timer when their window is up, or on flush() and close(). close() doesn't close
+    target.
+
+    For ex:
+
+        handler = DuplicateCollapsingHandler(ColorStreamHandler(sys.stderr), window=10)
+        logging.getLogger().addHandler(handler)
+    '''
+
+    def __init__(self, target, window=DEFAULT_COLLAPSE_WINDOW, max_keys=DEFAULT_COLLAPSE_MAX_KEYS,
+                 level=logging.NOTSET):
+        logging.Handler.__init__(self, level=level)
+        self.target = target
+        self.window = window
+        self.max_keys = max_keys
+        # key -> _Repeats, oldest window first
+        self._repeats = collections.OrderedDict()
+        self._timer = None
+        # number of records dropped as repeats, and summary records sent
+        self.collapsed = 0
+        self.summaries = 0
+
+    def setTarget(self, target):
+        self.acquire()
+        try:
+            self.target = target
+        finally:
+            self.release()
+
+    def emit(self, record):
+        try:
+            key = (record.name, record.levelno, record.funcName, record.lineno, record.msg)
+            repeats = self._repeats.get(key)
+        except TypeError:
+            # an unhashable msg, can't tell if it repeats
+            self.target.handle(record)
+            return
+
+        try:
+            created = record.created
+            if repeats is not None and created - repeats.start < self.window:
+                repeats.count += 1
+                repeats.last_record = record
+                self.collapsed += 1
+                self._schedule()
+                return
+
+            if repeats is not None:
+                del self._repeats[key]
+                self._send_summary(repeats)
+            self._send_expired(created)
+            self._repeats[key] = _Repeats(created)
+            while len(self._repeats) > self.max_keys:
+                self._send_summary(self._repeats.popitem(last=False)[1])
+
+            self.target.handle(record)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _schedule(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.window, self._on_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _on_timer(self):
+        self.acquire()
+        try:
+            self._timer = None
+            self._send_expired(time.time())
+            if any(repeats.count for repeats in self._repeats.values()):
+                self._schedule()
+        finally:
+            self.release()
+
+    def _send_expired(self, now):
+        '''summarize the call sites whose window ended before now, the handler lock must be held'''
+        expired = []
+        for key, repeats in self._repeats.items():
+            if now - repeats.start < self.window:
+                break
+            expired.append(key)
+        for key in expired:
+            self._send_summary(self._repeats.pop(key))
+
+    def _send_summary(self, repeats):
+        if not repeats.count:
+            return
+        record = repeats.last_record
+        summary_dict = record.__dict__.copy()
+        summary_dict.update({'msg': 'message repeated %d times in the last %.1f seconds: %s',
+                             'args': (repeats.count, record.created - repeats.start, record.getMessage()),
+                             'exc_info': None, 'exc_text': None, 'stack_info': None,
+                             'collapsed_count': repeats.count})
+        self.summaries += 1
+        self.target.handle(record_from_dict(summary_dict))
+
+    def flush(self):
+        '''send the summaries of all pending repeats and flush target'''
+        self.acquire()
+        try:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            repeats_list = list(self._repeats.values())
+            self._repeats.clear()
+            for repeats in repeats_list:
+                self._send_summary(repeats)
+            if self.target is not None:
+                self.target.flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            self.flush()
+            logging.Handler.close(self)
+        finally:
+            self.release()
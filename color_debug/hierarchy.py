@@ -0,0 +1,116 @@
+'''Related colors for related logger names.
+
+TermColorMapper.get_name_color() hashes the whole logger name, so 'foo.model' and 'foo.util'
+get unrelated colors. NameHierarchyColors derives a name's color from its dotted path instead:
+the top level package picks a hue in the xterm 6x6x6 color cube, and each level below nudges
+its parent's color to a nearby one. Everything from one package ends up in the same family of
+colors, while sibling loggers are still told apart.
+
+Names are resolved through a trie of the name parts, built as new names show up, and the
+resolved color of each full name is kept in a flat dict. After a name has been seen once, a
+lookup is a single dict hit. Colors only depend on the name, so every thread can share the
+same dict and trie without locking; two threads adding the same name just compute the same
+color.
+'''
+
+import zlib
+
+CUBE_OFFSET = 16
+CUBE_SIZE = 6
+
+DEFAULT_MAX_NAMES = 4096
+
+# top level hues: cube colors that are bright and saturated enough to read on a dark
+# background, and aren't close to gray.
+_HUES = tuple((r, g, b) for r in range(CUBE_SIZE) for g in range(CUBE_SIZE) for b in range(CUBE_SIZE)
+              if max(r, g, b) >= 3 and max(r, g, b) - min(r, g, b) >= 2)
+
+# how a sublogger's color can differ from its parent's, smallest changes first
+_NUDGES = tuple(sorted(((dr, dg, db) for dr in (-1, 0, 1) for dg in (-1, 0, 1) for db in (-1, 0, 1)
+                        if (dr, dg, db) != (0, 0, 0)),
+                       key=lambda nudge: sum(abs(delta) for delta in nudge)))
+
+
+def _stable_hash(text):
+    # not hash(), str hashes are randomized per process
+    return zlib.crc32(text.encode('utf-8', 'surrogateescape')) & 0xffffffff
+
+
+def _clamp(value):
+    return min(CUBE_SIZE - 1, max(0, value))
+
+
+def cube_color(rgb):
+    '''return the xterm 256 color number of 6x6x6 cube coordinates rgb'''
+    r, g, b = rgb
+    return CUBE_OFFSET + r * CUBE_SIZE * CUBE_SIZE + g * CUBE_SIZE + b
+
+
+def child_rgb(parent_rgb, part):
+    '''return the cube coordinates for a name part under a parent with parent_rgb'''
+    part_hash = _stable_hash(part)
+    # only the one step nudges (6 of them) and two step nudges (12), so children stay close
+    choices = _NUDGES[:18]
+    for idx in range(len(choices)):
+        nudge = choices[(part_hash + idx) % len(choices)]
+        rgb = tuple(_clamp(value + delta) for value, delta in zip(parent_rgb, nudge))
+        if rgb != parent_rgb and max(rgb) >= 2:
+            return rgb
+    return parent_rgb
+
+
+class _Node(object):
+    __slots__ = ('rgb', 'children')
+
+    def __init__(self, rgb):
+        self.rgb = rgb
+        self.children = {}
+
+
+class NameHierarchyColors(object):
+    '''Colors for dotted names, related by hierarchy, see the module docs
+
+    At most max_names full names are kept; past that the dict and trie are started over.'''
+
+    def __init__(self, max_names=DEFAULT_MAX_NAMES):
+        self.max_names = max_names
+        self._root = _Node(None)
+        # full name -> color number
+        self._colors = {}
+
+    def get_color(self, name):
+        '''return the xterm 256 color number for dotted name'''
+        try:
+            return self._colors[name]
+        except KeyError:
+            pass
+        except TypeError:
+            # not a str, nothing to split
+            return self._resolve('%s' % (name,))
+
+        if len(self._colors) >= self.max_names:
+            self._root = _Node(None)
+            self._colors = {}
+
+        color = self._colors[name] = self._resolve(name)
+        return color
+
+    def _resolve(self, name):
+        node = self._root
+        for part in ('%s' % (name,)).split('.'):
+            child = node.children.get(part)
+            if child is None:
+                if node.rgb is None:
+                    rgb = _HUES[_stable_hash(part) % len(_HUES)]
+                else:
+                    rgb = child_rgb(node.rgb, part)
+                # setdefault, in case another thread just added the same part
+                child = node.children.setdefault(part, _Node(rgb))
+            node = child
+        return cube_color(node.rgb)
+
+    def __len__(self):
+        return len(self._colors)
+
+    def stats(self):
+        return {'size': len(self._colors), 'maxsize': self.max_names}
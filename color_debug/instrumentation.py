@@ -0,0 +1,207 @@
+'''Opt-in timing and counters for ColorFormatter's hot path.
+
+ColorFormatter(instrument=True) wraps the steps of format() so each call is timed:
+
+    - 'pre_format': asctime and exc_text rendering (_pre_format_attrs(), includes formatException())
+    - 'get_colors': TermColorMapper.get_colors_for_record()
+    - 'apply_colors': setting the _cdl_* attrs on the record (not used with mutate_record=False)
+    - 'interpolate': the fmt % record interpolation
+    - 'exception': coloring the exc_text/stack_info block (and rendering the traceback with
+      color_frames=True), once per record that has one
+    - 'format': all of format()
+
+The phases other than 'format' don't overlap, so their shares of 'format' add up to at most 1.
+
+For each phase, FormatterStats keeps the call count and total time of every call, plus every
+sample_every'th timing in a bounded buffer for percentiles. It also counts the records
+formatted and the characters of output ('output_chars'). That is a count of characters, not
+bytes: format() returns text, and only the handler knows what encoding it is written in.
+Counters are per thread (summed by snapshot(), see counters.PerThreadCounters), so
+instrumenting doesn't add a lock to format(). The counters of threads that exit are folded
+into one total. Without instrument=True, none of this code runs.
+
+ColorFormatter.get_stats() combines these with the hit rates of the formatter's caches, and
+StatsDumper writes get_stats() out periodically. For ex:
+
+    formatter = ColorFormatter(instrument=True)
+    dumper = StatsDumper(formatter, interval=60, stream=open('logging_stats.jsonl', 'a'))
+    dumper.start()
+'''
+
+import collections
+import json
+import sys
+import threading
+import time
+
+from .counters import PerThreadCounters, ThreadCounted
+
+try:
+    clock = time.perf_counter
+except AttributeError:
+    # py2
+    clock = time.time
+
+PHASES = ('pre_format', 'get_colors', 'apply_colors', 'interpolate', 'exception', 'format')
+
+DEFAULT_SAMPLE_EVERY = 100
+DEFAULT_SAMPLE_SIZE = 1000
+DEFAULT_DUMP_INTERVAL = 60.0
+
+
+class _ThreadCounters(ThreadCounted):
+    '''one thread's counters, only ever modified by that thread'''
+
+    def __init__(self):
+        self.counts = dict.fromkeys(PHASES, 0)
+        self.totals = dict.fromkeys(PHASES, 0.0)
+        self.output_chars = 0
+
+
+_COUNTERS = ('counts', 'totals', 'output_chars')
+
+
+class FormatterStats(object):
+    '''Cumulative and sampled timings of the ColorFormatter phases, see the module docs'''
+
+    def __init__(self, sample_every=DEFAULT_SAMPLE_EVERY, sample_size=DEFAULT_SAMPLE_SIZE):
+        self.sample_every = sample_every
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._thread_counters = PerThreadCounters(_ThreadCounters, _COUNTERS)
+            # appending to a deque is thread safe, and maxlen keeps it bounded
+            self._samples = dict((phase, collections.deque(maxlen=self.sample_size)) for phase in PHASES)
+
+    def add(self, phase, elapsed, output=None):
+        counters = self._thread_counters.get()
+        count = counters.counts[phase] + 1
+        counters.counts[phase] = count
+        counters.totals[phase] += elapsed
+        if output is not None:
+            counters.output_chars += len(output)
+        if count % self.sample_every == 0:
+            self._samples[phase].append(elapsed)
+
+    def timed(self, func, phase):
+        '''return func wrapped to add the time each call takes to phase'''
+        add = self.add
+
+        def timed_func(*args):
+            start = clock()
+            result = func(*args)
+            add(phase, clock() - start)
+            return result
+        timed_func.__wrapped__ = func
+        return timed_func
+
+    def timed_format(self, format_func):
+        '''like timed(), but also counts the records and characters format_func returns'''
+        add = self.add
+
+        def format(record):
+            start = clock()
+            result = format_func(record)
+            add('format', clock() - start, result)
+            return result
+        format.__wrapped__ = format_func
+        return format
+
+    def snapshot(self):
+        '''return a dict of the counters summed over all threads, times are in microseconds'''
+        with self._lock:
+            thread_counters = self._thread_counters
+            samples = self._samples
+
+        summed = thread_counters.totals()
+        counts = summed['counts']
+        totals = summed['totals']
+
+        phases = {}
+        for phase in PHASES:
+            count = counts[phase]
+            total = totals[phase]
+            phase_stats = {'count': count,
+                           'total_us': total * 1e6,
+                           'mean_us': total * 1e6 / count if count else 0.0}
+            phase_stats.update(_percentiles(list(samples[phase])))
+            phases[phase] = phase_stats
+
+        format_total = phases['format']['total_us']
+        for phase in PHASES:
+            # how much of format() each phase is responsible for
+            phases[phase]['share'] = phases[phase]['total_us'] / format_total if format_total else 0.0
+
+        return {'records': phases['format']['count'],
+                'output_chars': summed['output_chars'],
+                'phases': phases}
+
+
+def _percentiles(samples):
+    if not samples:
+        return {'samples': 0}
+    samples.sort()
+
+    def percentile(pct):
+        return samples[min(len(samples) - 1, int(len(samples) * pct / 100.0))] * 1e6
+
+    return {'samples': len(samples), 'p50_us': percentile(50), 'p90_us': percentile(90),
+            'p99_us': percentile(99), 'max_us': samples[-1] * 1e6}
+
+
+def instrument_formatter(formatter, stats):
+    '''time the phases of formatter.format() in stats, by wrapping them on the instance'''
+    mapper = formatter.color_mapper
+    mapper.get_colors_for_record = stats.timed(mapper.get_colors_for_record, 'get_colors')
+    formatter._pre_format_attrs = stats.timed(formatter._pre_format_attrs, 'pre_format')
+    formatter._apply_colors = stats.timed(formatter._apply_colors, 'apply_colors')
+    formatter._render = stats.timed(formatter._render, 'interpolate')
+    # not formatException(), it runs inside _pre_format_attrs() and is part of 'pre_format'
+    formatter._format_traceback = stats.timed(formatter._format_traceback, 'exception')
+    formatter.format = stats.timed_format(formatter.format)
+
+
+class StatsDumper(object):
+    '''Write formatter.get_stats() every interval seconds from a background thread.
+
+    The stats go to callback(stats) if given, or else as a line of JSON to stream (sys.stderr by
+    default). stop() writes them one last time.'''
+
+    def __init__(self, formatter, interval=DEFAULT_DUMP_INTERVAL, stream=None, callback=None):
+        self.formatter = formatter
+        self.interval = interval
+        self.stream = stream or sys.stderr
+        self.callback = callback
+        self._stop = threading.Event()
+        self._thread = None
+
+    def dump(self):
+        stats = self.formatter.get_stats()
+        stats['time'] = time.time()
+        if self.callback is not None:
+            self.callback(stats)
+            return
+        self.stream.write(json.dumps(stats, sort_keys=True) + '\n')
+        if hasattr(self.stream, 'flush'):
+            self.stream.flush()
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='StatsDumper')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.dump()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
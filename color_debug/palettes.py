@@ -0,0 +1,153 @@
+'''Terminal color palettes.
+
+TermColorMapper hands out xterm 256 color numbers (0-255) plus RESET_SEQ_IDX and
+DEFAULT_COLOR_IDX. A palette turns those color ids into escape sequences for a terminal,
+precomputed into a flat tuple indexed by color id, so the per record cost of a lookup is
+the same whichever palette is active.
+
+    - 'none': no escape sequences at all
+    - '16': the basic 8 + 8 bright ANSI colors, other colors mapped to the nearest one
+    - '256': xterm 256 colors (the default)
+    - 'truecolor': 24 bit colors, using the RGB values of the xterm 256 colors
+'''
+
+import os
+
+RESET_SEQ = "\033[0m"
+
+NUMBER_OF_XTERM_COLORS = 256
+RESET_SEQ_IDX = 256
+DEFAULT_COLOR_IDX = 257
+NUMBER_OF_COLOR_IDS = 258
+
+# white
+DEFAULT_COLOR = 7
+
+# xterm's RGB values for the 16 base colors
+BASE_RGB = [(0, 0, 0), (205, 0, 0), (0, 205, 0), (205, 205, 0),
+            (0, 0, 238), (205, 0, 205), (0, 205, 205), (229, 229, 229),
+            (127, 127, 127), (255, 0, 0), (0, 255, 0), (255, 255, 0),
+            (92, 92, 255), (255, 0, 255), (0, 255, 255), (255, 255, 255)]
+CUBE_LEVELS = [0, 95, 135, 175, 215, 255]
+
+
+def xterm_rgb(color_number):
+    '''return the (r, g, b) xterm uses for 256 color number color_number'''
+    if color_number < 16:
+        return BASE_RGB[color_number]
+    if color_number < 232:
+        # 16-231 is a 6x6x6 rgb cube
+        cube_idx = color_number - 16
+        return (CUBE_LEVELS[cube_idx // 36], CUBE_LEVELS[(cube_idx // 6) % 6], CUBE_LEVELS[cube_idx % 6])
+    # 232-255 are the grays
+    gray = 8 + (color_number - 232) * 10
+    return (gray, gray, gray)
+
+
+class Palette(object):
+    '''Base palette, subclasses implement color_escape()'''
+    name = None
+    reset_seq = RESET_SEQ
+
+    def __init__(self):
+        escapes = [self.color_escape(color_number) for color_number in range(NUMBER_OF_XTERM_COLORS)]
+        escapes.append(self.reset_seq)
+        escapes.append(escapes[DEFAULT_COLOR])
+        # escapes[color_id] is the escape sequence for color_id
+        self.escapes = tuple(escapes)
+
+    def color_escape(self, color_number):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '%s()' % self.__class__.__name__
+
+
+class NoColorPalette(Palette):
+    name = 'none'
+    reset_seq = ''
+
+    def color_escape(self, color_number):
+        return ''
+
+
+class Ansi16Palette(Palette):
+    name = '16'
+
+    def color_escape(self, color_number):
+        if color_number >= 16:
+            color_number = self.nearest_base_color(color_number)
+        if color_number < 8:
+            return "\033[3%dm" % color_number
+        return "\033[9%dm" % (color_number - 8)
+
+    @staticmethod
+    def nearest_base_color(color_number):
+        r, g, b = xterm_rgb(color_number)
+        # skip black, it is usually the background
+        return min(range(1, 16), key=lambda base: (BASE_RGB[base][0] - r) ** 2 +
+                   (BASE_RGB[base][1] - g) ** 2 +
+                   (BASE_RGB[base][2] - b) ** 2)
+
+
+class Ansi256Palette(Palette):
+    name = '256'
+
+    def color_escape(self, color_number):
+        return "\033[38;5;%dm" % color_number
+
+
+class TrueColorPalette(Palette):
+    name = 'truecolor'
+
+    def color_escape(self, color_number):
+        return "\033[38;2;%d;%d;%dm" % xterm_rgb(color_number)
+
+
+PALETTES = dict((palette_class.name, palette_class) for palette_class in
+                [NoColorPalette, Ansi16Palette, Ansi256Palette, TrueColorPalette])
+
+DEFAULT_PALETTE = Ansi256Palette.name
+
+# palettes are immutable once built, so share one instance of each
+_palette_instances = {}
+_detected_palette_name = None
+
+
+def detect_palette_name(environ=None):
+    '''Guess the best palette name for the terminal from NO_COLOR, TERM and COLORTERM'''
+    environ = os.environ if environ is None else environ
+    if environ.get('NO_COLOR'):
+        return NoColorPalette.name
+    term = environ.get('TERM', '')
+    if term == 'dumb':
+        return NoColorPalette.name
+    if environ.get('COLORTERM', '').lower() in ('truecolor', '24bit'):
+        return TrueColorPalette.name
+    if '256' in term:
+        return Ansi256Palette.name
+    return Ansi16Palette.name
+
+
+def get_palette(palette=None):
+    '''return a Palette for palette
+
+    palette can be a Palette instance, one of the PALETTES names, 'auto' to detect one
+    from the environment (only done once per process), or None for the default 256 colors.'''
+    global _detected_palette_name
+
+    if isinstance(palette, Palette):
+        return palette
+
+    name = palette or DEFAULT_PALETTE
+    if name == 'auto':
+        if _detected_palette_name is None:
+            _detected_palette_name = detect_palette_name()
+        name = _detected_palette_name
+
+    if name not in PALETTES:
+        raise ValueError('Unknown palette %r, should be one of: auto, %s' % (palette, ', '.join(sorted(PALETTES))))
+
+    if name not in _palette_instances:
+        _palette_instances[name] = PALETTES[name]()
+    return _palette_instances[name]
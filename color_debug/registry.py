@@ -0,0 +1,145 @@
+'''A color registry shared by every process that opens the same file.
+
+TermColorMapper.get_name_color() picks colors by hashing names, so two names often end up
+with the same color and there is no way for worker processes to agree on 'first come, first
+served' color assignments. SharedColorRegistry hands out colors from a small open addressing
+hash table in a mmap'ed file: the first process to see a new processName, threadName or logger
+name assigns it the next color in a round robin over the palette, and every process sharing
+the file sees that assignment.
+
+Layout of the file (little endian):
+
+    header: magic (8 bytes), number of slots (u32), colors handed out (u32)
+    slots:  key (u64), color number (u16), 6 bytes padding
+
+A key of 0 is an empty slot. Lookups never take a lock: a slot's color is written before its
+key, and the key is written with a single aligned 8 byte store, so a reader either sees an
+empty slot or a complete entry. Allocating a color takes a lock shared by the threads of this
+process and an exclusive flock() on the file (flock() doesn't exclude threads using the same
+file descriptor), re-checks the table, and then writes the entry.
+
+Needs fcntl, so only available on unix.
+'''
+
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+MAGIC = b'cdlreg01'
+HEADER = struct.Struct('<8sII')
+SLOT = struct.Struct('<QH6x')
+DEFAULT_SLOTS = 4096
+
+_COLOR_COUNTER_OFFSET = 12
+
+
+def _key(kind, name):
+    '''a 64 bit key for name, namespaced by kind. Never 0, that marks an empty slot.'''
+    data = ('%s\0%s' % (kind, name)).encode('utf-8', 'surrogateescape')
+    key = (zlib.crc32(data) & 0xffffffff) << 32 | (zlib.adler32(data) & 0xffffffff)
+    return key or 1
+
+
+class RegistryFull(Exception):
+    pass
+
+
+class SharedColorRegistry(object):
+    '''Assign distinct, persistent colors to names across processes
+
+    path is the file backing the table, created if needed. Every process (and every
+    TermColorMapper) that should agree on colors opens the same path. colors is the sequence
+    of color numbers handed out round robin, so the first len(colors) names all get different
+    colors.'''
+
+    def __init__(self, path, colors, slots=DEFAULT_SLOTS):
+        self.path = path
+        self.colors = tuple(colors)
+        if not self.colors:
+            raise ValueError('SharedColorRegistry needs at least one color')
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                size = os.fstat(fd).st_size
+                if size == 0:
+                    os.ftruncate(fd, HEADER.size + SLOT.size * slots)
+                    os.pwrite(fd, HEADER.pack(MAGIC, slots, 0), 0)
+                else:
+                    magic, slots, _ = HEADER.unpack(os.pread(fd, HEADER.size, 0))
+                    if magic != MAGIC:
+                        raise ValueError('%s is not a color registry' % path)
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            self._map = mmap.mmap(fd, HEADER.size + SLOT.size * slots)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self.slots = slots
+        self._lock = threading.Lock()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            os.close(self._fd)
+            self._map = None
+
+    def _slot_offset(self, idx):
+        return HEADER.size + SLOT.size * idx
+
+    def _find(self, key):
+        '''return (color number or None, offset of the key's slot or of the empty slot it would go in)'''
+        data = self._map
+        slots = self.slots
+        idx = key % slots
+        for _ in range(slots):
+            offset = self._slot_offset(idx)
+            slot_key, color = SLOT.unpack_from(data, offset)
+            if slot_key == key:
+                return color, offset
+            if slot_key == 0:
+                return None, offset
+            idx = (idx + 1) % slots
+        return None, None
+
+    def lookup(self, kind, name):
+        '''return the color number already assigned to name, or None. Lock free.'''
+        return self._find(_key(kind, name))[0]
+
+    def get_color(self, kind, name):
+        '''return the color number for name, assigning the next one if name is new'''
+        key = _key(kind, name)
+        color, offset = self._find(key)
+        if color is not None:
+            return color
+
+        with self._lock:
+            return self._allocate(key)
+
+    def _allocate(self, key):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            # another process (or thread) may have added it (or filled the slot) since the lock free check
+            color, offset = self._find(key)
+            if color is not None:
+                return color
+            if offset is None:
+                raise RegistryFull('color registry %s is full' % self.path)
+
+            counter = struct.unpack_from('<I', self._map, _COLOR_COUNTER_OFFSET)[0]
+            color = self.colors[counter % len(self.colors)]
+            struct.pack_into('<I', self._map, _COLOR_COUNTER_OFFSET, (counter + 1) & 0xffffffff)
+            # color first, then the key that makes the slot visible to lock free readers
+            struct.pack_into('<H', self._map, offset + 8, color)
+            struct.pack_into('<Q', self._map, offset, key)
+            return color
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def __len__(self):
+        return sum(1 for idx in range(self.slots) if SLOT.unpack_from(self._map, self._slot_offset(idx))[0])
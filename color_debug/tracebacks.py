@@ -0,0 +1,174 @@
+'''Tracebacks and stack_info rendered frame by frame, with each frame colored.
+
+ColorFormatter normally colors a record's exc_text (and stack_info) as one block in the
+record's exc_text color. With ColorFormatter(color_frames=True), TracebackColorizer renders
+them instead, coloring the filename, function name and source line of every frame with
+TermColorMapper.get_name_color(), so frames from the same file or function have the same color
+in every traceback.
+
+The rendered, colored text of each frame is cached by (filename, lineno, function name, last
+instruction, exc color), so a deep stack that shows up again and again only costs a cache
+lookup per frame, no linecache or color work. Like linecache itself, the cache doesn't notice source files changing
+while the process runs.
+'''
+
+import logging
+import re
+import traceback
+
+from .color_debug import DEFAULT_FRAME_CACHE_SIZE, ThreadLocalLRUCache
+
+# the same text traceback.format_exception() puts between chained exceptions
+CAUSE_MESSAGE = '\nThe above exception was the direct cause of the following exception:\n\n'
+CONTEXT_MESSAGE = '\nDuring handling of the above exception, another exception occurred:\n\n'
+TRACEBACK_HEADER = 'Traceback (most recent call last):\n'
+
+# like traceback, show at most this many repeats of the same frame in a row (ie, recursion)
+RECURSIVE_CUTOFF = 3
+
+# a frame line of an already rendered traceback or stack_info, the source line follows it
+_FRAME_LINE_RE = re.compile(r'^(?P<indent>[ |]*)File "(?P<filename>.*)", line (?P<lineno>\d+), in (?P<name>.*)$')
+
+try:
+    _exception_group_types = (BaseExceptionGroup,)
+except NameError:
+    # before py3.11
+    _exception_group_types = ()
+
+
+def _chain(exc_type, exc_value, tb):
+    '''return [(exc_type, exc_value, tb, separator after it)] for the chain ending in exc_value, oldest first'''
+    chain = []
+    seen = set()
+    separator = ''
+    while True:
+        chain.append((exc_type, exc_value, tb, separator))
+        if exc_value is None:
+            break
+        seen.add(id(exc_value))
+        cause = getattr(exc_value, '__cause__', None)
+        context = getattr(exc_value, '__context__', None)
+        if cause is not None and id(cause) not in seen:
+            exc_value, separator = cause, CAUSE_MESSAGE
+        elif (context is not None and id(context) not in seen and
+              not getattr(exc_value, '__suppress_context__', False)):
+            exc_value, separator = context, CONTEXT_MESSAGE
+        else:
+            break
+        exc_type, tb = type(exc_value), exc_value.__traceback__
+    # an exception's separator leads from it to the exception that was raised while handling it
+    chain.reverse()
+    return chain
+
+
+class TracebackColorizer(object):
+    '''Render exc_info and stack_info text with the frames colored by color_mapper
+
+    exc_color is the escape sequence the text around the frames is shown in, normally the
+    record's _cdl_exc_text color.'''
+
+    def __init__(self, color_mapper, frame_cache_size=DEFAULT_FRAME_CACHE_SIZE):
+        self.color_mapper = color_mapper
+        self._escapes = color_mapper.palette.escapes
+        # colored frame text keyed by (filename, lineno, name, tb_lasti, exc_color) for frames rendered
+        # from a traceback, or by the frame's (line, source line, exc_color) for frames in text
+        self.frame_cache = ThreadLocalLRUCache(maxsize=frame_cache_size)
+
+    def _name_escape(self, name):
+        return self._escapes[self.color_mapper.get_name_color(name)]
+
+    def _color_frame(self, indent, filename, lineno, name, source, source_indent, exc_color):
+        filename_color = self._name_escape(filename)
+        name_color = self._name_escape(name)
+        parts = ['%sFile "%s%s%s", line %s%s%s, in %s%s%s\n' % (indent, filename_color, filename, exc_color,
+                                                                filename_color, lineno, exc_color,
+                                                                name_color, name, exc_color)]
+        if source:
+            parts.append('%s%s%s%s\n' % (source_indent, name_color, source, exc_color))
+        return ''.join(parts)
+
+    def _frame(self, tb, exc_color):
+        code = tb.tb_frame.f_code
+        # tb_lasti picks the expression py3.11+ underlines with '^^^' and '~~~' lines
+        key = (code.co_filename, tb.tb_lineno, code.co_name, tb.tb_lasti, exc_color)
+        fragment = self.frame_cache.get(key)
+        if fragment is None:
+            # rendered by the traceback module, so it is exactly what formatException() shows
+            text = ''.join(traceback.extract_tb(tb, limit=1).format())
+            fragment = self.colorize_text(text, exc_color)
+            self.frame_cache.set(key, fragment)
+        return fragment
+
+    def _format_tb(self, tb, parts, exc_color):
+        last_key = None
+        repeats = 0
+        while tb is not None:
+            code = tb.tb_frame.f_code
+            key = (code.co_filename, tb.tb_lineno, code.co_name)
+            if key == last_key:
+                repeats += 1
+            else:
+                if repeats > RECURSIVE_CUTOFF:
+                    parts.append(self._repeated(repeats - RECURSIVE_CUTOFF))
+                last_key = key
+                repeats = 1
+            if repeats <= RECURSIVE_CUTOFF:
+                parts.append(self._frame(tb, exc_color))
+            tb = tb.tb_next
+        if repeats > RECURSIVE_CUTOFF:
+            parts.append(self._repeated(repeats - RECURSIVE_CUTOFF))
+
+    @staticmethod
+    def _repeated(count):
+        return '  [Previous line repeated %d more time%s]\n' % (count, 's' if count > 1 else '')
+
+    def format_exception(self, exc_info, exc_color):
+        '''return the traceback text for exc_info with its frames colored, like logging.Formatter.formatException()'''
+        chain = _chain(*exc_info)
+        if any(isinstance(exc_value, _exception_group_types) for _, exc_value, _, _ in chain):
+            # the nested layout of exception groups is left to the traceback module
+            return self.colorize_text(logging.Formatter().formatException(exc_info), exc_color)
+
+        parts = []
+        for exc_type, exc_value, tb, separator in chain:
+            if tb is not None:
+                parts.append(TRACEBACK_HEADER)
+                self._format_tb(tb, parts, exc_color)
+            parts.extend(traceback.format_exception_only(exc_type, exc_value))
+            parts.append(separator)
+        text = ''.join(parts)
+        if text.endswith('\n'):
+            text = text[:-1]
+        return text
+
+    def colorize_text(self, text, exc_color):
+        '''return already rendered traceback or stack_info text with its frames colored'''
+        lines = text.split('\n')
+        colored = []
+        idx = 0
+        while idx < len(lines):
+            line = lines[idx]
+            match = _FRAME_LINE_RE.match(line)
+            if not match:
+                colored.append(line + '\n')
+                idx += 1
+                continue
+
+            source_line = lines[idx + 1] if idx + 1 < len(lines) else ''
+            # the source line is indented more than the frame line, and isn't a frame itself
+            if (len(source_line) - len(source_line.lstrip(' |')) <= len(match.group('indent')) or
+                    _FRAME_LINE_RE.match(source_line)):
+                source_line = None
+
+            key = (line, source_line, exc_color)
+            fragment = self.frame_cache.get(key)
+            if fragment is None:
+                source = source_line.lstrip(' |') if source_line else ''
+                source_indent = source_line[:len(source_line) - len(source)] if source_line else ''
+                fragment = self._color_frame(match.group('indent'), match.group('filename'), match.group('lineno'),
+                                             match.group('name'), source, source_indent, exc_color)
+                self.frame_cache.set(key, fragment)
+            colored.append(fragment)
+            idx += 1 if source_line is None else 2
+
+        return ''.join(colored)[:-1]
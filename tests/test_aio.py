@@ -0,0 +1,95 @@
+"""Tests for `color_debug.aio`."""
+
+import asyncio
+import io
+import logging
+import threading
+import time
+
+from color_debug import color_debug
+from color_debug.aio import AsyncColorHandler
+
+
+class SlowStream(io.StringIO):
+    def __init__(self, delay=0.0):
+        io.StringIO.__init__(self)
+        self.delay = delay
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+        self.threads = set()
+
+    def write(self, text):
+        self.threads.add(threading.current_thread().name)
+        self.unblocked.wait()
+        time.sleep(self.delay)
+        return io.StringIO.write(self, text)
+
+
+def _logger(handler, name):
+    logger = logging.getLogger('color_debug.test_aio.%s' % name)
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    logger.addHandler(handler)
+    return logger
+
+
+def test_handler_writes_off_the_loop():
+    stream = SlowStream(delay=0.01)
+
+    async def main():
+        handler = AsyncColorHandler(stream=stream, use_color=False,
+                                    formatter=color_debug.ColorFormatter(fmt='%(levelname)s %(message)s'))
+        logger = _logger(handler, 'off_loop')
+        start = time.time()
+        for idx in range(20):
+            logger.info('record %d', idx)
+        # 20 writes would take 0.2s on the loop
+        assert time.time() - start < 0.1
+        await handler.aclose()
+        logger.removeHandler(handler)
+        return handler
+
+    handler = asyncio.run(main())
+    assert stream.getvalue().splitlines() == ['INFO record %d' % idx for idx in range(20)]
+    assert stream.threads == set(['ColorQueueListener'])
+    assert handler.pending == 0
+    assert handler.listener.handled == 20
+
+
+def test_handler_bounded():
+    stream = SlowStream()
+    stream.unblocked.clear()
+
+    async def main():
+        handler = AsyncColorHandler(stream=stream, use_color=False, maxsize=2)
+        logger = _logger(handler, 'bounded')
+        for idx in range(10):
+            logger.info('record %d', idx)
+        # the listener is stuck on at most one record, everything past maxsize was dropped
+        assert handler.dropped_oldest >= 7
+        assert handler.pending <= 3
+        stream.unblocked.set()
+        await handler.drain()
+        logger.removeHandler(handler)
+        handler.close()
+        return handler
+
+    handler = asyncio.run(main())
+    lines = stream.getvalue().splitlines()
+    assert len(lines) + handler.dropped_oldest == 10
+    # the newest records are the ones kept
+    assert lines[-1].endswith('record 9')
+
+
+def test_handler_close_writes_queued():
+    stream = SlowStream(delay=0.001)
+    handler = AsyncColorHandler(stream=stream, use_color=False)
+    logger = _logger(handler, 'close')
+    for idx in range(50):
+        logger.info('record %d', idx)
+    logger.removeHandler(handler)
+    handler.close()
+    assert len(stream.getvalue().splitlines()) == 50
+    # records after close are ignored
+    handler.handle(logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'late', None, None))
+    assert len(stream.getvalue().splitlines()) == 50
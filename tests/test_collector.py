@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `color_debug.collector`."""
+
+import logging
+import multiprocessing
+import os
+import sys
+import time
+
+import pytest
+
+from color_debug import collector
+from color_debug import color_debug
+
+from .test_color_debug import BufHandler, make_record
+
+
+def collector_handler(fmt='%(processName)s %(process)d %(name)s %(message)s'):
+    handler = BufHandler()
+    handler.setFormatter(color_debug.ColorFormatter(fmt=fmt))
+    return handler
+
+
+def test_encode_decode_record():
+    try:
+        raise ValueError('wire test')
+    except ValueError:
+        record = make_record(exc_info=sys.exc_info(), play='some play')
+    decoded = collector.decode_record(collector.encode_record(record, extra_fields=['play']))
+    assert decoded.getMessage() == 'foo bar'
+    assert decoded.args is None
+    assert decoded.exc_info is None
+    assert 'ValueError: wire test' in decoded.exc_text
+    assert decoded.play == 'some play'
+    for field in ('name', 'levelno', 'lineno', 'funcName', 'created', 'thread', 'threadName', 'process'):
+        assert getattr(decoded, field) == getattr(record, field)
+
+
+def test_collector_bad_payloads():
+    good = collector.encode_record(make_record())
+    not_a_dict = good[:-1] + b',[1,2]]'
+    for data in [b'5', b'not json', b'[1, 2]', not_a_dict]:
+        with pytest.raises(ValueError):
+            collector.decode_record(data)
+
+    handler = collector_handler()
+    color_collector = collector.ColorCollector(handler=handler)
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    color_collector.add_connection(reader)
+    for data in [b'5', not_a_dict, good]:
+        writer.send_bytes(data)
+    writer.close()
+    color_collector.join(timeout=5)
+    color_collector.stop()
+
+    # the bad ones are counted, and the reader keeps going
+    assert color_collector.errors == 2
+    assert color_collector.received == 1
+    assert 'foo bar' in handler.buf[0]
+
+
+def _pipe_worker(connection):
+    logger = logging.getLogger('color_debug.test_collector.worker')
+    logger.propagate = False
+    logger.addHandler(collector.ColorSenderHandler(connection=connection))
+    logger.warning('from worker %s', os.getpid())
+    connection.close()
+
+
+def test_collector_pipe():
+    handler = collector_handler()
+    color_collector = collector.ColorCollector(handler=handler)
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    color_collector.add_connection(reader)
+
+    worker = multiprocessing.Process(target=_pipe_worker, args=(writer,))
+    worker.start()
+    writer.close()
+    worker.join()
+    color_collector.join(timeout=5)
+    color_collector.stop()
+
+    assert color_collector.received == 1
+    assert 'from worker %s' % worker.pid in handler.buf[0]
+    assert handler.record_buf[0].process == worker.pid
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork') or sys.platform == 'win32', reason='needs unix sockets')
+def test_collector_unix_socket(tmpdir):
+    address = str(tmpdir.join('collector.sock'))
+    handler = collector_handler()
+    color_collector = collector.ColorCollector(address, handler=handler)
+    color_collector.start()
+
+    sender = collector.ColorSenderHandler(address)
+    for i in range(5):
+        sender.handle(make_record(msg='msg %d', args=(i,)))
+    sender.close()
+    color_collector.stop(timeout=5)
+
+    assert color_collector.received == 5
+    assert [record.getMessage() for record in handler.record_buf] == ['msg %d' % i for i in range(5)]
+    assert not os.path.exists(address)
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork') or sys.platform == 'win32', reason='needs unix sockets')
+def test_collector_forgets_closed_connections(tmpdir):
+    address = str(tmpdir.join('collector.sock'))
+    handler = collector_handler()
+    color_collector = collector.ColorCollector(address, handler=handler)
+    color_collector.start()
+    try:
+        for i in range(50):
+            sender = collector.ColorSenderHandler(address)
+            sender.handle(make_record(msg='msg %d', args=(i,)))
+            sender.close()
+        for _ in range(500):
+            if color_collector.received == 50 and not color_collector._threads:
+                break
+            time.sleep(0.01)
+        assert color_collector.received == 50
+        # the readers of senders that hung up closed their connections and removed themselves
+        assert color_collector._connections == []
+        assert color_collector._threads == []
+    finally:
+        color_collector.stop(timeout=5)
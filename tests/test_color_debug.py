@@ -3,6 +3,10 @@
 
 """Tests for `color_debug` package."""
 
+import sys
+import threading
+import time
+
 import pytest
 
 import logging
@@ -34,6 +38,15 @@ class BufHandler(logging.Handler):
             self.handleError(record)
 
 
+def make_record(msg='foo %s', args=('bar',), level=logging.INFO, name='color_debug.test_records', exc_info=None,
+                pathname=__file__, **attrs):
+    '''a LogRecord like logger 'name' makes them, with any extra attrs set on it'''
+    logger = logging.getLogger(name)
+    record = logger.makeRecord(name, level, pathname, 42, msg, args, exc_info, func='test_func')
+    record.__dict__.update(attrs)
+    return record
+
+
 @pytest.fixture
 def response():
     """Sample pytest fixture.
@@ -114,3 +127,293 @@ def test_null_handler(response):
     nh = NullHandler()
     formatter = color_debug.ColorFormatter()
     nh.setFormatter(formatter)
+
+
+def test_color_plan():
+    formatter = color_debug.ColorFormatter(fmt='%(levelname)s %(name)s %(funcName)s %(message)s',
+                                           default_color_by_attr='name',
+                                           color_groups=[('name', ['funcName', 'levelname'])],
+                                           auto_color=True)
+    plan = formatter.color_mapper._plan
+    assert isinstance(plan, color_debug.ColorPlan)
+    assert ('name', '_cdl_name') in plan.name_color_groups
+    assert ('_cdl_name', ('_cdl_funcName', '_cdl_levelname')) in plan.member_groups
+    # group members, custom attrs and high cardinality attrs are not auto colored
+    assert plan.auto_color_attrs == (('exc_text', '_cdl_exc_text'),)
+    assert plan.use_thread_color
+
+
+def test_color_plan_default_attr_not_in_format():
+    logger, handler, formatter = setup_logger(color_groups=[('funcName', ['message'])],
+                                              fmt='%(name)s %(message)s')
+    formatter.color_mapper = color_debug.TermColorMapper(color_groups=[('funcName', ['message'])],
+                                                         format_attrs=color_debug.find_format_attrs('%(name)s %(message)s'))
+    logger.debug('no process attr in the format')
+    assert handler.buf
+
+
+def test_lru_cache_eviction():
+    cache = color_debug.LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    # 'b' is now the least recently used
+    cache.set('c', 3)
+    assert 'b' not in cache
+    assert cache.get('b') is None
+    assert cache.get('c') == 3
+    stats = cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert stats['evictions'] == 1
+    assert stats['size'] == 2
+
+
+def test_lru_cache_disabled():
+    cache = color_debug.LRUCache(maxsize=0)
+    cache.set('a', 1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_get_name_color_cached():
+    mapper = color_debug.TermColorMapper(name_color_cache_size=8)
+    color_idx = mapper.get_name_color('some.logger')
+    assert mapper.get_name_color('some.logger') == color_idx
+    assert mapper.name_color_cache.hits == 1
+    assert mapper.name_color_cache.misses == 1
+    # unhashable values are still colored, just not cached
+    assert mapper.get_name_color(['a', 'list']) == mapper._get_name_color(['a', 'list'])
+
+
+def _process_record(thread_name='T1', thread=1234):
+    record = logging.makeLogRecord({'processName': 'MainProcess', 'process': 42,
+                                    'threadName': thread_name, 'thread': thread})
+    return record
+
+
+def test_get_process_colors_cached():
+    mapper = color_debug.TermColorMapper(process_color_fast_path=False)
+    colors = mapper.get_process_colors(_process_record())
+    assert mapper.get_process_colors(_process_record()) == colors
+    assert colors == mapper._get_process_colors('MainProcess', 42, 'T1', 1234)
+    assert mapper.process_color_cache.hits == 1
+    assert mapper.process_color_cache.misses == 1
+
+
+def test_get_process_colors_fast_path():
+    mapper = color_debug.TermColorMapper()
+    colors = mapper.get_process_colors(_process_record())
+    mapper.get_process_colors(_process_record())
+    # the repeat is served from the last key, not the cache
+    assert mapper.process_color_cache.hits == 0
+    assert mapper.get_process_colors(_process_record(thread_name='T2', thread=5)) != colors
+
+
+def test_get_process_colors_cache_bounded():
+    mapper = color_debug.TermColorMapper(process_color_cache_size=4)
+    for tid in range(100):
+        mapper.get_process_colors(_process_record(thread_name='T%s' % tid, thread=tid))
+    assert len(mapper.process_color_cache) == 4
+    assert mapper.process_color_cache.evictions == 96
+
+
+def _in_thread(func, *args):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func(*args)))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_thread_local_lru_cache():
+    cache = color_debug.ThreadLocalLRUCache(maxsize=4)
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    # another thread has its own (empty) cache
+    assert _in_thread(cache.get, 'a') is None
+    assert 'a' in cache
+    # the exited thread's miss is still counted
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    cache.clear()
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_format_concurrently():
+    formatter = color_debug.ColorFormatter(color_groups=[('name', ['funcName'])])
+    records = [logging.makeLogRecord({'name': 'logger%d' % (i % 7), 'msg': 'msg %d' % i,
+                                      'processName': 'MainProcess', 'process': 42,
+                                      'threadName': 'T%d' % (i % 5), 'thread': i % 5,
+                                      'created': 1500000000.0 + i % 3})
+               for i in range(200)]
+    expected = [formatter.format(logging.makeLogRecord(dict(r.__dict__))) for r in records]
+
+    results = {}
+    barrier = threading.Barrier(8)
+
+    def format_all(idx):
+        copies = [logging.makeLogRecord(dict(r.__dict__)) for r in records]
+        barrier.wait()
+        results[idx] = [formatter.format(record) for record in copies]
+
+    threads = [threading.Thread(target=format_all, args=(idx,)) for idx in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(results) == 8
+    for formatted in results.values():
+        assert formatted == expected
+    # the counts of exited threads are kept
+    assert formatter.color_mapper.name_color_cache.hits > 0
+
+
+def test_format_without_mutating_record():
+    overlay_formatter = color_debug.ColorFormatter(mutate_record=False, auto_color=True)
+    formatter = color_debug.ColorFormatter(auto_color=True)
+
+    record = make_record()
+    record_dict = dict(record.__dict__)
+    res = overlay_formatter.format(record)
+    assert record.__dict__ == record_dict
+    # same output as the mutating format()
+    assert res == formatter.format(record)
+    assert hasattr(record, '_cdl_name')
+
+
+def test_format_without_mutating_record_exc_info():
+    overlay_formatter = color_debug.ColorFormatter(mutate_record=False)
+    try:
+        raise ValueError('some value')
+    except ValueError:
+        record = make_record(exc_info=sys.exc_info())
+    res = overlay_formatter.format(record)
+    assert record.exc_text is None
+    assert 'ValueError: some value' in res
+
+
+@pytest.mark.parametrize('fmt', [color_debug.DEFAULT_FORMAT,
+                                 '%(message)s',
+                                 '%(levelname)-8s %(name)s: %(message)s',
+                                 '%(created)f %(msecs)03d %(relativeCreated)10.2f %(process)x %(lineno)+5d',
+                                 '100%% %(name)r %(levelno)05d%(message).3s'])
+def test_compile_format_string_matches_logging_formatter(fmt):
+    render = color_debug.compile_format_string(fmt)
+    for record in [make_record(), make_record(msg='a longer message: %s', args=({'a': 1},))]:
+        expected = logging.Formatter(fmt).format(record)
+        assert render(record.__dict__) == expected
+
+
+def test_compile_format_string_missing_attr():
+    render = color_debug.compile_format_string('%(not_an_attr)s')
+    with pytest.raises(KeyError):
+        render({})
+
+
+def test_compile_format_string_no_attrs():
+    render = color_debug.compile_format_string('no attrs at all 100%%')
+    assert render({}) == 'no attrs at all 100%'
+
+
+def test_compile_format_string_unknown_specifier():
+    # not something compile_format_string understands, so same error as plain %
+    render = color_debug.compile_format_string('%(name)s %q')
+    with pytest.raises(TypeError):
+        render({'name': 'foo'})
+
+
+def _time_record(created):
+    record = make_record()
+    record.created = created
+    record.msecs = (created - int(created)) * 1000
+    return record
+
+
+@pytest.mark.parametrize('datefmt', [None, '%H:%M:%S', '%Y-%m-%dT%H:%M:%S%z'])
+def test_format_time_cache(datefmt):
+    formatter = color_debug.ColorFormatter()
+    std_formatter = logging.Formatter()
+    for created in [1500000000.001, 1500000000.5, 1500000000.999, 1500000001.0, 1500000001.25, 1499999999.75]:
+        record = _time_record(created)
+        assert formatter.formatTime(record, datefmt) == std_formatter.formatTime(record, datefmt)
+
+
+def test_format_time_cache_converter():
+    formatter = color_debug.ColorFormatter()
+    record = _time_record(1500000000.5)
+    local_time = formatter.formatTime(record)
+    formatter.converter = time.gmtime
+    std_formatter = logging.Formatter()
+    std_formatter.converter = time.gmtime
+    assert formatter.formatTime(record) == std_formatter.formatTime(record)
+    del formatter.converter
+    assert formatter.formatTime(record) == local_time
+
+
+@pytest.mark.skipif(not hasattr(time, 'tzset'), reason='needs time.tzset')
+def test_format_time_cache_dst(monkeypatch):
+    monkeypatch.setenv('TZ', 'America/New_York')
+    time.tzset()
+    try:
+        formatter = color_debug.ColorFormatter()
+        std_formatter = logging.Formatter()
+        # 2021-03-14 01:59:59 EST is followed by 03:00:00 EDT
+        for created in [1615705199.5, 1615705200.5]:
+            record = _time_record(created)
+            assert formatter.formatTime(record) == std_formatter.formatTime(record)
+        assert formatter.formatTime(record).startswith('2021-03-14 03:00:00')
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def _fail(value, cause=None):
+    try:
+        if cause:
+            try:
+                raise cause
+            except Exception:
+                raise ValueError(value)
+        raise ValueError(value)
+    except ValueError:
+        return sys.exc_info()
+
+
+def test_format_exception_cached():
+    formatter = color_debug.ColorFormatter()
+    std_formatter = logging.Formatter()
+    for _ in range(3):
+        exc_info = _fail('boom')
+        assert formatter.formatException(exc_info) == std_formatter.formatException(exc_info)
+    stats = formatter.exc_text_cache.stats()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+
+    # a different message, or a different cause, is a different traceback
+    exc_info = _fail('bang')
+    assert formatter.formatException(exc_info) == std_formatter.formatException(exc_info)
+    exc_info = _fail('boom', cause=KeyError('k'))
+    assert formatter.formatException(exc_info) == std_formatter.formatException(exc_info)
+    assert formatter.exc_text_cache.misses == 3
+
+
+def test_exception_cache_key():
+    assert color_debug.exception_cache_key(_fail('boom')) == color_debug.exception_cache_key(_fail('boom'))
+    assert color_debug.exception_cache_key(_fail('boom')) != color_debug.exception_cache_key(_fail('bang'))
+
+    class Unprintable(Exception):
+        def __str__(self):
+            raise RuntimeError('no str')
+
+    assert color_debug.exception_cache_key((Unprintable, Unprintable(), None)) is None
+
+
+def test_format_exception_cache_disabled():
+    formatter = color_debug.ColorFormatter(exc_text_cache_size=0)
+    exc_info = _fail('boom')
+    assert formatter.formatException(exc_info) == logging.Formatter().formatException(exc_info)
+    assert formatter.exc_text_cache.misses == 0
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `color_debug.colorize` and the `python -m color_debug` command."""
+
+import errno
+import io
+import logging
+import os
+import sys
+
+import pytest
+
+from color_debug import color_debug
+from color_debug import colorize
+from color_debug import __main__ as color_debug_main
+
+from .test_color_debug import make_record
+
+
+def plain_lines(records, fmt=color_debug.DEFAULT_FORMAT):
+    formatter = logging.Formatter(fmt)
+    return '\n'.join(formatter.format(record) for record in records) + '\n'
+
+
+def test_parse_line():
+    colorizer = colorize.LogLineColorizer()
+    record = make_record(level=logging.WARNING)
+    parsed, match = colorizer.parse_line(plain_lines([record]).rstrip('\n'))
+    assert parsed.levelname == 'WARNING'
+    assert parsed.levelno == logging.WARNING
+    assert parsed.process == record.process
+    assert parsed.threadName == record.threadName
+    assert parsed.name == record.name
+    assert parsed.funcName == 'test_func'
+    assert parsed.lineno == 42
+    assert parsed.message == 'foo bar'
+
+
+def test_parse_line_no_match():
+    colorizer = colorize.LogLineColorizer()
+    assert colorizer.parse_line('Traceback (most recent call last):') == (None, None)
+
+
+def test_colorize_line_matches_color_formatter():
+    record = make_record()
+    line = plain_lines([record]).rstrip('\n')
+    colorizer = colorize.LogLineColorizer(auto_color=True)
+    formatter = color_debug.ColorFormatter(auto_color=True)
+    assert colorizer.colorize_line(line) == formatter.format(record)
+
+
+def test_colorize_continuation_lines():
+    try:
+        raise ValueError('colorize me')
+    except ValueError:
+        record = make_record(exc_info=sys.exc_info())
+    colorizer = colorize.LogLineColorizer(color_groups=[('threadName', ['thread'])])
+    lines = colorizer.colorize_lines(plain_lines([record])).splitlines()
+    record_colors = colorizer.color_mapper.get_colors_for_record(colorizer.parse_line(plain_lines([record]).splitlines()[0])[0])
+    assert lines[-1] == '%sValueError: colorize me\033[0m' % record_colors['_cdl_exc_text']
+
+
+def test_colorize_no_color_palette_is_identity():
+    records = [make_record(msg='msg %d', args=(i,)) for i in range(50)]
+    data = plain_lines(records).encode('utf-8') + b'not a log line \xff\n' + b'no newline at the end'
+    outfile = io.BytesIO()
+    colorizer = colorize.LogLineColorizer(palette='none')
+    colorize.colorize_stream(io.BytesIO(data), outfile, colorizer, block_size=100)
+    assert outfile.getvalue() == data
+
+
+def test_iter_blocks_line_boundaries():
+    data = b''.join(b'line %d\n' % i for i in range(1000))
+    blocks = list(colorize.iter_blocks(io.BytesIO(data), block_size=64))
+    assert b''.join(blocks) == data
+    for block in blocks:
+        assert block.endswith(b'\n')
+
+
+def test_main(tmpdir, capsysbinary):
+    log_file = tmpdir.join('test.log')
+    log_file.write(plain_lines([make_record(msg='msg %d', args=(i,)) for i in range(3)]))
+    assert color_debug_main.main(['--palette', '256', '--color-group', 'name=funcName,lineno', str(log_file)]) == 0
+    out = capsysbinary.readouterr().out.decode('utf-8')
+    assert len(out.splitlines()) == 3
+    assert '\033[38;5;' in out
+
+
+def test_main_broken_pipe(tmpdir, monkeypatch):
+    def broken_pipe(*args, **kwargs):
+        raise IOError(errno.EPIPE, 'Broken pipe')
+
+    monkeypatch.setattr(color_debug_main, 'colorize_stream', broken_pipe)
+    out_file = tmpdir.join('out')
+    with open(str(out_file), 'w') as stdout:
+        monkeypatch.setattr(sys, 'stdout', stdout)
+        assert color_debug_main.main([]) == 0
+        # stdout now goes to devnull, so flushing it at exit doesn't fail
+        stdout.write('discarded')
+        monkeypatch.undo()
+    assert out_file.read() == ''
+
+    monkeypatch.setattr(color_debug_main, 'colorize_stream', lambda *args, **kwargs: os.close(-1))
+    monkeypatch.setattr(sys, 'stdout', io.StringIO())
+    with pytest.raises(OSError):
+        color_debug_main.main([])
+
+
+def _mixed_log():
+    records = []
+    for i in range(200):
+        exc_info = None
+        if i % 7 == 0:
+            try:
+                raise ValueError('problem %d' % i)
+            except ValueError:
+                exc_info = sys.exc_info()
+        record = make_record(msg='msg %d', args=(i,), exc_info=exc_info)
+        record.threadName = 'T%d' % (i % 3)
+        records.append(record)
+    return plain_lines(records).encode('utf-8')
+
+
+def test_find_chunk_boundaries():
+    data = _mixed_log()
+    colorizer = colorize.LogLineColorizer()
+    boundaries = colorize.find_chunk_boundaries(io.BytesIO(data), len(data), colorizer, chunk_size=500)
+    assert boundaries[0] == 0
+    assert boundaries[-1] == len(data)
+    assert len(boundaries) > 10
+    for boundary in boundaries[1:-1]:
+        assert data[boundary - 1:boundary] == b'\n'
+        line = data[boundary:data.index(b'\n', boundary)]
+        assert colorizer.is_record_start(line)
+
+
+def test_colorize_file_parallel_matches_serial(tmpdir):
+    log_file = tmpdir.join('big.log')
+    log_file.write_binary(_mixed_log())
+    colorizer = colorize.LogLineColorizer(auto_color=True, palette='256',
+                                          color_groups=[('threadName', ['thread', 'exc_text'])])
+
+    serial = io.BytesIO()
+    with open(str(log_file), 'rb') as infile:
+        colorize.colorize_stream(infile, serial, colorizer)
+
+    parallel = io.BytesIO()
+    colorize.colorize_file_parallel(str(log_file), parallel, colorizer, jobs=3, chunk_size=700)
+    assert parallel.getvalue() == serial.getvalue()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `color_debug.counters`."""
+
+import gc
+import threading
+
+from color_debug.counters import PerThreadCounters, ThreadCounted
+
+
+class Counters(ThreadCounted):
+    def __init__(self):
+        self.calls = 0
+        self.by_key = {'a': 0, 'b': 0}
+
+
+def _count(counters, calls):
+    for _ in range(calls):
+        counted = counters.get()
+        counted.calls += 1
+        counted.by_key['a'] += 2
+
+
+def test_totals_of_live_and_exited_threads():
+    counters = PerThreadCounters(Counters, ('calls', 'by_key'))
+    _count(counters, 3)
+    for _ in range(20):
+        thread = threading.Thread(target=_count, args=(counters, 5))
+        thread.start()
+        thread.join()
+    gc.collect()
+    assert counters.totals() == {'calls': 103, 'by_key': {'a': 206, 'b': 0}}
+    # exited threads are folded into the retired total, not kept around
+    assert counters.live() == [counters.get()]
+    assert len(counters._registered()) <= 2
@@ -0,0 +1,116 @@
+import logging
+import time
+
+import pytest
+
+from color_debug import filters
+from color_debug.filters import SamplingFilter, SamplingRule
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _record(name='noisy', level=logging.DEBUG, created=1000.0):
+    return logging.makeLogRecord({'name': name, 'levelno': level, 'levelname': logging.getLevelName(level),
+                                  'msg': 'msg', 'created': created})
+
+
+def test_sampling_ratio():
+    sampling_filter = SamplingFilter([SamplingRule('noisy', level=logging.DEBUG, ratio=0.1)], summary_interval=None)
+    kept = [sampling_filter.filter(_record()) for _ in range(1000)]
+    assert sum(kept) == 100
+    # children of the prefix too, but not other loggers or higher levels
+    assert sum(sampling_filter.filter(_record(name='noisy.sub')) for _ in range(10)) == 1
+    assert all(sampling_filter.filter(_record(name='noisy2')) for _ in range(10))
+    assert all(sampling_filter.filter(_record(level=logging.INFO)) for _ in range(10))
+    assert sampling_filter.stats()[0]['dropped'] == 909
+
+
+def test_token_bucket():
+    sampling_filter = SamplingFilter([SamplingRule('', level=logging.INFO, rate=10, burst=20)], summary_interval=None)
+    # a burst of 100 at once, then one every 10ms for a second
+    kept = sum(sampling_filter.filter(_record()) for _ in range(100))
+    assert kept == 20
+    kept = sum(sampling_filter.filter(_record(created=1000.0 + idx / 100.0)) for idx in range(1, 101))
+    assert kept == 10
+    assert sampling_filter.filter(_record(level=logging.WARNING))
+
+
+def test_most_specific_rule_wins():
+    sampling_filter = SamplingFilter([SamplingRule('', level=logging.INFO, ratio=0.0),
+                                      SamplingRule('app.important', level=logging.INFO, ratio=1.0)],
+                                     summary_interval=None)
+    assert not sampling_filter.filter(_record(name='app'))
+    assert sampling_filter.filter(_record(name='app.important.db'))
+
+
+def test_summary_records():
+    handler = ListHandler()
+    summary_logger = logging.getLogger('color_debug.test_filters.summary')
+    summary_logger.addHandler(handler)
+    summary_logger.setLevel(logging.INFO)
+    summary_logger.propagate = False
+    try:
+        sampling_filter = SamplingFilter([SamplingRule('', level=logging.DEBUG, ratio=0.5)],
+                                         summary_interval=10, summary_logger=summary_logger)
+        # summary records go through the same filter, and are never dropped
+        handler.addFilter(sampling_filter)
+        for idx in range(100):
+            sampling_filter.filter(_record(created=1000.0 + idx * 0.1))
+        assert not handler.records
+        sampling_filter.filter(_record(created=1010.5))
+    finally:
+        summary_logger.removeHandler(handler)
+
+    assert len(handler.records) == 1
+    summary = handler.records[0]
+    assert summary.sampling_summary
+    assert summary.sampled_out == 50
+    assert summary.getMessage().startswith("sampled out 50 of 100 records from 'all loggers' (DEBUG and below)")
+
+
+def test_summary_after_traffic_stops():
+    handler = ListHandler()
+    summary_logger = logging.getLogger('color_debug.test_filters.summary')
+    summary_logger.addHandler(handler)
+    summary_logger.setLevel(logging.INFO)
+    summary_logger.propagate = False
+    try:
+        sampling_filter = SamplingFilter([SamplingRule('', level=logging.DEBUG, ratio=0.5)],
+                                         summary_interval=10, summary_logger=summary_logger)
+        for idx in range(10):
+            sampling_filter.filter(_record(created=time.time()))
+        # no later record arrives, the exit hook reports the drops
+        assert not handler.records
+        filters._flush_sampling_filters()
+        assert [record.sampled_out for record in handler.records] == [5]
+        sampling_filter.close()
+        assert sampling_filter not in filters._sampling_filters
+    finally:
+        summary_logger.removeHandler(handler)
+    # nothing was dropped since
+    assert len(handler.records) == 1
+
+
+def test_bad_rules():
+    with pytest.raises(ValueError):
+        SamplingRule(ratio=2)
+    with pytest.raises(ValueError):
+        SamplingRule(rate=0)
+    with pytest.raises(ValueError):
+        SamplingRule(rate=10, burst=0.5)
+
+
+def test_token_bucket_slow_rate():
+    # less than one record a second still needs room for one record in the bucket
+    sampling_filter = SamplingFilter([SamplingRule('', level=logging.INFO, rate=0.5)], summary_interval=None)
+    kept = sum(sampling_filter.filter(_record(created=1000.0 + idx * 10)) for idx in range(100))
+    assert kept == 100
+    kept = sum(sampling_filter.filter(_record(created=2000.0 + idx * 0.1)) for idx in range(100))
+    assert kept == 5
@@ -0,0 +1,137 @@
+import logging
+import re
+
+import pytest
+
+from color_debug import color_debug
+from color_debug.formats import FormatField, literal_text, parse_format_string
+
+
+def test_parse_fields():
+    parsed = parse_format_string('%(asctime)-15s %(levelname)-0.1s pid=%(process)5d %(relativeCreated)+10.2f')
+    assert parsed.valid
+    assert [field.attr_name for field in parsed.fields] == ['asctime', 'levelname', 'process', 'relativeCreated']
+    asctime, levelname, process, relative = parsed.fields
+    assert asctime == FormatField(text='%(asctime)-15s', attr_name='asctime', spec='-15s', flags='-', width=15,
+                                  precision=None, conversion='s')
+    # '0' is a flag, not a width
+    assert (levelname.flags, levelname.width, levelname.precision) == ('-0', None, 1)
+    assert (process.flags, process.width, process.conversion) == ('', 5, 'd')
+    assert (relative.flags, relative.width, relative.precision, relative.conversion) == ('+', 10, 2, 'f')
+    assert parsed.tokens[1] == ' '
+    assert parsed.tokens[3] == ' pid='
+
+
+@pytest.mark.parametrize('conversion', list('diouxXeEfFgGcrsa'))
+def test_parse_conversions(conversion):
+    parsed = parse_format_string('<%(value)#08.3l' + conversion + '>')
+    assert parsed.valid
+    field, = parsed.fields
+    assert (field.flags, field.width, field.precision, field.conversion) == ('#0', 8, 3, conversion)
+    assert parsed.tokens == ('<', field, '>')
+
+
+def test_parse_literal_percent():
+    parsed = parse_format_string('100%% of %(name)s%%')
+    assert parsed.valid
+    assert parsed.tokens == ('100%% of ', parsed.fields[0], '%%')
+    assert literal_text(parsed.tokens[0]) == '100% of '
+
+
+def test_parse_nested_parens():
+    parsed = parse_format_string('%((a)b)s %(c)s')
+    assert [field.attr_name for field in parsed.fields] == ['(a)b', 'c']
+    assert parsed.fields[0].text == '%((a)b)s'
+
+
+@pytest.mark.parametrize('fmt', ['%(name)s %q', '50% %(name)s', '%(name)', '%(name', '%(name)5.2'])
+def test_parse_invalid(fmt):
+    parsed = parse_format_string(fmt)
+    assert not parsed.valid
+    # the stray '%' stays in a literal, so rebuilding the format gives back the original
+    assert ''.join(token if isinstance(token, str) else token.text for token in parsed.tokens) == fmt
+
+
+def test_parse_cached():
+    fmt = '%(name)s: %(message)s'
+    assert parse_format_string(fmt) is parse_format_string(fmt)
+    assert color_debug.compile_format_string(fmt) is color_debug.compile_format_string(fmt)
+
+
+def test_context_color_format_string():
+    fmt = '100%% %(process)-5d %(name)s'
+    assert color_debug.context_color_format_string(fmt, None) == \
+        '%(_cdl_default)s100%% %(_cdl_process)s%(process)-5d%(_cdl_unset)s %(_cdl_name)s%(name)s%(_cdl_unset)s%(_cdl_reset)s'
+    # only the format_attrs given
+    assert color_debug.context_color_format_string(fmt, [('%(name)s', 'name')]) == \
+        '%(_cdl_default)s100%% %(process)-5d %(_cdl_name)s%(name)s%(_cdl_unset)s%(_cdl_reset)s'
+
+
+def test_formatter_literal_percent():
+    formatter = color_debug.ColorFormatter(fmt='100%% %(levelname)s %(levelno)x %(message)s', use_color=False)
+    record = logging.makeLogRecord({'msg': 'hi', 'levelname': 'INFO', 'levelno': 26})
+    assert formatter.format(record) == '100% INFO 1a hi'
+
+
+def test_parse_brace():
+    parsed = parse_format_string('{{literal}} {levelname:<8} {name!r} {args[0]} {relativeCreated:10.2f}', style='{')
+    assert parsed.valid
+    levelname, name, args, relative = parsed.fields
+    assert parsed.tokens[0] == '{{literal}} '
+    assert (levelname.text, levelname.spec, levelname.flags, levelname.width) == ('{levelname:<8}', ':<8', '<', 8)
+    assert (name.spec, name.conversion) == ('!r', 'r')
+    assert (args.attr_name, args.spec) == ('args', '[0]')
+    assert (relative.width, relative.precision, relative.conversion) == (10, 2, 'f')
+    for fmt in ['{0} {name}', '{}', '{name:{width}}', '{name', 'name}']:
+        assert not parse_format_string(fmt, style='{').valid
+
+
+def test_parse_dollar():
+    parsed = parse_format_string('$$5 $levelname ${name}s', style='$')
+    assert parsed.valid
+    assert [field.text for field in parsed.fields] == ['$levelname', '${name}']
+    assert parsed.tokens[0] == '$$5 '
+    assert literal_text(parsed.tokens[0], style='$') == '$5 '
+    assert not parse_format_string('$ $name', style='$').valid
+
+
+def test_parse_bad_style():
+    with pytest.raises(ValueError):
+        parse_format_string('%(name)s', style='#')
+
+
+@pytest.mark.parametrize('fmt,style', [('{asctime} {levelname:<8} {name!r}: {message} 100%', '{'),
+                                       ('{{literal}} {levelno:03d} {relativeCreated:>12.3f} {args[0]}', '{'),
+                                       ('$asctime ${levelname}: $message 100%% $$5', '$')])
+def test_compile_styles_match_logging_formatter(fmt, style):
+    render = color_debug.compile_format_string(fmt, style)
+    record = logging.makeLogRecord({'name': 'foo.bar', 'msg': 'some %s', 'args': ('msg',), 'levelno': 10,
+                                    'levelname': 'DEBUG'})
+    expected = logging.Formatter(fmt, style=style).format(record)
+    assert render(record.__dict__) == expected
+
+
+def test_compile_styles_invalid():
+    # same errors as str.format_map() and string.Template
+    with pytest.raises(ValueError):
+        color_debug.compile_format_string('{0} {message}', '{')({'message': 'hi'})
+    with pytest.raises(ValueError):
+        color_debug.compile_format_string('$ $message', '$')({'message': 'hi'})
+
+
+@pytest.mark.parametrize('mutate_record', [True, False])
+@pytest.mark.parametrize('fmt,style', [('{levelname:<8} {name}: {message}', '{'),
+                                       ('$levelname ${name}: $message', '$')])
+def test_formatter_styles(fmt, style, mutate_record):
+    formatter = color_debug.ColorFormatter(fmt=fmt, style=style, default_color_by_attr='name',
+                                           mutate_record=mutate_record)
+    assert formatter.color_fmt.startswith(placeholder_text(style, '_cdl_default'))
+    record = logging.makeLogRecord({'name': 'foo.bar', 'msg': 'hello', 'levelname': 'INFO'})
+    formatted = formatter.format(record)
+    assert '\033[' in formatted
+    assert re.sub('\033\\[[0-9;]*m', '', formatted) == logging.Formatter(fmt, style=style).format(record)
+    assert formatter.format_plain(record) == logging.Formatter(fmt, style=style).format(record)
+
+
+def placeholder_text(style, attr_name):
+    return {'{': '{%s}', '$': '${%s}'}[style] % attr_name
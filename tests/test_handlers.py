@@ -0,0 +1,333 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `color_debug.handlers`."""
+
+import io
+import logging
+import sys
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import pytest
+
+from color_debug import color_debug
+from color_debug import handlers
+
+from .test_color_debug import make_record
+
+
+def test_snapshot_record():
+    args = ['mutable']
+    record = make_record(msg='foo %s', args=(args,))
+    snapshot = handlers.snapshot_record(record)
+    args.append('changed later')
+    assert snapshot.getMessage() == "foo ['mutable']"
+    assert snapshot.args is None
+    assert snapshot.thread == record.thread
+    assert snapshot is not record
+
+
+def test_snapshot_record_fields():
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        record = make_record(exc_info=sys.exc_info(), request_id='abc', big_object=object())
+    snapshot = handlers.snapshot_record(record, extra_fields=['request_id'])
+    assert snapshot.exc_info is None
+    assert 'ValueError: boom' in snapshot.exc_text
+    assert snapshot.request_id == 'abc'
+    assert not hasattr(snapshot, 'big_object')
+    # the formatter renders exc_text when there is no exc_info
+    formatted = color_debug.ColorFormatter(fmt='%(message)s', use_color=False).format(snapshot)
+    assert formatted.startswith('foo bar\nTraceback')
+
+
+def test_queue_handler_listener():
+    log_queue = queue.Queue()
+    stream = io.StringIO()
+    handler = handlers.ColorQueueHandler(log_queue)
+    listener = handlers.ColorQueueListener(log_queue, stream=stream, use_color=True,
+                                           formatter=color_debug.ColorFormatter(fmt='%(name)s %(message)s'))
+    listener.start()
+    for i in range(10):
+        handler.handle(make_record(msg='msg %d', args=(i,)))
+    listener.stop()
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == 10
+    assert 'msg 9' in lines[-1]
+    # colored
+    assert '\033[' in lines[0]
+    assert listener.handled == 10
+
+
+def test_queue_handler_drop_new():
+    log_queue = queue.Queue(maxsize=2)
+    handler = handlers.ColorQueueHandler(log_queue, overflow='drop_new')
+    for i in range(5):
+        handler.handle(make_record(msg='msg %d', args=(i,)))
+    assert handler.dropped_new == 3
+    assert handler.dropped == 3
+    assert [log_queue.get_nowait().msg for _ in range(2)] == ['msg 0', 'msg 1']
+
+
+def test_queue_handler_drop_oldest():
+    log_queue = queue.Queue(maxsize=2)
+    handler = handlers.ColorQueueHandler(log_queue, overflow='drop_oldest')
+    for i in range(5):
+        handler.handle(make_record(msg='msg %d', args=(i,)))
+    assert handler.dropped_oldest == 3
+    assert [log_queue.get_nowait().msg for _ in range(2)] == ['msg 3', 'msg 4']
+
+
+def test_queue_handler_bad_overflow():
+    with pytest.raises(ValueError):
+        handlers.ColorQueueHandler(queue.Queue(), overflow='explode')
+
+
+class CountingStream(io.StringIO):
+    def __init__(self):
+        io.StringIO.__init__(self)
+        self.write_calls = 0
+
+    def write(self, data):
+        self.write_calls += 1
+        return io.StringIO.write(self, data)
+
+
+def test_buffered_handler_coalesces_writes():
+    stream = CountingStream()
+    handler = handlers.BufferedColorStreamHandler(stream, flush_interval=None)
+    for i in range(20):
+        handler.handle(make_record(msg='msg %d', args=(i,)))
+    assert stream.write_calls == 0
+    handler.flush()
+    assert stream.write_calls == 1
+    assert len(stream.getvalue().splitlines()) == 20
+    handler.close()
+
+
+def test_buffered_handler_size_threshold():
+    stream = CountingStream()
+    handler = handlers.BufferedColorStreamHandler(stream, buffer_size=1, flush_interval=None)
+    handler.handle(make_record())
+    handler.handle(make_record())
+    assert stream.write_calls == 2
+    handler.close()
+
+
+def test_buffered_handler_level_threshold():
+    stream = CountingStream()
+    handler = handlers.BufferedColorStreamHandler(stream, flush_interval=None)
+    handler.handle(make_record(level=logging.DEBUG))
+    handler.handle(make_record(level=logging.INFO))
+    assert stream.write_calls == 0
+    handler.handle(make_record(msg='oops', args=(), level=logging.ERROR))
+    assert stream.write_calls == 1
+    assert 'oops' in stream.getvalue().splitlines()[-1]
+    handler.close()
+
+
+def test_buffered_handler_time_threshold():
+    stream = CountingStream()
+    handler = handlers.BufferedColorStreamHandler(stream, flush_interval=0.01)
+    handler.handle(make_record())
+    for _ in range(200):
+        if stream.write_calls:
+            break
+        time.sleep(0.01)
+    assert stream.write_calls == 1
+    handler.close()
+
+
+def test_buffered_handler_one_flusher_thread():
+    stream = CountingStream()
+    handler = handlers.BufferedColorStreamHandler(stream, flush_interval=0.01)
+    flushers = set()
+    for i in range(3):
+        handler.handle(make_record())
+        for _ in range(200):
+            if stream.write_calls > i:
+                break
+            time.sleep(0.01)
+        assert stream.write_calls == i + 1
+        flushers.add(handler._flusher)
+    # the same thread waits out every interval
+    flusher, = flushers
+    handler.close()
+    flusher.join(1)
+    assert not flusher.is_alive()
+
+
+def test_buffered_handler_close_flushes():
+    stream = CountingStream()
+    handler = handlers.BufferedColorStreamHandler(stream, flush_interval=None)
+    handler.handle(make_record())
+    handler.close()
+    assert stream.write_calls == 1
+
+
+def test_buffered_handler_timer_write_error():
+    class BrokenStream(io.StringIO):
+        def write(self, text):
+            raise IOError('broken pipe')
+
+    class ErrorHandler(handlers.BufferedColorStreamHandler):
+        errors = []
+
+        def handleError(self, record):
+            self.errors.append(record)
+
+    handler = ErrorHandler(BrokenStream(), flush_interval=0.01)
+    record = make_record()
+    handler.handle(record)
+    for _ in range(200):
+        if handler.errors:
+            break
+        time.sleep(0.01)
+    # goes through handleError() like any other write error, not an uncaught flusher thread exception
+    assert handler.errors == [record]
+
+
+def test_buffered_handler_flushed_at_exit():
+    before = len(handlers._buffered_handlers)
+    stream = CountingStream()
+    handler = handlers.BufferedColorStreamHandler(stream, flush_interval=None)
+    handler.handle(make_record())
+    assert len(handlers._buffered_handlers) == before + 1
+    handlers._flush_buffered_handlers()
+    assert stream.write_calls == 1
+    # closed (or collected) handlers aren't held on to
+    handler.close()
+    assert len(handlers._buffered_handlers) == before
+
+
+class TTYStream(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_color_stream_handler_not_a_tty(monkeypatch):
+    monkeypatch.delenv('NO_COLOR', raising=False)
+    monkeypatch.setenv('TERM', 'xterm-256color')
+    stream = io.StringIO()
+    handler = handlers.ColorStreamHandler(stream)
+    assert not handler.use_color
+    handler.setFormatter(color_debug.ColorFormatter(fmt='%(levelname)s %(name)s %(message)s'))
+    record = make_record()
+    handler.handle(record)
+    assert stream.getvalue() == 'INFO color_debug.test_records foo bar\n'
+    # the color mapper was never used
+    assert not hasattr(record, '_cdl_name')
+
+
+def test_color_stream_handler_tty(monkeypatch):
+    monkeypatch.delenv('NO_COLOR', raising=False)
+    monkeypatch.setenv('TERM', 'xterm-256color')
+    stream = TTYStream()
+    handler = handlers.ColorStreamHandler(stream)
+    assert handler.use_color
+    handler.handle(make_record())
+    assert '\033[' in stream.getvalue()
+
+
+def test_color_stream_handler_set_stream(monkeypatch):
+    monkeypatch.delenv('NO_COLOR', raising=False)
+    monkeypatch.setenv('TERM', 'xterm-256color')
+    handler = handlers.ColorStreamHandler(io.StringIO())
+    handler.setStream(TTYStream())
+    assert handler.use_color
+
+
+@pytest.mark.parametrize('environ,expected', [({'TERM': 'xterm'}, True),
+                                              ({'TERM': 'xterm', 'NO_COLOR': '1'}, False),
+                                              ({'TERM': 'xterm', 'NO_COLOR': ''}, True),
+                                              ({'TERM': 'dumb'}, False)])
+def test_stream_supports_color(environ, expected):
+    assert color_debug.stream_supports_color(TTYStream(), environ=environ) == expected
+    assert not color_debug.stream_supports_color(io.StringIO(), environ=environ)
+
+
+def test_color_formatter_use_color_false():
+    fmt = '%(levelname)s %(name)s %(message)s'
+    formatter = color_debug.ColorFormatter(fmt=fmt, use_color=False)
+    record = make_record()
+    assert formatter.format(record) == logging.Formatter(fmt).format(record)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def _repeat_record(created, msg='retrying %s', args=('db',), lineno=42):
+    record = make_record(msg=msg, args=args)
+    record.created = created
+    record.lineno = lineno
+    return record
+
+
+def test_duplicate_collapsing_handler():
+    target = ListHandler()
+    handler = handlers.DuplicateCollapsingHandler(target, window=10)
+    for idx in range(100):
+        handler.handle(_repeat_record(1000.0 + idx * 0.01, args=('db%d' % idx,)))
+    # a different call site is passed on
+    handler.handle(_repeat_record(1001.0, lineno=43))
+    assert len(target.records) == 2
+    assert handler.collapsed == 99
+
+    # once the window is up, the summary goes out before the next record
+    handler.handle(_repeat_record(1011.0))
+    assert len(target.records) == 4
+    summary = target.records[2]
+    assert summary.collapsed_count == 99
+    assert summary.getMessage() == 'message repeated 99 times in the last 1.0 seconds: retrying db99'
+    assert summary.lineno == 42
+    assert target.records[3].getMessage() == 'retrying db'
+
+
+def test_duplicate_collapsing_handler_flush():
+    target = ListHandler()
+    stream = io.StringIO()
+    color_handler = handlers.ColorStreamHandler(stream, use_color=True)
+    handler = handlers.DuplicateCollapsingHandler(target, window=10)
+    for idx in range(5):
+        handler.handle(_repeat_record(1000.0 + idx))
+    handler.flush()
+    assert [record.getMessage() for record in target.records] == \
+        ['retrying db', 'message repeated 4 times in the last 4.0 seconds: retrying db']
+    # summaries are colored like any other record
+    assert '\033[' in color_handler.format(target.records[1])
+
+
+def test_duplicate_collapsing_handler_bounded():
+    target = ListHandler()
+    handler = handlers.DuplicateCollapsingHandler(target, window=10, max_keys=4)
+    for lineno in range(10):
+        handler.handle(_repeat_record(1000.0, lineno=lineno))
+        handler.handle(_repeat_record(1000.0, lineno=lineno))
+    assert len(handler._repeats) == 4
+    # each call site evicted to make room got its summary
+    assert handler.summaries == 6
+
+
+def test_duplicate_collapsing_handler_timer():
+    target = ListHandler()
+    handler = handlers.DuplicateCollapsingHandler(target, window=0.05)
+    now = time.time()
+    handler.handle(_repeat_record(now))
+    handler.handle(_repeat_record(now))
+    deadline = time.time() + 5
+    while len(target.records) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert target.records[-1].collapsed_count == 1
@@ -0,0 +1,56 @@
+import logging
+
+from color_debug import color_debug
+from color_debug.hierarchy import CUBE_OFFSET, NameHierarchyColors
+
+
+def cube_rgb(color):
+    idx = color - CUBE_OFFSET
+    return (idx // 36, (idx // 6) % 6, idx % 6)
+
+
+def distance(color_a, color_b):
+    return max(abs(a - b) for a, b in zip(cube_rgb(color_a), cube_rgb(color_b)))
+
+
+def test_children_are_related():
+    hierarchy = NameHierarchyColors()
+    foo = hierarchy.get_color('foo')
+    model = hierarchy.get_color('foo.model')
+    util = hierarchy.get_color('foo.util')
+    assert 16 <= model <= 231
+    assert model != foo
+    assert distance(foo, model) <= 1
+    assert distance(foo, util) <= 1
+    # deeper names drift slowly
+    assert distance(model, hierarchy.get_color('foo.model.sql')) <= 1
+
+
+def test_colors_are_stable():
+    names = ['foo', 'foo.model', 'bar.baz.quux', 'a.b.c.d']
+    first = NameHierarchyColors()
+    colors = [first.get_color(name) for name in names]
+    # the same colors no matter the order names show up in, or which instance
+    second = NameHierarchyColors()
+    assert [second.get_color(name) for name in reversed(names)] == list(reversed(colors))
+    assert len(second) == 4
+    # and the lookup after the first is a single dict hit
+    assert second._colors['foo.model'] == colors[1]
+
+
+def test_bounded():
+    hierarchy = NameHierarchyColors(max_names=8)
+    colors = [hierarchy.get_color('pkg.mod%d' % idx) for idx in range(20)]
+    assert len(hierarchy) <= 8
+    assert hierarchy.get_color('pkg.mod0') == colors[0]
+
+
+def test_formatter_hierarchical_names():
+    formatter = color_debug.ColorFormatter(fmt='%(name)s %(message)s', default_color_by_attr='name',
+                                           color_groups=[('name', ['message'])], hierarchical_names=True)
+    assert formatter.color_mapper._plan.hierarchy_color_attrs == (('name', '_cdl_name'),)
+    record = logging.makeLogRecord({'name': 'foo.model', 'msg': 'hi'})
+    formatted = formatter.format(record)
+    color = formatter.color_mapper.name_hierarchy.get_color('foo.model')
+    assert '\033[38;5;%dmfoo.model' % color in formatted
+    assert formatter.get_stats()['caches']['name_hierarchy']['size'] == 1
@@ -0,0 +1,105 @@
+import gc
+import io
+import json
+import logging
+import sys
+import threading
+
+from color_debug import color_debug
+from color_debug.instrumentation import FormatterStats, StatsDumper
+
+
+def _records(count, exc_info=None):
+    return [logging.makeLogRecord({'name': 'inst.%d' % (i % 3), 'msg': 'msg %d', 'args': (i,),
+                                   'exc_info': exc_info, 'created': 1500000000.0 + i})
+            for i in range(count)]
+
+
+def _exc_info():
+    try:
+        raise ValueError('boom')
+    except ValueError:
+        return sys.exc_info()
+
+
+def test_instrumented_output_unchanged():
+    for mutate_record in (True, False):
+        plain = color_debug.ColorFormatter(mutate_record=mutate_record)
+        instrumented = color_debug.ColorFormatter(mutate_record=mutate_record, instrument=True)
+        for record in _records(5) + _records(2, exc_info=_exc_info()):
+            assert instrumented.format(logging.makeLogRecord(dict(record.__dict__))) == \
+                plain.format(logging.makeLogRecord(dict(record.__dict__)))
+
+
+def test_get_stats():
+    formatter = color_debug.ColorFormatter(instrument=FormatterStats(sample_every=2))
+    output = [formatter.format(record) for record in _records(10) + _records(2, exc_info=_exc_info())]
+
+    stats = formatter.get_stats()
+    assert stats['instrumented']
+    assert stats['records'] == 12
+    assert stats['output_chars'] == sum(len(line) for line in output)
+    phases = stats['phases']
+    for phase in ('pre_format', 'get_colors', 'apply_colors', 'interpolate', 'format'):
+        assert phases[phase]['count'] == 12, phase
+        assert phases[phase]['samples'] == 6
+        assert phases[phase]['p50_us'] <= phases[phase]['max_us']
+    # once per record with exc_info
+    assert phases['exception']['count'] == 2
+    assert phases['format']['share'] == 1.0
+    assert sum(phases[phase]['share'] for phase in phases if phase != 'format') <= 1.0
+    assert 0 < phases['get_colors']['share'] < 1
+    assert 0 <= stats['caches']['name_color']['hit_rate'] <= 1
+    assert stats['caches']['exc_text']['hits'] == 1
+
+
+def test_get_stats_not_instrumented():
+    formatter = color_debug.ColorFormatter(default_color_by_attr='name')
+    formatter.format(_records(1)[0])
+    stats = formatter.get_stats()
+    assert not stats['instrumented']
+    assert 'phases' not in stats
+    assert stats['caches']['name_color']['misses'] == 1
+
+
+def test_stats_counted_per_thread():
+    formatter = color_debug.ColorFormatter(instrument=True)
+    threads = [threading.Thread(target=lambda: [formatter.format(record) for record in _records(50)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert formatter.get_stats()['records'] == 200
+    formatter.stats.reset()
+    assert formatter.get_stats()['records'] == 0
+
+
+def test_stats_of_exited_threads():
+    formatter = color_debug.ColorFormatter(instrument=True)
+    record = _records(1)[0]
+    for _ in range(200):
+        thread = threading.Thread(target=formatter.format, args=(record,))
+        thread.start()
+        thread.join()
+    gc.collect()
+    # exited threads are folded into one total instead of kept around
+    assert len(formatter.stats._thread_counters._registered()) <= 1
+    assert formatter.get_stats()['records'] == 200
+    assert formatter.get_stats()['phases']['get_colors']['count'] == 200
+
+
+def test_stats_dumper():
+    formatter = color_debug.ColorFormatter(instrument=True)
+    formatter.format(_records(1)[0])
+    stream = io.StringIO()
+    dumper = StatsDumper(formatter, interval=0.01, stream=stream)
+    dumper.start()
+    dumper.stop()
+    lines = stream.getvalue().splitlines()
+    assert lines
+    assert json.loads(lines[-1])['records'] == 1
+
+    dumped = []
+    StatsDumper(formatter, callback=dumped.append).dump()
+    assert dumped[0]['records'] == 1
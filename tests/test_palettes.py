@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `color_debug.palettes`."""
+
+import logging
+
+import pytest
+
+from color_debug import color_debug
+from color_debug import palettes
+
+from .test_color_debug import make_record
+
+
+def test_ansi256_matches_all_colors():
+    escapes = palettes.get_palette('256').escapes
+    for color_idx, color_seq in color_debug.TermColorMapper.ALL_COLORS.items():
+        assert escapes[color_idx] == color_seq
+
+
+@pytest.mark.parametrize('name', sorted(palettes.PALETTES))
+def test_palette_escapes(name):
+    palette = palettes.get_palette(name)
+    assert len(palette.escapes) == palettes.NUMBER_OF_COLOR_IDS
+    assert palette.escapes[palettes.DEFAULT_COLOR_IDX] == palette.escapes[palettes.DEFAULT_COLOR]
+    # built once
+    assert palettes.get_palette(name) is palette
+
+
+def test_truecolor():
+    palette = palettes.get_palette('truecolor')
+    assert palette.escapes[196] == '\033[38;2;255;0;0m'
+    assert palette.escapes[232] == '\033[38;2;8;8;8m'
+
+
+def test_ansi16_nearest():
+    palette = palettes.get_palette('16')
+    assert palette.escapes[196] == '\033[91m'
+    assert palette.escapes[1] == '\033[31m'
+
+
+def test_no_color_palette_output():
+    fmt = '%(levelname)s %(name)s %(message)s'
+    formatter = color_debug.ColorFormatter(fmt=fmt, palette='none', auto_color=True)
+    record = make_record()
+    assert formatter.format(record) == logging.Formatter(fmt).format(record)
+
+
+@pytest.mark.parametrize('environ,expected', [({'TERM': 'xterm-256color'}, '256'),
+                                              ({'TERM': 'xterm-256color', 'COLORTERM': 'truecolor'}, 'truecolor'),
+                                              ({'TERM': 'xterm'}, '16'),
+                                              ({'TERM': 'dumb'}, 'none'),
+                                              ({'TERM': 'xterm', 'NO_COLOR': '1'}, 'none')])
+def test_detect_palette_name(environ, expected):
+    assert palettes.detect_palette_name(environ) == expected
+
+
+def test_get_palette_auto():
+    assert palettes.get_palette('auto') is palettes.get_palette(palettes.detect_palette_name())
+
+
+def test_get_palette_unknown():
+    with pytest.raises(ValueError):
+        palettes.get_palette('sepia')
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `color_debug.registry`."""
+
+import logging
+import multiprocessing
+
+import pytest
+
+registry = pytest.importorskip('color_debug.registry')
+
+from color_debug import color_debug  # noqa: E402
+
+
+@pytest.fixture
+def registry_path(tmpdir):
+    return str(tmpdir.join('colors.registry'))
+
+
+def test_distinct_colors(registry_path):
+    color_registry = registry.SharedColorRegistry(registry_path, colors=range(20, 30))
+    colors = [color_registry.get_color('name', 'logger.%d' % i) for i in range(10)]
+    assert sorted(colors) == list(range(20, 30))
+    # same name, same color
+    assert color_registry.get_color('name', 'logger.3') == colors[3]
+    assert color_registry.lookup('name', 'logger.3') == colors[3]
+    assert color_registry.lookup('name', 'not.seen') is None
+    # kinds are separate namespaces
+    assert color_registry.get_color('threadName', 'logger.0') == 20
+    assert len(color_registry) == 11
+    color_registry.close()
+
+
+def test_shared_between_instances(registry_path):
+    first = registry.SharedColorRegistry(registry_path, colors=range(100))
+    second = registry.SharedColorRegistry(registry_path, colors=range(100))
+    assert first.get_color('name', 'a') == 0
+    assert second.lookup('name', 'a') == 0
+    assert second.get_color('name', 'b') == 1
+    assert first.get_color('name', 'b') == 1
+
+
+def test_full(registry_path):
+    color_registry = registry.SharedColorRegistry(registry_path, colors=range(10), slots=4)
+    for i in range(4):
+        color_registry.get_color('name', str(i))
+    with pytest.raises(registry.RegistryFull):
+        color_registry.get_color('name', 'one too many')
+
+
+def test_not_a_registry(tmpdir):
+    path = tmpdir.join('not_a_registry')
+    path.write('some other file contents')
+    with pytest.raises(ValueError):
+        registry.SharedColorRegistry(str(path), colors=range(10))
+
+
+def _assign_colors(path, names, results):
+    color_registry = color_debug.TermColorMapper.create_color_registry(path)
+    results.put(dict((name, color_registry.get_color('name', name)) for name in names))
+
+
+def test_multiprocess_agreement(registry_path):
+    names = ['logger.%d' % i for i in range(50)]
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_assign_colors, args=(registry_path, names[i:] + names[:i], results))
+               for i in range(0, 50, 10)]
+    for worker in workers:
+        worker.start()
+    assignments = [results.get(timeout=30) for _ in workers]
+    for worker in workers:
+        worker.join()
+    for assignment in assignments[1:]:
+        assert assignment == assignments[0]
+    # the first NUMBER_OF_THREAD_COLORS names all get different colors
+    assert len(set(assignments[0].values())) == 50
+
+
+def test_mapper_uses_registry(registry_path):
+    color_registry = color_debug.TermColorMapper.create_color_registry(registry_path)
+    formatter = color_debug.ColorFormatter(fmt='%(threadName)s %(name)s %(message)s',
+                                           default_color_by_attr='name',
+                                           color_groups=[('name', ['message']), ('threadName', ['thread'])],
+                                           color_registry=color_registry)
+    logger = logging.getLogger('color_debug.test_registry')
+    record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'msg', (), None)
+    record.threadName = 'T1'
+    formatter.format(record)
+    name_color = color_registry.lookup('name', 'color_debug.test_registry')
+    assert name_color is not None
+    assert record._cdl_name == formatter.color_mapper.palette.escapes[name_color]
+    assert record._cdl_message == record._cdl_name
+    assert color_registry.lookup('threadName', 'T1') is not None
+
+
+def test_mapper_registry_full(registry_path):
+    color_registry = color_debug.TermColorMapper.create_color_registry(registry_path, slots=4)
+    formatter = color_debug.ColorFormatter(fmt='%(name)s %(message)s', default_color_by_attr='name',
+                                           color_registry=color_registry)
+    for idx in range(6):
+        logger = logging.getLogger('color_debug.test_registry.full%d' % idx)
+        record = logger.makeRecord(logger.name, logging.INFO, __file__, 1, 'msg', (), None)
+        assert logger.name in formatter.format(record)
+    assert len(color_registry) == 4
+    # names past the end of the registry fall back to hashed colors
+    mapper = formatter.color_mapper
+    assert mapper.get_registry_color('name', 'color_debug.test_registry.full5') == \
+        mapper.get_name_color('color_debug.test_registry.full5')
@@ -0,0 +1,123 @@
+import logging
+import re
+import sys
+import traceback
+
+from color_debug import color_debug
+from color_debug.tracebacks import TracebackColorizer
+
+ESCAPE_RE = re.compile('\033\\[[0-9;]*m')
+
+
+def plain(text):
+    return ESCAPE_RE.sub('', text)
+
+
+def stdlib_exc_text(exc_info):
+    return logging.Formatter().formatException(exc_info)
+
+
+def _raise(depth=0):
+    if depth:
+        return _raise(depth - 1)
+    raise ValueError('bad value')
+
+
+def _exc_info(func, *args):
+    try:
+        func(*args)
+    except Exception:
+        return sys.exc_info()
+
+
+def _subscript(data):
+    # py3.11+ underlines the failing part of the expression
+    return len(data) + data['a']['b']
+
+
+def _chained():
+    try:
+        _raise()
+    except ValueError as exc:
+        # 'raise ... from exc', without the py3 only syntax
+        key_error = KeyError('missing')
+        key_error.__cause__ = exc
+        raise key_error
+
+
+def make_colorizer():
+    return TracebackColorizer(color_debug.TermColorMapper())
+
+
+def test_format_exception_matches_traceback():
+    colorizer = make_colorizer()
+    for exc_info in [_exc_info(_raise), _exc_info(_chained), _exc_info(_raise, 30)]:
+        colored = colorizer.format_exception(exc_info, '')
+        assert '\033[' in colored
+        assert plain(colored) == stdlib_exc_text(exc_info)
+
+
+def test_format_exception_keeps_position_markers():
+    colorizer = make_colorizer()
+    exc_info = _exc_info(_subscript, {'a': {}})
+    stdlib = stdlib_exc_text(exc_info)
+    if sys.version_info >= (3, 11):
+        assert '^^^' in stdlib
+    assert plain(colorizer.format_exception(exc_info, '')) == stdlib
+    # cached by the failing instruction, not just the line
+    assert plain(colorizer.format_exception(_exc_info(_subscript, {}), '')) == \
+        stdlib_exc_text(_exc_info(_subscript, {}))
+
+
+def test_format_exception_colors_frames():
+    colorizer = make_colorizer()
+    mapper = colorizer.color_mapper
+    colored = colorizer.format_exception(_exc_info(_raise), '<exc>')
+    filename_color = mapper.palette.escapes[mapper.get_name_color(__file__)]
+    name_color = mapper.palette.escapes[mapper.get_name_color('_raise')]
+    assert 'File "%s%s<exc>"' % (filename_color, __file__) in colored
+    assert "in %s_raise<exc>\n    %sraise ValueError('bad value')<exc>" % (name_color, name_color) in colored
+
+
+def test_frame_cache():
+    colorizer = make_colorizer()
+    colorizer.format_exception(_exc_info(_raise, 5), '')
+    misses = colorizer.frame_cache.misses
+    colorizer.format_exception(_exc_info(_raise, 5), '')
+    assert colorizer.frame_cache.misses == misses
+    assert colorizer.frame_cache.hits >= 3
+
+
+def test_colorize_text():
+    colorizer = make_colorizer()
+    stack_info = 'Stack (most recent call last):\n' + ''.join(traceback.format_stack()).rstrip('\n')
+    colored = colorizer.colorize_text(stack_info, '')
+    assert '\033[' in colored
+    assert plain(colored) == stack_info
+    colorizer.colorize_text(stack_info, '')
+    assert colorizer.frame_cache.hits > 0
+
+
+def _format(formatter, **record_attrs):
+    record = logging.makeLogRecord(dict({'name': 'tb', 'msg': 'failed'}, **record_attrs))
+    return formatter.format(record)
+
+
+def test_formatter_color_frames():
+    exc_info = _exc_info(_chained)
+    for mutate_record in (True, False):
+        formatter = color_debug.ColorFormatter(fmt='%(message)s', color_frames=True, mutate_record=mutate_record)
+        assert plain(_format(formatter, exc_info=exc_info)) == 'failed\n%s\n' % stdlib_exc_text(exc_info)
+        # records from a ColorCollector only have the text
+        exc_text = logging.Formatter().formatException(exc_info)
+        assert plain(_format(formatter, exc_text=exc_text)) == 'failed\n%s\n' % exc_text
+
+
+def test_formatter_stack_info():
+    stack_info = 'Stack (most recent call last):\n' + ''.join(traceback.format_stack()).rstrip('\n')
+    for color_frames in (False, True):
+        formatter = color_debug.ColorFormatter(fmt='%(message)s', color_frames=color_frames)
+        assert plain(_format(formatter, stack_info=stack_info)) == 'failed\n%s' % stack_info
+        exc_info = _exc_info(_raise)
+        formatted = plain(_format(formatter, stack_info=stack_info, exc_info=exc_info))
+        assert formatted.endswith('ValueError: bad value\n%s' % stack_info)